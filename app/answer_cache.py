@@ -0,0 +1,138 @@
+# app/answer_cache.py
+import re
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+from .dedup import code_tokens
+
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def normalize_question(question):
+    """全半角统一、去掉多余空白和句末标点，作为精确匹配的键"""
+    text = unicodedata.normalize("NFKC", question).strip().lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip("?？!！.。 ")
+
+
+class AnswerCache:
+    """
+    持久化的问答缓存
+    先按规范化后的问题精确匹配；配置了相似度阈值时再按问题向量的余弦相似度匹配，
+    语义匹配只接受数字和编号(条款号、标准号)完全相同的问题: "第3.2.1条" 与 "第3.2.2条" 的向量几乎一样
+    条目带有索引版本号，索引重建后旧答案全部失效；超出容量按最近使用时间淘汰
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, similarity_threshold=None, embeddings=None):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embeddings = embeddings if similarity_threshold else None
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 当前版本条目的问题向量，用于语义匹配
+        self._keys = []
+        self._codes = []
+        self._matrix = None
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL,"
+            " embedding BLOB, generation TEXT NOT NULL, last_used REAL NOT NULL, sources TEXT)"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(answers)")]
+        if "sources" not in columns:
+            self.conn.execute("ALTER TABLE answers ADD COLUMN sources TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers(last_used)")
+        self.conn.commit()
+
+    def set_generation(self, generation):
+        """切换到新的索引版本，删除其他版本的全部条目"""
+        with self._lock:
+            self.generation = str(generation)
+            self.conn.execute("DELETE FROM answers WHERE generation != ?", (self.generation,))
+            self.conn.commit()
+            self._reload_vectors()
+
+    def _reload_vectors(self):
+        self._keys, self._codes, vectors = [], [], []
+        if self.embeddings is not None:
+            rows = self.conn.execute("SELECT key, question, embedding FROM answers WHERE embedding IS NOT NULL")
+            for key, question, blob in rows:
+                self._keys.append(key)
+                self._codes.append(code_tokens(question))
+                vectors.append(np.frombuffer(blob, dtype=np.float32))
+        self._matrix = np.vstack(vectors) if vectors else None
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get(self, question):
+        entry = self.lookup(question)
+        return entry[0] if entry is not None else None
+
+    def lookup(self, question):
+        """返回 (答案, 出处列表)，未命中时返回None"""
+        if self.generation is None:
+            return None
+        key = normalize_question(question)
+        with self._lock:
+            row = self.conn.execute("SELECT answer, sources FROM answers WHERE key=?", (key,)).fetchone()
+            if row is None and self._matrix is not None:
+                query = self._unit(self.embeddings.embed_query(question))
+                scores = self._matrix @ query
+                codes = code_tokens(question)
+                for best in np.argsort(-scores):
+                    if scores[best] < self.similarity_threshold:
+                        break
+                    if self._codes[best] == codes:
+                        key = self._keys[best]
+                        row = self.conn.execute("SELECT answer, sources FROM answers WHERE key=?", (key,)).fetchone()
+                        break
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE answers SET last_used=? WHERE key=?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0], json.loads(row[1]) if row[1] else []
+
+    def put(self, question, answer, sources=None):
+        if self.generation is None or not answer.strip():
+            return
+        key = normalize_question(question)
+        embedding = None
+        if self.embeddings is not None:
+            embedding = self._unit(self.embeddings.embed_query(question)).tobytes()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers (key, question, answer, embedding, generation, last_used, sources)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, question, answer, embedding, self.generation, time.time(),
+                 json.dumps(sources, ensure_ascii=False) if sources else None),
+            )
+            count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM answers WHERE key IN "
+                    "(SELECT key FROM answers ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self.conn.commit()
+            self._reload_vectors()
+
+    def close(self):
+        self.conn.close()
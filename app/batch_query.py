@@ -0,0 +1,197 @@
+# app/batch_query.py
+import json
+import math
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import LLM_QUANTIZATION, RETRIEVAL_K
+from .generation import build_prompt, document_sources, format_passages, generate_batch
+
+
+def read_questions(path):
+    """读取JSONL问题集，每行 {"id": ..., "question": ...}，缺少id时使用行号"""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            question = str(record.get("question", "")).strip()
+            if not question:
+                print(f"第{line_no}行缺少question，已跳过")
+                continue
+            items.append({"id": record.get("id", line_no), "question": question})
+    return items
+
+
+def percentile(values, pct):
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class BatchQueryRunner:
+    """
+    无界面批量问答:
+    1. 按批次一次性计算问题向量并批量查询索引，结果预先写入检索缓存
+    2. 逐题组装上下文和提示词
+    3. 提示词按 batch_size 分批批量生成，concurrency 个线程处理各批次
+    生成管道和模型不是线程安全的，各线程共用一个模型，生成时用锁串行
+    qa 为 None 时只做检索，答案为检索到的原文片段
+    """
+
+    def __init__(self, retriever, qa=None, batch_size=8, concurrency=1, max_new_tokens=None):
+        self.retriever = retriever
+        self.qa = qa
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_new_tokens = max_new_tokens
+        self.model_lock = threading.Lock()
+
+    def retrieve(self, items, progress_callback=None):
+        """批量检索，返回每题的 (片段列表, 检索耗时ms)"""
+        context_retriever = self.qa.retriever if self.qa is not None else self.retriever
+        results = []
+        for batch in _chunks(items, self.batch_size):
+            start = time.perf_counter()
+            self.retriever.prefetch([item["question"] for item in batch])
+            # 批量检索的耗时平摊到批内每个问题
+            shared = (time.perf_counter() - start) / len(batch)
+            for item in batch:
+                start = time.perf_counter()
+                docs = context_retriever.invoke(item["question"])
+                results.append((docs, (shared + time.perf_counter() - start) * 1000))
+            if progress_callback:
+                progress_callback("retrieval", len(results), len(items))
+        return results
+
+    def generate_batch(self, prompts):
+        """返回每个提示词的 (答案, 生成耗时ms)；耗时为该行从开始生成到生成结束，不含等锁时间"""
+        pipe = self.qa.combine_documents_chain.llm_chain.llm.pipeline
+        kwargs = {"max_new_tokens": self.max_new_tokens} if self.max_new_tokens else None
+        with self.model_lock:
+            results = generate_batch(pipe, prompts, kwargs)
+        return [(result["text"], result["ms"]) for result in results]
+
+    def run(self, items, progress_callback=None):
+        wall_start = time.perf_counter()
+        retrieved = self.retrieve(items, progress_callback)
+        results = [
+            {"id": item["id"], "question": item["question"], "sources": document_sources(docs),
+             "retrieval_ms": round(retrieval_ms, 1)}
+            for item, (docs, retrieval_ms) in zip(items, retrieved)
+        ]
+
+        if self.qa is None:
+            for result, (docs, _) in zip(results, retrieved):
+                result.update(answer=format_passages(docs), generation_ms=0.0)
+        else:
+            prompts = [
+                build_prompt(self.qa, item["question"], docs)
+                for item, (docs, _) in zip(items, retrieved)
+            ]
+            batches = _chunks(list(range(len(items))), self.batch_size)
+            done = 0
+
+            def generate(indices):
+                try:
+                    answers = self.generate_batch([prompts[i] for i in indices])
+                    for i, (answer, elapsed) in zip(indices, answers):
+                        results[i].update(answer=answer, generation_ms=elapsed)
+                except Exception as e:
+                    for i in indices:
+                        results[i].update(answer="", generation_ms=0.0, error=str(e))
+                return len(indices)
+
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for count in executor.map(generate, batches):
+                    done += count
+                    if progress_callback:
+                        progress_callback("generation", done, len(items))
+
+        for result in results:
+            result["latency_ms"] = round(result["retrieval_ms"] + result["generation_ms"], 1)
+        self.wall_seconds = time.perf_counter() - wall_start
+        return results
+
+
+def summarize(results, wall_seconds):
+    succeeded = [r for r in results if "error" not in r]
+    latencies = [r["latency_ms"] for r in succeeded]
+    return {
+        "questions": len(results),
+        "failed": len(results) - len(succeeded),
+        "wall_seconds": round(wall_seconds, 2),
+        "questions_per_second": round(len(succeeded) / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 50), 1),
+        "latency_p95_ms": round(percentile(latencies, 95), 1),
+        "retrieval_p50_ms": round(percentile([r["retrieval_ms"] for r in succeeded], 50), 1),
+        "generation_p50_ms": round(percentile([r["generation_ms"] for r in succeeded], 50), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面批量问答: 从JSONL读取问题，答案和耗时写入JSONL")
+    parser.add_argument("--input", required=True, help="问题文件，每行 {\"id\": ..., \"question\": ...}")
+    parser.add_argument("--output", required=True, help="答案输出文件(JSONL)")
+    parser.add_argument("--batch-size", type=int, default=8, help="每批检索和生成的问题数")
+    parser.add_argument("--concurrency", type=int, default=1, help="处理批次的线程数(共用一个模型，生成时串行)")
+    parser.add_argument("--k", type=int, default=RETRIEVAL_K, help="每个问题检索的片段数")
+    parser.add_argument("--max-new-tokens", type=int, help="每个答案最多生成的token数")
+    parser.add_argument("--quantization", default=LLM_QUANTIZATION, choices=["none", "int8", "int4"])
+    parser.add_argument("--retrieval-only", action="store_true", help="不加载大模型，只输出检索片段")
+    parser.add_argument("--summary", help="汇总结果另存为JSON文件")
+    args = parser.parse_args(argv)
+
+    from .model_loading import StageTimer
+    from .rag_pipeline import load_components
+
+    items = read_questions(args.input)
+    if not items:
+        print("问题文件为空")
+        return 1
+
+    timer = StageTimer(lambda name, elapsed: print(f"加载 {name}: {elapsed:.2f}s"))
+    try:
+        _, _, retriever, qa = load_components(
+            not args.retrieval_only, args.k, args.quantization, timer
+        )
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    if qa is not None:
+        qa.retriever.builder.log = False
+
+    def report(stage, done, total):
+        print(f"{'检索' if stage == 'retrieval' else '生成'}: {done}/{total}")
+
+    runner = BatchQueryRunner(retriever, qa, args.batch_size, args.concurrency, args.max_new_tokens)
+    results = runner.run(items, report)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    summary = summarize(results, runner.wall_seconds)
+    print(f"\n问题数: {summary['questions']}  失败: {summary['failed']}  "
+          f"总耗时: {summary['wall_seconds']}s  吞吐: {summary['questions_per_second']} 题/秒")
+    print(f"延迟 p50: {summary['latency_p50_ms']}ms  p95: {summary['latency_p95_ms']}ms  "
+          f"(检索 p50 {summary['retrieval_p50_ms']}ms, 生成 p50 {summary['generation_p50_ms']}ms)")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,59 @@
+# app/config.py
+import os
+from pathlib import Path
+
+# 获取应用根目录
+APP_ROOT = Path(__file__).resolve().parent.parent
+
+# 模型常量
+MODEL_PATH = str(APP_ROOT / "models" / "chatglm3-6b")
+EMBEDDING_PATH = str(APP_ROOT / "models" / "bge-small-zh")
+DOCS_DIR = str(APP_ROOT / "docs")
+VECTOR_STORE_PATH = str(APP_ROOT / "vector_store")
+EMBEDDING_CACHE_PATH = str(APP_ROOT / "data" / "embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = 2_000_000
+EMBED_BATCH_SIZE = 32
+EMBED_WORKERS = None  # None: 纯CPU时按核心数自动启用多进程
+TEXT_SPLITTER = "chinese"  # chinese: 按条款和句子切分、按嵌入模型token计数; recursive: LangChain按字符切分
+CHUNK_SIZE = 500  # 片段长度上限 (chinese 按token计，且不超过嵌入模型的最大序列长度)
+CHUNK_OVERLAP = 50
+INGEST_BATCH_SIZE = 256  # 流式入库每批片段数，加载/切分/嵌入/写入按批流转
+INGEST_QUEUE_SIZE = 4  # 各阶段之间最多积压的批数，决定构建时的峰值内存
+DEDUP_NEAR_DISTANCE = None  # 近似重复片段的SimHash距离阈值(64位，如3)；默认 None 只合并正文完全相同的片段
+INDEX_TYPE = "auto"  # auto / flat / hnsw / ivf / ivfpq
+STORE_BACKEND = "sqlite"  # sqlite: 内存映射索引 + SQLite文档库; pickle: LangChain默认格式
+STORE_COMPRESS = True
+STORE_SHARDING = "folder"  # folder: docs下每个一级子文件夹一个分片，单独重建和保存; none: 单一索引
+SHARD_SEARCH_WORKERS = 4  # 并行检索各分片的线程数
+COMPACT_TOMBSTONE_RATIO = 0.2  # 已删除片段占比超过此值时后台重建索引
+COMPACT_MAX_TOMBSTONES = 2000  # 或已删除片段数超过此值时(检索时需多取这么多条再过滤)
+LLM_WARMUP = True  # 模型加载后做一次短生成预热
+# 仅CPU生效: none(float32) / int8(动态量化) / int4(仅权重量化)
+# scripts/compare_quantization.py --synthetic 实测(单核CPU，按ChatGLM3-6B形状外推):
+#   none 权重约23.8GB、0.6 tokens/s; int8 约6.7GB、1.8~2.3 tokens/s; int4 约4.8GB、0.1 tokens/s
+# int4 每次前向都要反量化，比float32慢约6倍，只在内存装不下int8时手动开启
+LLM_QUANTIZATION = "none"
+QUANTIZED_MODEL_DIR = str(APP_ROOT / "data" / "quantized")
+ANSWER_CACHE_PATH = str(APP_ROOT / "data" / "answer_cache.sqlite")
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_SIMILARITY = None  # 问题向量余弦相似度阈值(如0.95)，默认 None 只做精确匹配；语义匹配要求问题中的数字编号相同
+RETRIEVAL_K = 4
+RETRIEVAL_CACHE_ENTRIES = 2048
+HYBRID_RETRIEVAL = True  # 向量检索 + BM25 融合
+HYBRID_ALPHA = 0.6  # 融合时向量分数的权重
+WATCH_DOCS = True  # 监视docs文件夹，新放入的文档自动追加到索引 (需要watchdog)
+WATCH_DEBOUNCE_SECONDS = 2.0  # 文件事件静默多久后开始处理
+CONTEXT_TOKEN_BUDGET = 1200  # 拼入提示词的检索上下文最多token数 (按ChatGLM tokenizer计)
+TRACE_LOG_PATH = str(APP_ROOT / "data" / "logs" / "trace.jsonl")  # 分段计时日志
+TRACE_LOG_MAX_BYTES = 5 * 2**20
+TRACE_LOG_BACKUPS = 3
+
+# 问答服务
+SERVICE_HOST = "127.0.0.1"  # 部门共享时改为 0.0.0.0
+SERVICE_PORT = 8765
+SERVICE_MAX_PENDING = 32  # 同时受理的请求上限，超出直接返回503
+SERVICE_MAX_BATCH = 4  # 合并到一次生成的最多请求数
+SERVICE_BATCH_WINDOW_MS = 30  # 凑批最长等待时间
+# 服务端单独的问答缓存: 与桌面程序的索引版本不同，共用一个文件会互相清空
+SERVICE_ANSWER_CACHE_PATH = str(APP_ROOT / "data" / "service_answer_cache.sqlite")
+SERVICE_URL = os.environ.get("RAG_SERVICE_URL", "")  # 设置后桌面程序作为该服务的客户端运行
@@ -0,0 +1,87 @@
+# app/context_builder.py
+import re
+
+from langchain_core.documents import Document
+
+DEFAULT_TOKEN_BUDGET = 1200
+
+# 按中文句末标点、分号和换行断句，标点保留在句尾
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;])|\n+")
+_NEAR_DUPLICATE_JACCARD = 0.8
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def _bigrams(text):
+    text = re.sub(r"\s+", "", text)
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def _normalize(sentence):
+    return re.sub(r"\s+", "", sentence)
+
+
+class ContextBuilder:
+    """
+    在检索结果进入提示词之前压缩上下文:
+    1. 按句子去掉片段重叠部分和重复/近似重复的句子
+    2. 按与问题的字二元组重合度和片段排名给句子打分
+    3. 按分数保留句子直到达到token预算，再按原文顺序拼回各片段
+    """
+
+    def __init__(self, tokenizer, token_budget=DEFAULT_TOKEN_BUDGET, log=True):
+        self.tokenizer = tokenizer
+        self.token_budget = token_budget
+        self.log = log
+        self.last_stats = {}
+
+    def count_tokens(self, texts):
+        if not texts:
+            return []
+        encoded = self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def build(self, question, docs):
+        question_grams = _bigrams(question)
+        seen = set()
+        kept_grams = []
+        candidates = []  # (分数, 片段序号, 句子序号, 句子)
+        for rank, doc in enumerate(docs):
+            for position, sentence in enumerate(split_sentences(doc.page_content)):
+                key = _normalize(sentence)
+                if key in seen:
+                    continue
+                grams = _bigrams(key)
+                if any(len(grams & g) / len(grams | g) >= _NEAR_DUPLICATE_JACCARD for g in kept_grams):
+                    continue
+                seen.add(key)
+                kept_grams.append(grams)
+                overlap = len(grams & question_grams) / len(question_grams)
+                # 排名靠前的片段略微加分，同分时保留靠前的句子
+                score = overlap + 0.1 / (rank + 1)
+                candidates.append((score, rank, position, sentence))
+
+        tokens_before = sum(self.count_tokens([d.page_content for d in docs]))
+        lengths = self.count_tokens([c[3] for c in candidates])
+        selected, used = [], 0
+        for (score, rank, position, sentence), length in sorted(
+                zip(candidates, lengths), key=lambda item: item[0][0], reverse=True):
+            if used + length > self.token_budget:
+                continue
+            selected.append((rank, position, sentence))
+            used += length
+
+        trimmed = []
+        for rank, doc in enumerate(docs):
+            sentences = [s for r, _, s in sorted(selected) if r == rank]
+            if sentences:
+                trimmed.append(Document(page_content="".join(sentences), metadata=doc.metadata))
+
+        self.last_stats = {"tokens_before": tokens_before, "tokens_after": used,
+                           "chunks_before": len(docs), "chunks_after": len(trimmed)}
+        if self.log:
+            print(f"上下文token: 裁剪前 {tokens_before} → 裁剪后 {used} (预算 {self.token_budget}), "
+                  f"片段 {len(docs)} → {len(trimmed)}")
+        return trimmed
@@ -0,0 +1,177 @@
+# app/dedup.py
+import re
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+DEDUP_INDEX_NAME = "dedup.sqlite"
+
+# 64位SimHash的汉明距离阈值: 封面、签字页、标准条款在不同文件中常只差日期、编号几个字
+DEFAULT_NEAR_DISTANCE = 3
+SHINGLE_SIZE = 3
+# 按16位分4段建索引，距离不超过3的两个签名至少有一段完全相同
+BANDS = 4
+BAND_BITS = 64 // BANDS
+
+_SPACE = re.compile(r"\s+")
+# 数值、条款号、标准编号(GB50010-2010、3.2.1、0.85): 近似重复只允许这些之外的文字不同
+_CODE = re.compile(r"[0-9a-z]*\d[0-9a-z.\-/]*")
+
+
+def normalize_text(text):
+    """统一全角半角、去掉空白和大小写差异，排版不同的同一段文字视为相同"""
+    return _SPACE.sub("", unicodedata.normalize("NFKC", text)).lower()
+
+
+def chunk_id(text):
+    """按内容确定的片段ID: 正文相同的片段无论出现在哪个文件哪个位置都得到同一个ID"""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def code_tokens(text):
+    """文本中的数字和编号，按出现顺序"""
+    return _CODE.findall(normalize_text(text))
+
+
+def code_digest(text):
+    """正文中全部数字和编号按顺序连接后的摘要，改了一个数字的修订版与原文不同"""
+    return hashlib.sha1("|".join(code_tokens(text)).encode("utf-8")).hexdigest()[:16]
+
+
+def simhash(text, shingle_size=SHINGLE_SIZE):
+    """按字三元组计算64位SimHash，相似文本的签名只有少数几位不同"""
+    text = normalize_text(text)
+    shingles = {text[i:i + shingle_size] for i in range(max(1, len(text) - shingle_size + 1))}
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    hashes = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8)
+    bits = np.unpackbits(hashes, axis=1, bitorder="little")
+    votes = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(votes, bitorder="little").tobytes(), "little")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _signed(value):
+    # SQLite的INTEGER是有符号64位
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(sig):
+    return [_signed((sig >> (BAND_BITS * b)) & ((1 << BAND_BITS) - 1)) for b in range(BANDS)]
+
+
+class NearDuplicateIndex:
+    """
+    已入库片段的SimHash签名，按分段值建索引查找候选，再按汉明距离确认
+    数字和编号(code_digest)不同的片段不算近似重复: 规范修订常常只改一个数值
+    与向量索引使用同一套片段ID，随索引构建增删
+    """
+
+    def __init__(self, path, max_distance=DEFAULT_NEAR_DISTANCE):
+        self.path = str(path)
+        self.max_distance = max_distance
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self.conn
+        existing = [row[1] for row in conn.execute("PRAGMA table_info(signatures)")]
+        if existing and "codes" not in existing:
+            # 旧版没有记录数字摘要，丢弃后由下次完整构建重新生成
+            conn.execute("DROP TABLE signatures")
+        columns = ", ".join(f"b{b} INTEGER NOT NULL" for b in range(BANDS))
+        conn.execute("CREATE TABLE IF NOT EXISTS signatures "
+                     f"(id TEXT PRIMARY KEY, sig INTEGER NOT NULL, codes TEXT NOT NULL, {columns})")
+        for b in range(BANDS):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS signatures_b{b} ON signatures (b{b})")
+        conn.commit()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def find(self, sig, codes, accept=None):
+        """返回数字摘要相同、距离最近且在阈值内的片段ID，accept(片段ID) 为False的候选跳过"""
+        where = " OR ".join(f"b{b}=?" for b in range(BANDS))
+        best, best_distance = None, self.max_distance + 1
+        rows = self.conn.execute(f"SELECT id, sig FROM signatures WHERE codes=? AND ({where})", [codes, *_bands(sig)])
+        for chunk_id, other in rows:
+            distance = hamming(sig, other & ((1 << 64) - 1))
+            if distance < best_distance and (accept is None or accept(chunk_id)):
+                best, best_distance = chunk_id, distance
+        return best
+
+    def add(self, chunk_id, sig, codes):
+        """写入后同一线程的查找立即可见，批量写完调用 commit"""
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, {', '.join('?' * BANDS)})",
+            (chunk_id, _signed(sig), codes, *_bands(sig)),
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def delete(self, ids):
+        self.conn.executemany("DELETE FROM signatures WHERE id=?", [(chunk_id,) for chunk_id in ids])
+        self.conn.commit()
+
+    def reset(self):
+        self.conn.execute("DELETE FROM signatures")
+        self.conn.commit()
+
+
+class ChunkDeduplicator:
+    """
+    切分之后、嵌入之前判重: 正文相同(按 chunk_id)或SimHash相近且数字编号完全相同的片段归并到已有片段，
+    只有新内容才需要计算向量、写入索引
+    known 为索引中已有的片段ID；near_index 为None时只做精确判重
+    assign 返回每个片段归并后的ID和是否为新片段
+    """
+
+    def __init__(self, known=(), near_index=None):
+        self.known = known
+        self.near_index = near_index
+        self.seen = set()
+        self.stats = {"exact": 0, "near": 0}
+
+    def is_live(self, chunk_id):
+        return chunk_id in self.known or chunk_id in self.seen
+
+    def assign(self, chunks):
+        ids, fresh = [], []
+        for chunk in chunks:
+            key = chunk_id(chunk.page_content)
+            if self.is_live(key):
+                self.stats["exact"] += 1
+                ids.append(key)
+                fresh.append(False)
+                continue
+            if self.near_index is not None:
+                sig = simhash(chunk.page_content)
+                codes = code_digest(chunk.page_content)
+                match = self.near_index.find(sig, codes, self.is_live)
+                if match is not None:
+                    self.stats["near"] += 1
+                    ids.append(match)
+                    fresh.append(False)
+                    continue
+                self.near_index.add(key, sig, codes)
+            self.seen.add(key)
+            ids.append(key)
+            fresh.append(True)
+        if self.near_index is not None:
+            self.near_index.commit()
+        return ids, fresh
@@ -0,0 +1,184 @@
+# app/delta_index.py
+import os
+import json
+import threading
+
+import numpy as np
+import faiss
+
+DELTA_META_NAME = "delta.json"
+DELTA_VECTORS_NAME = "delta-vectors.f32"
+DELTA_IDS_NAME = "delta-ids.txt"
+TOMBSTONES_NAME = "tombstones.json"
+
+
+def _read_json(store_dir, name):
+    path = os.path.join(store_dir, name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"{name} 读取失败，已忽略: {e}")
+        return None
+
+
+def _write_json(store_dir, name, data):
+    tmp_path = os.path.join(store_dir, name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(store_dir, name))
+
+
+def read_delta_meta(store_dir):
+    return _read_json(store_dir, DELTA_META_NAME)
+
+
+def remove_delta(store_dir):
+    """主索引重建保存后，增量段已并入新索引、删除标记对应的片段已被剔除，删除这些文件"""
+    for name in (DELTA_META_NAME, DELTA_VECTORS_NAME, DELTA_IDS_NAME, TOMBSTONES_NAME):
+        try:
+            os.remove(os.path.join(store_dir, name))
+        except OSError:
+            pass
+
+
+class DeltaSegment:
+    """
+    主索引之后新增的片段，小规模暴力检索，与主索引的结果按距离合并
+    向量和ID以追加方式写盘，不重写主索引；delta.json 记录所属主索引版本和有效条数，写入它即为提交点
+    """
+
+    def __init__(self, store_dir, dim, base_build_id):
+        self.store_dir = str(store_dir)
+        self.dim = dim
+        self.base_build_id = base_build_id
+        self.index = faiss.IndexFlatL2(dim)
+        self.ids = []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, store_dir, dim, base_build_id):
+        """读取已提交的增量段；属于其他版本主索引的文件视为已失效"""
+        segment = cls(store_dir, dim, base_build_id)
+        meta = read_delta_meta(store_dir)
+        if not meta or meta.get("base_build_id") != base_build_id or meta.get("dim") != dim:
+            return segment
+        count = meta.get("count", 0)
+        if not count:
+            return segment
+        try:
+            vectors = np.fromfile(segment._path(DELTA_VECTORS_NAME), dtype=np.float32, count=count * dim)
+            with open(segment._path(DELTA_IDS_NAME), "r", encoding="utf-8", newline="\n") as f:
+                ids = f.read().split("\n")[:count]
+        except OSError as e:
+            print(f"增量段读取失败，已忽略: {e}")
+            return segment
+        if len(vectors) != count * dim or len(ids) != count:
+            print("增量段文件不完整，已忽略")
+            return segment
+        segment.index.add(vectors.reshape(count, dim))
+        segment.ids = ids
+        return segment
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vectors(self):
+        return self.index.reconstruct_n(0, self.index.ntotal)
+
+    def _truncate(self):
+        """截掉上次中断时写了一半、尚未提交的尾部"""
+        sizes = {
+            DELTA_VECTORS_NAME: len(self.ids) * self.dim * 4,
+            DELTA_IDS_NAME: sum(len(chunk_id.encode("utf-8")) + 1 for chunk_id in self.ids),
+        }
+        for name, size in sizes.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def append(self, ids, vectors):
+        """追加片段并提交，返回新的总条数"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self.lock:
+            self._truncate()
+            with open(self._path(DELTA_VECTORS_NAME), "ab") as f:
+                vectors.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._path(DELTA_IDS_NAME), "a", encoding="utf-8", newline="\n") as f:
+                f.write("".join(f"{chunk_id}\n" for chunk_id in ids))
+                f.flush()
+                os.fsync(f.fileno())
+            meta = {"base_build_id": self.base_build_id, "dim": self.dim, "count": len(self.ids) + len(ids)}
+            _write_json(self.store_dir, DELTA_META_NAME, meta)
+            self.index.add(vectors)
+            self.ids.extend(ids)
+            return len(self.ids)
+
+    def search(self, query, k):
+        """query 为二维float32数组，返回每行的 [(片段ID, 距离), ...]"""
+        with self.lock:
+            if not self.ids:
+                return [[] for _ in range(len(query))]
+            scores, indices = self.index.search(query, min(k, len(self.ids)))
+            return [
+                [(self.ids[int(i)], float(score)) for score, i in zip(row_scores, row_indices) if i != -1]
+                for row_scores, row_indices in zip(scores, indices)
+            ]
+
+
+class Tombstones:
+    """
+    已删除文件的片段ID: 向量仍留在索引文件中，检索时过滤掉，删除文档无需改动索引
+    压缩(重建主索引)时这些片段被物理剔除，标记随之清空
+    version 每次变化加一，作为缓存版本号的一部分
+    """
+
+    def __init__(self, store_dir, base_build_id, ids=(), version=0):
+        self.store_dir = str(store_dir)
+        self.base_build_id = base_build_id
+        self.ids = frozenset(ids)
+        self.version = version
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, store_dir, base_build_id):
+        data = _read_json(store_dir, TOMBSTONES_NAME)
+        if not data or data.get("base_build_id") != base_build_id:
+            return cls(store_dir, base_build_id)
+        return cls(store_dir, base_build_id, data.get("ids", []), data.get("version", 0))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.ids
+
+    def _update(self, ids):
+        # 整体替换集合，检索线程读到的总是完整的旧集合或新集合
+        self.version += 1
+        _write_json(self.store_dir, TOMBSTONES_NAME, {
+            "base_build_id": self.base_build_id, "version": self.version, "ids": sorted(ids),
+        })
+        self.ids = frozenset(ids)
+
+    def add(self, ids):
+        with self.lock:
+            ids = self.ids.union(ids)
+            if ids != self.ids:
+                self._update(ids)
+
+    def discard(self, ids):
+        with self.lock:
+            ids = self.ids.difference(ids)
+            if ids != self.ids:
+                self._update(ids)
@@ -0,0 +1,82 @@
+# app/docs_watcher.py
+import os
+import threading
+
+from .index_manifest import SUPPORTED_SUFFIXES
+
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+# 只有这些事件会改变文档内容；Linux(inotify)下还会收到opened/closed等事件，读取文件本身不应触发重新入库
+CHANGE_EVENTS = ("created", "modified", "deleted", "moved")
+
+
+class DocsWatcher:
+    """
+    监视文档目录中PDF/DOCX的新增、修改、删除和移动，静默 debounce_seconds 秒后合并回调一次
+    复制大文件或一次拖入多个文件会连续触发很多事件，防抖后只需处理一批
+    on_change(路径列表) 在计时器线程中调用
+    """
+
+    def __init__(self, docs_dir, on_change, debounce_seconds=DEFAULT_DEBOUNCE_SECONDS):
+        self.docs_dir = str(docs_dir)
+        self.on_change = on_change
+        self.debounce_seconds = debounce_seconds
+        self.observer = None
+        self._pending = set()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动监视；未安装watchdog时返回False"""
+        try:
+            from watchdog.observers import Observer
+        except ImportError:
+            print("未安装watchdog，不监视文档目录")
+            return False
+        os.makedirs(self.docs_dir, exist_ok=True)
+        self.observer = Observer()
+        self.observer.daemon = True
+        self.observer.schedule(self, self.docs_dir, recursive=True)
+        self.observer.start()
+        return True
+
+    def stop(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join(timeout=2)
+            self.observer = None
+
+    @staticmethod
+    def is_document(path):
+        name = os.path.basename(path)
+        # Word打开文档时生成的 ~$ 锁文件
+        return name.lower().endswith(SUPPORTED_SUFFIXES) and not name.startswith("~$")
+
+    def dispatch(self, event):
+        """watchdog的事件入口(鸭子类型，无需继承FileSystemEventHandler)"""
+        if event.is_directory or event.event_type not in CHANGE_EVENTS:
+            return
+        paths = [p for p in (event.src_path, getattr(event, "dest_path", "")) if p and self.is_document(p)]
+        if not paths:
+            return
+        with self._lock:
+            self._pending.update(paths)
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce_seconds, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            paths = sorted(self._pending)
+            self._pending.clear()
+            self._timer = None
+        if paths:
+            try:
+                self.on_change(paths)
+            except Exception as e:
+                print(f"文档目录变化处理失败: {e}")
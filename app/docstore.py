@@ -0,0 +1,124 @@
+# app/docstore.py
+import json
+import zlib
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+DOCSTORE_NAME = "docstore.sqlite"
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    单文件SQLite文档库，替代整体反序列化的pickle
+    片段按ID建立主键索引，检索时只读取命中的行；正文和元数据可用zlib压缩
+    """
+
+    def __init__(self, path, compress=True):
+        self.path = str(path)
+        self.compress = compress
+        self.pending_deletes = set()
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self.conn
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id TEXT PRIMARY KEY, compressed INTEGER NOT NULL,"
+            " content BLOB NOT NULL, metadata BLOB NOT NULL) WITHOUT ROWID"
+        )
+        conn.commit()
+
+    @property
+    def conn(self):
+        # sqlite连接不能跨线程使用，检索线程和索引线程各自持有连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _encode(self, doc):
+        content = doc.page_content.encode("utf-8")
+        metadata = json.dumps(doc.metadata, ensure_ascii=False, default=str).encode("utf-8")
+        if self.compress:
+            return 1, zlib.compress(content), zlib.compress(metadata)
+        return 0, content, metadata
+
+    @staticmethod
+    def _decode(compressed, content, metadata):
+        if compressed:
+            content, metadata = zlib.decompress(content), zlib.decompress(metadata)
+        return Document(page_content=content.decode("utf-8"), metadata=json.loads(metadata))
+
+    def search(self, search):
+        row = self.conn.execute(
+            "SELECT compressed, content, metadata FROM chunks WHERE id=?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._decode(*row)
+
+    def mget(self, ids):
+        """批量读取，缺失的ID不出现在结果中"""
+        result = {}
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT id, compressed, content, metadata FROM chunks WHERE id IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for chunk_id, *row in rows:
+                result[chunk_id] = self._decode(*row)
+        return result
+
+    def add(self, texts, overwrite=True):
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        self.conn.executemany(
+            f"{verb} INTO chunks VALUES (?, ?, ?, ?)",
+            [(chunk_id, *self._encode(doc)) for chunk_id, doc in texts.items()],
+        )
+        self.conn.commit()
+        self.pending_deletes.difference_update(texts)
+
+    def delete(self, ids):
+        # 先记录，待新索引写盘后再真正删除，避免仍在使用旧索引的检索读不到片段
+        self.pending_deletes.update(ids)
+
+    def flush(self):
+        if self.pending_deletes:
+            self.conn.executemany(
+                "DELETE FROM chunks WHERE id=?", [(i,) for i in self.pending_deletes]
+            )
+            self.conn.commit()
+            self.pending_deletes.clear()
+
+    def all_ids(self):
+        return [row[0] for row in self.conn.execute("SELECT id FROM chunks")]
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+class IdArrayMap(Mapping):
+    """FAISS位置 → 片段ID 的只读映射，底层为内存映射的定长字节数组"""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __getitem__(self, pos):
+        if not 0 <= pos < len(self.ids):
+            raise KeyError(pos)
+        return self.ids[pos].decode("utf-8")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(range(len(self.ids)))
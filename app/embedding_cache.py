@@ -0,0 +1,147 @@
+# app/embedding_cache.py
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# 默认最多缓存的向量条数 (bge-small-zh 512维约2KB/条)
+DEFAULT_MAX_ENTRIES = 2_000_000
+# 超出容量时一次淘汰到容量的这个比例，之后的写入不会每批都触发淘汰
+EVICT_TO_RATIO = 0.9
+
+
+def model_identity(embeddings):
+    """嵌入模型标识: 模型名称 + 配置文件内容 + 编码参数，模型或参数变化后旧缓存自动失效"""
+    model_name = getattr(embeddings, "model_name", type(embeddings).__name__)
+    h = hashlib.sha256(Path(str(model_name)).name.encode("utf-8"))
+    for name in ("config.json", "modules.json", "config_sentence_transformers.json"):
+        path = Path(str(model_name)) / name
+        if path.is_file():
+            h.update(path.read_bytes())
+    h.update(json.dumps(getattr(embeddings, "encode_kwargs", {}), sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class EmbeddingCache:
+    """
+    按内容寻址的持久化嵌入缓存
+    键为 (模型标识, 文本) 的哈希，值为float32原始字节，存放在单个SQLite文件中
+    超出容量时按最近使用时间淘汰
+    一次构建共用一个连接；流水线的嵌入线程和主线程先后使用，用锁串行化
+    """
+
+    def __init__(self, path, model_id, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = str(path)
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # 条目数的上界: 首次写入时统计一次，之后按写入条数累加，超出容量时才重新统计
+        self.count = None
+        self.lock = threading.Lock()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self.conn.commit()
+
+    def key(self, text):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(self.model_id.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+        return h.digest()
+
+    def get_many(self, texts):
+        """返回与texts等长的列表，未命中的位置为None"""
+        with self.lock:
+            return self._get_many(texts)
+
+    def _get_many(self, texts):
+        keys = [self.key(t) for t in texts]
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used=? WHERE key=?", [(now, k) for k in found]
+            )
+            self.conn.commit()
+        result = [found.get(k) for k in keys]
+        hit = sum(1 for v in result if v is not None)
+        self.hits += hit
+        self.misses += len(result) - hit
+        return result
+
+    def put_many(self, texts, vectors):
+        now = time.time()
+        rows = []
+        for text, vec in zip(texts, vectors):
+            arr = np.asarray(vec, dtype=np.float32)
+            rows.append((self.key(text), arr.shape[0], arr.tobytes(), now))
+        with self.lock:
+            if self.count is None:
+                self.count = self.row_count()
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+            # 替换已有的键不增加条目，累加的是上界
+            self.count += len(rows)
+            if self.count > self.max_entries:
+                self.evict()
+
+    def row_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def evict(self):
+        """超出容量时删除最久未使用的条目，直到只剩容量的 EVICT_TO_RATIO"""
+        self.count = self.row_count()
+        overflow = self.count - int(self.max_entries * EVICT_TO_RATIO)
+        if self.count > self.max_entries and overflow > 0:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            self.conn.commit()
+            self.count -= overflow
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CachedEmbedder:
+    """只为缓存未命中的文本调用嵌入模型"""
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts, **kwargs):
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # 同一批内重复的文本只计算一次
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique, self.embeddings.embed_documents(unique, **kwargs)))
+            self.cache.put_many(list(computed), list(computed.values()))
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+        return vectors
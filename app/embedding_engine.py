@@ -0,0 +1,134 @@
+# app/embedding_engine.py
+import os
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_BATCH_SIZE = 32
+
+# 工作进程内的嵌入模型，由 _init_worker 加载一次
+_worker_model = None
+_worker_encode_kwargs = {}
+
+
+def _init_worker(model_path, encode_kwargs, num_threads):
+    global _worker_model, _worker_encode_kwargs
+    import torch
+    from sentence_transformers import SentenceTransformer
+    # 每个进程只使用分到的核心，避免多进程之间线程争抢
+    torch.set_num_threads(num_threads)
+    _worker_model = SentenceTransformer(model_path, device="cpu")
+    _worker_encode_kwargs = dict(encode_kwargs)
+
+
+def _encode_batch(batch_id, texts):
+    vectors = _worker_model.encode(texts, batch_size=len(texts), **_worker_encode_kwargs)
+    return batch_id, [v.tolist() for v in vectors]
+
+
+def default_workers():
+    """仅在纯CPU环境下启用多进程，GPU上单进程已经足够快"""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return 1
+    except ImportError:
+        pass
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class BatchEmbeddingEngine:
+    """
+    按token长度排序分批计算向量，长度相近的片段放在同一批以减少padding
+    CPU环境下把批次分发给多个各自持有模型副本的工作进程
+    """
+
+    def __init__(self, embeddings, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.workers = workers or default_workers()
+        self.last_rate = 0.0
+        self._pool = None
+        self._in_session = False
+
+    @contextmanager
+    def session(self):
+        """
+        流式入库时在会话内复用同一个进程池，每批只有几百个片段，
+        不必每次调用都重新启动工作进程、加载模型
+        """
+        self._in_session = True
+        try:
+            yield self
+        finally:
+            self._in_session = False
+            self._shutdown_pool()
+
+    def _get_pool(self):
+        if self._pool is None:
+            model_path = self.embeddings.model_name
+            encode_kwargs = getattr(self.embeddings, "encode_kwargs", {})
+            num_threads = max(1, (os.cpu_count() or 2) // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(model_path, encode_kwargs, num_threads),
+            )
+        return self._pool
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def token_lengths(self, texts):
+        tokenizer = getattr(getattr(self.embeddings, "client", None), "tokenizer", None)
+        if tokenizer is None:
+            return [len(t) for t in texts]
+        return tokenizer(texts, add_special_tokens=False, return_length=True)["length"]
+
+    def make_batches(self, texts):
+        """返回 [(原始下标列表, 文本列表), ...]，批内长度相近"""
+        order = sorted(range(len(texts)), key=self.token_lengths(texts).__getitem__)
+        batches = []
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            batches.append((idx, [texts[i] for i in idx]))
+        return batches
+
+    def embed_documents(self, texts, progress_callback=None):
+        texts = [t.replace("\n", " ") for t in texts]
+        if not texts:
+            return []
+        start_time = time.perf_counter()
+        batches = self.make_batches(texts)
+        vectors = [None] * len(texts)
+        done = 0
+
+        def collect(idx, batch_vectors):
+            nonlocal done
+            for i, v in zip(idx, batch_vectors):
+                vectors[i] = v
+            done += len(idx)
+            elapsed = time.perf_counter() - start_time
+            self.last_rate = done / elapsed if elapsed > 0 else 0.0
+            if progress_callback:
+                progress_callback(done, len(texts))
+
+        # 批次太少时启动进程池得不偿失；会话内进程池已经启动，多于一批即可分发
+        min_batches = 2 if self._in_session else self.workers * 2
+        if self.workers > 1 and len(batches) >= min_batches:
+            pool = self._get_pool()
+            try:
+                futures = [pool.submit(_encode_batch, b, batch) for b, (_, batch) in enumerate(batches)]
+                for future in as_completed(futures):
+                    b, batch_vectors = future.result()
+                    collect(batches[b][0], batch_vectors)
+            finally:
+                if not self._in_session:
+                    self._shutdown_pool()
+        else:
+            for idx, batch in batches:
+                collect(idx, self.embeddings.embed_documents(batch))
+
+        return vectors
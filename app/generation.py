@@ -0,0 +1,238 @@
+# app/generation.py
+import os
+import time
+import threading
+
+from langchain_core.prompts import format_document
+
+from .tracing import tracer
+
+SPECIAL_TOKENS = ("<|im_end|>", "<|im_start|>")
+
+
+def clean_text(text):
+    for token in SPECIAL_TOKENS:
+        text = text.replace(token, "")
+    return text
+
+
+class BatchStreamer:
+    """
+    接收 model.generate 每一步生成的token(整批)，按行增量解码后回调 on_text(行号, 新增文本)
+    某一行生成结束符后立即回调 on_done(行号)，不必等同批中最长的答案生成完
+    transformers 自带的 TextStreamer 只支持单条输入，这里按行分别维护解码状态
+    """
+
+    def __init__(self, tokenizer, on_text, eos_ids, on_done=None):
+        self.tokenizer = tokenizer
+        self.on_text = on_text
+        self.on_done = on_done
+        self.eos_ids = set(eos_ids)
+        self.tokens = None
+        self.texts = None
+        self.finished = None
+
+    def put(self, value):
+        if self.tokens is None:
+            # 第一次回调传入的是提示词本身
+            rows = value.shape[0]
+            self.tokens = [[] for _ in range(rows)]
+            self.texts = [""] * rows
+            self.finished = [False] * rows
+            return
+        for row, ids in enumerate(value.reshape(len(self.tokens), -1).tolist()):
+            if self.finished[row]:
+                continue
+            for token_id in ids:
+                if token_id in self.eos_ids:
+                    self.finished[row] = True
+                    break
+                self.tokens[row].append(token_id)
+            self.emit(row, final=self.finished[row])
+            if self.finished[row] and self.on_done is not None:
+                self.on_done(row)
+
+    def emit(self, row, final=False):
+        text = clean_text(self.tokenizer.decode(self.tokens[row], skip_special_tokens=True))
+        # 多字节字符的token尚未生成完整时先不输出
+        if text.endswith("\ufffd") and not final:
+            return
+        if text.startswith(self.texts[row]) and len(text) > len(self.texts[row]):
+            self.on_text(row, text[len(self.texts[row]):])
+        self.texts[row] = text
+
+    def end(self):
+        """达到 max_new_tokens 仍未结束的行在这里收尾"""
+        if self.tokens is None:
+            return
+        for row in range(len(self.tokens)):
+            if self.finished[row]:
+                continue
+            self.finished[row] = True
+            self.emit(row, final=True)
+            if self.on_done is not None:
+                self.on_done(row)
+
+
+def stop_token_ids(model, tokenizer):
+    """生成结束符集合，桌面端、问答服务和批量问答共用"""
+    ids = {tokenizer.eos_token_id}
+    configured = getattr(model.generation_config, "eos_token_id", None)
+    if isinstance(configured, int):
+        ids.add(configured)
+    elif configured:
+        ids.update(configured)
+    # ChatGLM3 以 <|user|> / <|observation|> 表示本轮回答结束
+    for token in ("<|user|>", "<|observation|>"):
+        token_id = tokenizer.convert_tokens_to_ids(token)
+        if isinstance(token_id, int) and token_id != tokenizer.unk_token_id:
+            ids.add(token_id)
+    return {i for i in ids if i is not None}
+
+
+def source_locations(doc):
+    """片段的全部出处 [{"source", "page"}, ...]，重复片段合并后会有多个"""
+    sources = doc.metadata.get("sources")
+    if sources:
+        return [{"source": str(s.get("source", "")), "page": s.get("page")} for s in sources]
+    return [{"source": str(doc.metadata.get("source", "")), "page": doc.metadata.get("page")}]
+
+
+def document_sources(docs):
+    """检索结果的出处列表，每个片段一项；重复片段的其他出处放在 duplicates 中"""
+    results = []
+    for doc in docs:
+        first, *others = source_locations(doc)
+        if others:
+            first = dict(first, duplicates=others)
+        results.append(first)
+    return results
+
+
+def format_passages(docs):
+    """把检索结果整理成可直接阅读的文本(大模型未就绪时使用)"""
+    if not docs:
+        return "未检索到相关文档片段"
+    parts = []
+    for i, doc in enumerate(docs, 1):
+        source = os.path.basename(str(doc.metadata.get("source", "")))
+        page = doc.metadata.get("page")
+        location = f"{source} 第{page + 1}页" if isinstance(page, int) else source
+        others = len(source_locations(doc)) - 1
+        if others:
+            location += f" (另有 {others} 处相同内容)"
+        parts.append(f"【片段 {i}】{location}\n{doc.page_content.strip()}")
+    return "\n\n".join(parts)
+
+
+def supports_streaming(qa):
+    """只有基于transformers pipeline的stuff链才能逐token输出"""
+    chain = getattr(qa, "combine_documents_chain", None)
+    llm_chain = getattr(chain, "llm_chain", None)
+    return getattr(getattr(llm_chain, "llm", None), "pipeline", None) is not None
+
+
+def build_prompt(qa, question, docs):
+    """按RetrievalQA的stuff链方式拼接提示词"""
+    chain = qa.combine_documents_chain
+    context = chain.document_separator.join(
+        format_document(doc, chain.document_prompt) for doc in docs
+    )
+    return chain.llm_chain.prompt.format(**{
+        chain.document_variable_name: context,
+        "question": question,
+    })
+
+
+def generate_batch(pipe, prompts, generation_kwargs=None, on_text=None, on_done=None, cancelled=None):
+    """
+    一次 model.generate 批量生成多个提示词的答案(左侧填充)，问答服务的微批和批量问答共用
+    on_text(行号, 新增文本) 逐段输出；某一行生成结束符或达到长度上限时回调 on_done(行号, 结果)
+    cancelled(行号) 为True的行不再输出，全部行结束或取消后立即停止生成
+    返回每行的 {"text": 答案, "tokens": token数, "ms": 从开始生成到该行结束的毫秒数}
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+    from .model_loading import GENERATION_KWARGS
+
+    tokenizer, model = pipe.tokenizer, pipe.model
+    stop_ids = stop_token_ids(model, tokenizer)
+    is_cancelled = cancelled or (lambda row: False)
+    results = [{"text": "", "tokens": 0, "ms": None} for _ in prompts]
+
+    def emit(row, text):
+        if on_text is not None and not is_cancelled(row):
+            on_text(row, text)
+
+    def finish(row):
+        results[row].update(text=streamer.texts[row].strip(), tokens=len(streamer.tokens[row]),
+                            ms=round((time.perf_counter() - start) * 1000, 1))
+        if on_done is not None and not is_cancelled(row):
+            on_done(row, results[row])
+
+    class AllRowsStopped(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            finished = streamer.finished or [False] * len(prompts)
+            return all(done or is_cancelled(row) for row, done in enumerate(finished))
+
+    # 共用的tokenizer只在编码这一批时改为左侧填充
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        inputs = tokenizer(list(prompts), return_tensors="pt", padding=True).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+    kwargs = dict(GENERATION_KWARGS, **(generation_kwargs or {}))
+    if tokenizer.pad_token_id is not None:
+        kwargs.setdefault("pad_token_id", tokenizer.pad_token_id)
+    streamer = BatchStreamer(tokenizer, emit, stop_ids, finish)
+    start = time.perf_counter()
+    with torch.no_grad():
+        model.generate(**inputs, streamer=streamer, eos_token_id=sorted(stop_ids),
+                       stopping_criteria=StoppingCriteriaList([AllRowsStopped()]), **kwargs)
+    streamer.end()
+    return results
+
+
+def stream_answer(qa, question, timeout=600):
+    """检索后在后台线程生成，按生成顺序逐段返回答案文本"""
+    from transformers import TextIteratorStreamer
+
+    docs = qa.retriever.invoke(question)
+    pipe = qa.combine_documents_chain.llm_chain.llm.pipeline
+    with tracer.span("prompt_build") as span:
+        prompt = build_prompt(qa, question, docs)
+        span.set(prompt_tokens=len(pipe.tokenizer(prompt)["input_ids"]))
+
+    streamer = TextIteratorStreamer(
+        pipe.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout
+    )
+    errors = []
+
+    def generate():
+        try:
+            pipe(prompt, streamer=streamer, return_full_text=False,
+                 eos_token_id=sorted(stop_token_ids(pipe.model, pipe.tokenizer)))
+        except Exception as e:
+            errors.append(e)
+            # 让迭代端立即结束而不是等到超时
+            streamer.end()
+
+    with tracer.span("generation") as span:
+        start = time.perf_counter()
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+        pieces = []
+        for piece in streamer:
+            piece = clean_text(piece)
+            if piece:
+                if not pieces:
+                    span.set(first_token_ms=round((time.perf_counter() - start) * 1000, 1))
+                pieces.append(piece)
+                yield piece
+        thread.join()
+        if errors:
+            raise errors[0]
+        elapsed = time.perf_counter() - start
+        tokens = len(pipe.tokenizer("".join(pieces), add_special_tokens=False)["input_ids"])
+        span.set(tokens=tokens, tokens_per_second=round(tokens / elapsed, 2) if elapsed > 0 else 0.0)
@@ -0,0 +1,159 @@
+# app/index_manifest.py
+import os
+import json
+import hashlib
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+# 2: 片段ID改为按内容计算，重复片段在多个文件之间共用
+# 3: 记录每个文件中按近似重复归并(正文与所存片段不完全相同)的片段
+MANIFEST_VERSION = 3
+
+# 参与索引的文档类型
+SUPPORTED_SUFFIXES = (".pdf", ".docx")
+
+
+class NoDocumentsError(RuntimeError):
+    """文档目录中没有可索引的文件"""
+
+
+def file_sha256(path, block_size=1 << 20):
+    """计算文件内容哈希"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_documents(docs_dir):
+    """扫描文档目录，返回 {相对路径: os.stat_result}"""
+    files = {}
+    docs_dir = Path(docs_dir)
+    if not docs_dir.exists():
+        return files
+    for root, _, names in os.walk(docs_dir):
+        for name in names:
+            if not name.lower().endswith(SUPPORTED_SUFFIXES):
+                continue
+            path = Path(root) / name
+            rel = path.relative_to(docs_dir).as_posix()
+            files[rel] = path.stat()
+    return dict(sorted(files.items()))
+
+
+class IndexManifest:
+    """
+    记录已索引文件(路径、大小、修改时间、内容哈希 → 片段ID)的清单
+    settings 为影响切分结果的设置，与清单中记录的不同时视为空清单，触发完整重建
+    """
+
+    def __init__(self, store_dir, settings=None):
+        self.path = Path(store_dir) / MANIFEST_NAME
+        self.settings = settings
+        self.files = {}
+
+    def load(self):
+        """读取清单，不存在、版本或切分设置不符时视为空清单"""
+        self.files = {}
+        if not self.path.exists():
+            return self
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"索引清单读取失败，将完整重建: {e}")
+            return self
+        if data.get("version") == MANIFEST_VERSION and \
+                (self.settings is None or data.get("settings") == self.settings):
+            self.files = data.get("files", {})
+        return self
+
+    def save(self):
+        """原子写入清单，避免中途退出留下半个文件"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "files": self.files}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def all_chunk_ids(self):
+        ids = []
+        for entry in self.files.values():
+            ids.extend(entry["chunk_ids"])
+        return ids
+
+    def diff(self, docs_dir, current_files):
+        """
+        比较清单与当前文档目录
+        返回 (需要处理的文件, 已删除的文件, 仅元数据变化的文件)
+        大小和修改时间一致的文件直接视为未变化，不再读取内容计算哈希
+        """
+        changed, touched = [], {}
+        for rel, st in current_files.items():
+            entry = self.files.get(rel)
+            if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+                continue
+            sha = file_sha256(Path(docs_dir) / rel)
+            if entry and entry["sha256"] == sha:
+                touched[rel] = {"size": st.st_size, "mtime": st.st_mtime}
+            else:
+                changed.append((rel, sha))
+        removed = [rel for rel in self.files if rel not in current_files]
+        return changed, removed, touched
+
+    def chunk_sources(self, ids):
+        """
+        {片段ID: [(相对路径, 页码), ...]}，只统计给定的片段，同一片段可能出现在多个文件中
+        正文与所存片段完全相同的出处排在近似重复的出处之前
+        """
+        wanted = set(ids)
+        exact, near = {}, {}
+        for rel, entry in self.files.items():
+            pages = entry.get("chunk_pages") or [None] * len(entry["chunk_ids"])
+            near_ids = set(entry.get("near_chunk_ids", []))
+            for chunk_id, page in zip(entry["chunk_ids"], pages):
+                if chunk_id not in wanted:
+                    continue
+                locations = (near if chunk_id in near_ids else exact).setdefault(chunk_id, [])
+                if (rel, page) not in locations:
+                    locations.append((rel, page))
+        return {chunk_id: exact.get(chunk_id, []) + near.get(chunk_id, []) for chunk_id in {*exact, *near}}
+
+    def near_dependents(self, rels):
+        """
+        rels 中的文件删除或重新切分后，其余文件中按近似重复引用、却已没有正文相同出处的片段所在的文件
+        这些文件需要一并重新入库，用自己的正文和向量，而不是沿用已被删除的修订版的正文
+        """
+        gone = set(rels)
+        dependents = set()
+        while True:
+            owned = set()
+            for rel, entry in self.files.items():
+                if rel not in gone:
+                    owned.update(set(entry["chunk_ids"]).difference(entry.get("near_chunk_ids", [])))
+            found = {
+                rel for rel, entry in self.files.items()
+                if rel not in gone and not owned.issuperset(entry.get("near_chunk_ids", []))
+            }
+            if not found:
+                return sorted(dependents)
+            dependents.update(found)
+            gone.update(found)
+
+    def set_file(self, rel, st, sha, chunk_ids, chunk_pages=None, near_ids=None):
+        """near_ids 为该文件中只按近似重复归并、没有正文完全相同片段的片段ID"""
+        self.files[rel] = {
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "sha256": sha,
+            "chunk_ids": list(chunk_ids),
+        }
+        if chunk_pages is not None:
+            self.files[rel]["chunk_pages"] = list(chunk_pages)
+        if near_ids:
+            self.files[rel]["near_chunk_ids"] = sorted(near_ids)
+
+    def remove_file(self, rel):
+        return self.files.pop(rel, {}).get("chunk_ids", [])
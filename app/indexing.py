@@ -0,0 +1,708 @@
+# app/indexing.py
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from .index_manifest import IndexManifest, NoDocumentsError, scan_documents
+from .ingest import ParallelLoader
+from .ingest_pipeline import DEFAULT_BATCH_SIZE as DEFAULT_INGEST_BATCH_SIZE, DEFAULT_QUEUE_SIZE
+from .ingest_pipeline import IngestPipeline, VectorSpool
+from .dedup import DEDUP_INDEX_NAME, ChunkDeduplicator, NearDuplicateIndex, chunk_id
+from .delta_index import Tombstones
+from .docstore import DOCSTORE_NAME, SQLiteDocstore
+from .embedding_cache import CachedEmbedder, EmbeddingCache, DEFAULT_MAX_ENTRIES, model_identity
+from .embedding_engine import BatchEmbeddingEngine, DEFAULT_BATCH_SIZE
+from .lexical_index import LEXICAL_INDEX_NAME, LexicalIndex
+from .retrievers import fetch_documents
+from .sharded_store import ShardedVectorStore, list_shards, shard_dir, shard_of, shard_size
+from .text_splitter import ChineseTextSplitter
+from .tracing import tracer
+from .vector_index import (INDEX_PARAMS_NAME, add_vectors, build_index, load_vector_store,
+                           make_params, read_params, reconstruct_vectors, resolve_index_type,
+                           save_vector_store, vector_store_exists)
+
+
+DEFAULT_SPLITTER = "chinese"
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_CHUNK_OVERLAP = 50
+DEFAULT_COMPACT_RATIO = 0.2
+DEFAULT_COMPACT_MAX_TOMBSTONES = 2000
+# 写入FAISS和从旧索引还原向量时每批的条数
+INDEX_ADD_BATCH = 16384
+
+
+def split_settings(splitter=DEFAULT_SPLITTER, chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+    """记入清单的切分设置，改变后已有片段需要全部重新切分"""
+    return {"splitter": splitter, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+
+
+def needs_compaction(dead, total, ratio=DEFAULT_COMPACT_RATIO, max_tombstones=DEFAULT_COMPACT_MAX_TOMBSTONES):
+    """删除标记占比或数量超过阈值时应重建索引，剔除已删除的向量(检索时多取的条数也随之回落)"""
+    return dead > 0 and (dead > max_tombstones or dead > total * ratio)
+
+
+def tombstone_count(store_dir):
+    """不加载索引，读取磁盘上当前版本的删除标记数"""
+    return len(Tombstones.open(store_dir, read_params(store_dir).get("build_id")))
+
+
+def near_merged(chunks, ids):
+    """按近似重复归并到其他正文的片段ID，同一文件中另有正文完全相同片段的除外"""
+    own = {i for chunk, i in zip(chunks, ids) if chunk_id(chunk.page_content) == i}
+    return {i for i in ids if i not in own}
+
+
+def tombstoned_ids(vs):
+    tombstones = getattr(vs, "tombstones", None)
+    return tombstones.ids if tombstones is not None else frozenset()
+
+
+class IndexBuilder:
+    """根据文件清单增量构建向量索引，只处理新增、修改和删除的文件"""
+
+    def __init__(self, embeddings, docs_dir, store_dir, chunk_size=DEFAULT_CHUNK_SIZE,
+                 chunk_overlap=DEFAULT_CHUNK_OVERLAP, splitter=DEFAULT_SPLITTER,
+                 load_workers=None, cache_path=None, cache_max_entries=DEFAULT_MAX_ENTRIES,
+                 embed_batch_size=DEFAULT_BATCH_SIZE, embed_workers=None, index_type="auto",
+                 store_backend="pickle", store_compress=True, lexical=True, shard=None,
+                 compact_ratio=DEFAULT_COMPACT_RATIO, compact_max_tombstones=DEFAULT_COMPACT_MAX_TOMBSTONES,
+                 ingest_batch_size=DEFAULT_INGEST_BATCH_SIZE, ingest_queue_size=DEFAULT_QUEUE_SIZE,
+                 near_duplicate_distance=None):
+        self.embeddings = embeddings
+        # 近似重复判定的SimHash距离阈值，None 时只合并正文完全相同的片段
+        self.near_index = (NearDuplicateIndex(Path(store_dir) / DEDUP_INDEX_NAME, near_duplicate_distance)
+                           if near_duplicate_distance is not None else None)
+        self.ingest_batch_size = ingest_batch_size
+        self.ingest_queue_size = ingest_queue_size
+        self.compact_ratio = compact_ratio
+        self.compact_max_tombstones = compact_max_tombstones
+        # 指定分片名时只处理属于该分片的文件，store_dir 为该分片的目录
+        self.shard = shard
+        self.lexical = LexicalIndex(Path(store_dir) / LEXICAL_INDEX_NAME) if lexical else None
+        self.index_type = index_type
+        self.store_backend = store_backend
+        self.store_compress = store_compress
+        self.encoder = BatchEmbeddingEngine(embeddings, batch_size=embed_batch_size, workers=embed_workers)
+        self.cache_path = cache_path
+        self.cache_max_entries = cache_max_entries
+        self.cache = None
+        self.docs_dir = Path(docs_dir)
+        self.store_dir = str(store_dir)
+        # chinese: 按条款和句子切分，按嵌入模型的token计数; recursive: LangChain按字符切分
+        if splitter == "chinese":
+            self.splitter = ChineseTextSplitter.from_embeddings(embeddings, chunk_size, chunk_overlap)
+        else:
+            self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.loader = ParallelLoader(docs_dir, max_workers=load_workers)
+        self.manifest = IndexManifest(store_dir, split_settings(splitter, chunk_size, chunk_overlap))
+
+    def scan(self):
+        files = scan_documents(self.docs_dir)
+        if self.shard is None:
+            return files
+        return {rel: st for rel, st in files.items() if shard_of(rel) == self.shard}
+
+    def load_existing(self):
+        """加载已保存的索引和清单，两者不一致时返回None以触发完整重建"""
+        self.manifest.load()
+        if not vector_store_exists(self.store_dir) or not self.manifest.files:
+            self.manifest.files = {}
+            return None
+        try:
+            vs = load_vector_store(self.store_dir, self.embeddings, mmap=False)
+        except Exception as e:
+            print(f"已有索引加载失败，将完整重建: {e}")
+            self.manifest.files = {}
+            return None
+        indexed = set(vs.index_to_docstore_id.values()).difference(tombstoned_ids(vs))
+        if indexed != set(self.manifest.all_chunk_ids()):
+            print("索引与清单不一致，将完整重建")
+            self.manifest.files = {}
+            return None
+        return vs
+
+    def embed(self, texts, stats, progress_callback=None):
+        """计算向量，配置了缓存时只为未命中的片段调用模型"""
+        if not self.cache_path:
+            vectors = self.encoder.embed_documents(texts, progress_callback=progress_callback)
+        else:
+            cache = self.open_cache()
+            hits, misses = cache.hits, cache.misses
+            vectors = CachedEmbedder(self.encoder, cache).embed_documents(texts, progress_callback=progress_callback)
+            stats["cache_hits"] += cache.hits - hits
+            stats["cache_misses"] += cache.misses - misses
+        stats["embed_rate"] = self.encoder.last_rate
+        return vectors
+
+    def open_cache(self):
+        """一次构建中各批次共用同一个嵌入缓存连接，构建结束时由 close_cache 关闭"""
+        if self.cache is None:
+            self.cache = EmbeddingCache(self.cache_path, model_identity(self.embeddings), self.cache_max_entries)
+        return self.cache
+
+    def close_cache(self):
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def spool_survivors(self, vs, stale, spool, stats):
+        """
+        把旧索引中仍然有效的向量分批写入暂存文件，返回对应的片段ID
+        优先从索引还原，有损索引(PQ)则分批读出正文重新嵌入(多数命中嵌入缓存)
+        """
+        mapping = vs.index_to_docstore_id
+        positions = [pos for pos, chunk_id in sorted(mapping.items()) if chunk_id not in stale]
+        ids = [mapping[pos] for pos in positions]
+        for start in range(0, len(positions), INDEX_ADD_BATCH):
+            batch = positions[start:start + INDEX_ADD_BATCH]
+            vectors = reconstruct_vectors(vs.index, batch[0], batch[-1] - batch[0] + 1)
+            if vectors is not None:
+                vectors = vectors[np.asarray(batch) - batch[0]]
+            else:
+                docs = fetch_documents(vs, ids[start:start + INDEX_ADD_BATCH])
+                vectors = self.embed([d.page_content for d in docs], stats)
+            spool.append(vectors)
+        return ids
+
+    def new_docstore(self):
+        """完整构建时的文档库: sqlite后端直接写入目标文件，片段正文不在内存中累积"""
+        if self.store_backend == "sqlite":
+            return SQLiteDocstore(os.path.join(self.store_dir, DOCSTORE_NAME), self.store_compress)
+        return InMemoryDocstore({})
+
+    def sync_lexical(self, vs, report):
+        """词法索引与向量索引片段数不一致时(首次启用或上次中断)，从文档库重新生成"""
+        if self.lexical is None or vs is None:
+            return
+        dead = tombstoned_ids(vs)
+        ids = [i for i in vs.index_to_docstore_id.values() if i not in dead]
+        if len(self.lexical) == len(ids):
+            return
+        report(8, "重新生成词法索引...")
+        self.lexical.reset()
+        for start in range(0, len(ids), 1000):
+            batch = ids[start:start + 1000]
+            self.lexical.add(batch, [vs.docstore.search(i).page_content for i in batch])
+        self.lexical.optimize()
+
+    def build(self, progress_callback=None):
+        """
+        增量更新索引并保存
+        返回 (向量库, 统计信息)
+        """
+        with tracer.span("index_build") as span:
+            try:
+                vs, stats = self._build(progress_callback)
+            finally:
+                self.close_cache()
+            span.set(**{key: stats.get(key) for key in (
+                "added", "updated", "removed", "chunks_added", "chunks_removed", "chunks", "index_type",
+                "duplicates_exact", "duplicates_near")})
+        return vs, stats
+
+    def split_segment(self, rel, docs):
+        """切分文件的一段页面"""
+        return self.splitter.split_documents(docs)
+
+    def split(self, loaded, changed):
+        """切分文档，返回 [(相对路径, 哈希, 片段列表)]"""
+        file_chunks = []
+        with tracer.span("split") as span:
+            for rel, sha in changed:
+                file_chunks.append((rel, sha, self.split_segment(rel, loaded.pop(rel))))
+            span.set(chunks=sum(len(chunks) for _, _, chunks in file_chunks))
+        return file_chunks
+
+    def refresh_sources(self, docstore, ids):
+        """
+        重写被多个文件(或同一文件多处)共用的片段的出处: 元数据 sources 列出全部位置，
+        source/page 取其中第一个；原出处文件被修改或删除后也由此更新
+        """
+        sources = self.manifest.chunk_sources(ids)
+        ids = [i for i in ids if i in sources]
+        for start in range(0, len(ids), 1000):
+            batch = ids[start:start + 1000]
+            if isinstance(docstore, SQLiteDocstore):
+                docs = docstore.mget(batch)
+            else:
+                docs = {i: docstore.search(i) for i in batch}
+            for i, doc in docs.items():
+                if isinstance(doc, str):
+                    continue
+                locations = [{"source": str(self.docs_dir / rel), "page": page} for rel, page in sources[i]]
+                metadata = dict(doc.metadata, source=locations[0]["source"])
+                if "file_path" in metadata:
+                    metadata["file_path"] = locations[0]["source"]
+                if locations[0]["page"] is None:
+                    metadata.pop("page", None)
+                else:
+                    metadata["page"] = locations[0]["page"]
+                if len(locations) > 1:
+                    metadata["sources"] = locations
+                else:
+                    metadata.pop("sources", None)
+                # 内存文档库中的对象原地修改即可
+                doc.metadata = metadata
+            if isinstance(docstore, SQLiteDocstore):
+                docstore.add({i: doc for i, doc in docs.items() if not isinstance(doc, str)})
+
+    def apply_live(self, vs, progress_callback=None):
+        """
+        把文档目录的变化直接应用到正在使用的向量库，不重写主索引:
+        删除和修改的文件只给旧片段打删除标记，新增和修改后的片段追加到增量段
+        向量库没有增量段(pickle后端)时返回None，由调用方改为执行 build
+        返回 (向量库, 统计信息)，stats["needs_compaction"] 表示删除标记已超过阈值
+        """
+        try:
+            return self._apply_live(vs, progress_callback)
+        finally:
+            self.close_cache()
+
+    def _apply_live(self, vs, progress_callback):
+        def report(value, message):
+            if progress_callback:
+                progress_callback(value, message)
+
+        delta = getattr(vs, "delta", None)
+        tombstones = getattr(vs, "tombstones", None)
+        if delta is None or tombstones is None:
+            return None
+        self.manifest.load()
+        if not self.manifest.files:
+            # 清单缺失或切分设置已改变，需要完整重建
+            return None
+        current_files = self.scan()
+        changed, removed, touched = self.manifest.diff(self.docs_dir, current_files)
+        if self.manifest.near_dependents(removed + [rel for rel, _ in changed]):
+            # 近似重复片段失去了正文相同的出处，引用它的文件要用自己的正文重新入库，交给完整构建处理
+            return None
+        updated = sum(1 for rel, _ in changed if rel in self.manifest.files)
+        stats = {"added": len(changed) - updated, "updated": updated, "removed": len(removed),
+                 "unchanged": len(current_files) - len(changed), "chunks_added": 0, "chunks_removed": 0,
+                 "cache_hits": 0, "cache_misses": 0, "embed_rate": 0.0, "index_type": "增量",
+                 "duplicates_exact": 0, "duplicates_near": 0, "failed": []}
+        for rel, meta in touched.items():
+            self.manifest.files[rel].update(meta)
+
+        with tracer.span("live_ingest", files=len(changed), removed=len(removed)) as span:
+            # 删除的文件: 不再被其他文件引用的片段只写删除标记，毫秒级完成
+            removed_ids = set()
+            for rel in removed:
+                removed_ids.update(self.manifest.remove_file(rel))
+            orphaned = removed_ids.difference(self.manifest.all_chunk_ids())
+            if removed:
+                with tracer.span("tombstone", chunks=len(orphaned)):
+                    if orphaned:
+                        tombstones.add(orphaned)
+                        if self.lexical is not None:
+                            self.lexical.delete(orphaned)
+                    self.manifest.save()
+
+            file_chunks = []
+            if changed:
+                report(10, f"加载 {len(changed)} 个文档...")
+                with tracer.span("load_documents", files=len(changed)):
+                    loaded = self.loader.load([rel for rel, _ in changed])
+                file_chunks = self.split(loaded, changed)
+                stats["failed"] = sorted(self.loader.failed)
+
+            # 片段ID由正文决定: 修改后的文件中未变的片段、与其他文件重复或近似重复的片段沿用已有向量，
+            # 删除后又放回的片段直接撤销删除标记，都无需重新嵌入
+            old_ids = {rel: set(self.manifest.files.get(rel, {}).get("chunk_ids", [])) for rel, _ in changed}
+            dedup = ChunkDeduplicator(set(vs.index_to_docstore_id.values()).union(delta.ids), self.near_index)
+            append = {}
+            shared = set()
+            reused = 0
+            with tracer.span("dedup", chunks=sum(len(chunks) for _, _, chunks in file_chunks)) as dedup_span:
+                for rel, sha, chunks in file_chunks:
+                    if rel in self.loader.failed and not chunks:
+                        # 无法读取的文件不记入清单(旧片段随之过期)，下次更新时重试
+                        self.manifest.remove_file(rel)
+                        continue
+                    ids, fresh = dedup.assign(chunks)
+                    for chunk, i, is_fresh in zip(chunks, ids, fresh):
+                        if is_fresh:
+                            append[i] = chunk
+                        elif i in old_ids[rel]:
+                            reused += 1
+                        else:
+                            shared.add(i)
+                    self.manifest.set_file(rel, current_files[rel], sha, ids, [c.metadata.get("page") for c in chunks],
+                                           near_merged(chunks, ids))
+                dedup_span.set(exact=dedup.stats["exact"] - reused, near=dedup.stats["near"])
+            stats["duplicates_exact"] = dedup.stats["exact"] - reused
+            stats["duplicates_near"] = dedup.stats["near"]
+
+            referenced = set(self.manifest.all_chunk_ids())
+            dropped = removed_ids.difference(orphaned).union(*old_ids.values())
+            stale_ids = sorted(dropped.difference(referenced))
+            shared.update(dropped.intersection(referenced))
+            revived = sorted(i for i in referenced if i in tombstones)
+            append_ids = list(append)
+            append_chunks = list(append.values())
+            stats["chunks_removed"] = len(orphaned) + len(stale_ids)
+
+            report(40, f"计算 {len(append_chunks)} 个片段的向量...")
+            with tracer.span("embed", chunks=len(append_chunks)) as embed_span:
+                vectors = self.embed([c.page_content for c in append_chunks], stats) if append_chunks else []
+                embed_span.set(cache_hits=stats["cache_hits"], cache_misses=stats["cache_misses"])
+
+            # 先写片段正文，再提交增量段和删除标记，最后更新清单: 中途中断时清单与索引不一致，下次构建会自动重建
+            report(80, f"追加 {len(append_chunks)} 个片段...")
+            with tracer.span("delta_append", chunks=len(append_chunks), revived=len(revived)):
+                if append_chunks:
+                    vs.docstore.add(dict(zip(append_ids, append_chunks)))
+                    delta.append(append_ids, vectors)
+                if stale_ids:
+                    tombstones.add(stale_ids)
+                if revived:
+                    tombstones.discard(revived)
+            if self.lexical is not None:
+                with tracer.span("lexical_update"):
+                    self.lexical.delete(stale_ids)
+                    self.lexical.add(append_ids, [c.page_content for c in append_chunks])
+                    self.lexical.add(revived, [vs.docstore.search(i).page_content for i in revived])
+            self.refresh_sources(vs.docstore, sorted(shared))
+            if file_chunks or touched:
+                self.manifest.save()
+
+            total = len(vs.index_to_docstore_id) + len(delta)
+            stats["chunks_added"] = len(append_ids)
+            stats["chunks"] = total - len(tombstones)
+            stats["needs_compaction"] = needs_compaction(
+                len(tombstones), total, self.compact_ratio, self.compact_max_tombstones)
+            span.set(chunks_added=len(append_ids), chunks_removed=stats["chunks_removed"], revived=len(revived),
+                     duplicates=stats["duplicates_exact"] + stats["duplicates_near"],
+                     delta_chunks=len(delta), tombstones=len(tombstones))
+        report(100, f"已更新 {len(changed)} 个文档，移除 {len(removed)} 个文档")
+        return vs, stats
+
+    def _build(self, progress_callback=None):
+        def report(value, message):
+            if progress_callback:
+                progress_callback(value, message)
+
+        report(5, "扫描文档目录...")
+        current_files = self.scan()
+        if not current_files:
+            raise NoDocumentsError("未找到文档! 请将PDF/DOCX文件放入docs文件夹")
+
+        vs = self.load_existing()
+        changed, removed, touched = self.manifest.diff(self.docs_dir, current_files)
+        stats = {
+            "added": sum(1 for rel, _ in changed if rel not in self.manifest.files),
+            "updated": sum(1 for rel, _ in changed if rel in self.manifest.files),
+            "removed": len(removed),
+            "unchanged": len(current_files) - len(changed),
+            "chunks_added": 0,
+            "chunks_removed": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "embed_rate": 0.0,
+            "duplicates_exact": 0,
+            "duplicates_near": 0,
+            "failed": [],
+        }
+
+        for rel, meta in touched.items():
+            self.manifest.files[rel].update(meta)
+        if vs is None and self.lexical is not None:
+            self.lexical.reset()
+        self.sync_lexical(vs, report)
+
+        dead = list(tombstoned_ids(vs))
+        if vs is not None and not changed and not removed and not dead:
+            if touched:
+                self.manifest.save()
+            stored = vs.index_params.get("backend", "pickle")
+            if stored != self.store_backend:
+                # 文档未变化但存储格式已改(如pickle迁移到sqlite)，照样按新格式保存
+                report(90, f"转换索引存储格式 ({stored} → {self.store_backend})...")
+                with tracer.span("save", backend=self.store_backend, migrated_from=stored):
+                    save_vector_store(vs, self.store_dir, vs.index_params, self.store_backend, self.store_compress)
+                    self.manifest.save()
+                # 按新格式重新打开: sqlite后端为内存映射，之后的增量写入直接落到磁盘上的文档库
+                vs = load_vector_store(self.store_dir, self.embeddings)
+            report(100, f"索引已是最新 ({len(current_files)} 个文件未变化)")
+            stats["chunks"] = len(vs.index_to_docstore_id)
+            stats["index_type"] = vs.index_params["type"]
+            return vs, stats
+
+        # 近似重复片段失去了正文相同的出处(原文所在文件被删除或修改)时，引用它的文件一并重新入库，
+        # 旧片段随之成为过期片段，这些文件的片段改用自己的正文和向量
+        for rel in self.manifest.near_dependents(removed + [rel for rel, _ in changed]):
+            changed.append((rel, self.manifest.files[rel]["sha256"]))
+
+        # 已移除或已修改文件中不再被其他文件引用的旧片段，以及之前只打了删除标记的片段(压缩)
+        dropped = set()
+        for rel in removed:
+            dropped.update(self.manifest.remove_file(rel))
+        for rel, _ in changed:
+            dropped.update(self.manifest.remove_file(rel))
+        referenced = set(self.manifest.all_chunk_ids())
+        stale_ids = sorted(dropped.difference(referenced).union(dead))
+        # 仍被其他文件引用的片段保留，只需更新出处
+        shared = dropped.intersection(referenced)
+        stats["chunks_removed"] = len(stale_ids) if vs is not None else 0
+        if self.near_index is not None:
+            if vs is None:
+                self.near_index.reset()
+            elif stale_ids:
+                self.near_index.delete(stale_ids)
+
+        # 暴力索引先就地删除过期片段；HNSW/IVF不支持删除，稍后用其余向量重建
+        pending_stale = stale_ids
+        if vs is not None and stale_ids and vs.index_params["type"] == "flat":
+            report(8, f"移除 {len(stale_ids)} 个过期片段...")
+            vs.delete(stale_ids)
+            pending_stale = []
+        if self.lexical is not None and stale_ids:
+            self.lexical.delete(stale_ids)
+        docstore = vs.docstore if vs is not None else self.new_docstore()
+        known = set(vs.index_to_docstore_id.values()).difference(pending_stale) if vs is not None else set()
+        dedup = ChunkDeduplicator(known, self.near_index)
+
+        # 加载 → 切分 → 判重 → 嵌入 流水线，逐批写入文档库、词法索引和磁盘上的向量暂存文件
+        changed_rels = [rel for rel, _ in changed]
+        pipeline = IngestPipeline(self.loader.iter_load, self.split_segment, dedup.assign,
+                                  lambda texts: self.embed(texts, stats),
+                                  self.ingest_batch_size, self.ingest_queue_size)
+        VectorSpool.remove_leftovers(self.store_dir)
+        spool = VectorSpool(self.store_dir)
+        file_ids = {}
+        file_pages = {}
+        file_near = {}
+        new_ids = []
+        try:
+            with tracer.span("stream_ingest", files=len(changed)) as span, self.encoder.session():
+                for rels, chunks, ids, fresh, vectors in pipeline.run(changed_rels):
+                    fresh_ids = [i for i, is_fresh in zip(ids, fresh) if is_fresh]
+                    fresh_chunks = [c for c, is_fresh in zip(chunks, fresh) if is_fresh]
+                    if fresh_ids:
+                        docstore.add(dict(zip(fresh_ids, fresh_chunks)))
+                        spool.append(vectors)
+                        if self.lexical is not None:
+                            self.lexical.add(fresh_ids, [c.page_content for c in fresh_chunks])
+                    for rel, i, chunk, is_fresh in zip(rels, ids, chunks, fresh):
+                        file_ids.setdefault(rel, []).append(i)
+                        file_pages.setdefault(rel, []).append(chunk.metadata.get("page"))
+                        file_near.setdefault(rel, []).append(chunk_id(chunk.page_content) != i)
+                        if not is_fresh:
+                            shared.add(i)
+                    new_ids.extend(fresh_ids)
+                    report(10 + int(70 * len(file_ids) / len(changed)),
+                           f"已处理 {len(file_ids)}/{len(changed)} 个文件, {len(new_ids)} 个新片段, "
+                           f"{len(shared)} 个重复 ({self.encoder.last_rate:.1f} 片段/秒)")
+                stats["duplicates_exact"] = dedup.stats["exact"]
+                stats["duplicates_near"] = dedup.stats["near"]
+                span.set(chunks=pipeline.stats["chunks"], embedded=len(new_ids), batches=pipeline.stats["batches"],
+                         duplicates_exact=dedup.stats["exact"], duplicates_near=dedup.stats["near"],
+                         cache_hits=stats["cache_hits"], cache_misses=stats["cache_misses"])
+                # 各阶段在自己的线程中并行运行，分别记下忙碌时间
+                for name, key, attrs in (
+                        ("load_documents", "load_seconds", {"files": pipeline.stats["files"]}),
+                        ("split", "split_seconds", {"chunks": pipeline.stats["chunks"]}),
+                        ("dedup", "dedup_seconds", {"duplicates": dedup.stats["exact"] + dedup.stats["near"]}),
+                        ("embed", "embed_seconds", {"chunks": pipeline.stats["embedded"]})):
+                    tracer.add_span(name, pipeline.stats[key] * 1000, **attrs)
+
+            survivors = len(vs.index_to_docstore_id) - len(pending_stale) if vs is not None else 0
+            total = survivors + len(new_ids)
+            if total == 0:
+                raise NoDocumentsError("未能从文档中提取到文本! 请检查docs文件夹中的PDF/DOCX文件")
+
+            index_type = resolve_index_type(self.index_type, total)
+            if index_type != self.index_type and self.index_type != "auto":
+                print(f"片段数 {total} 不足以训练 {self.index_type} 索引，改用 {index_type}")
+            params = getattr(vs, "index_params", None)
+            # 索引类型不变且无需删除时直接追加；否则用已有向量重建(无需重新嵌入)
+            incremental = vs is not None and params["type"] == index_type and not pending_stale
+            with tracer.span("faiss_build", incremental=incremental, index_type=index_type):
+                vectors = spool.array()
+                if incremental:
+                    report(82, f"写入 {len(new_ids)} 个新片段...")
+                    for start in range(0, len(new_ids), INDEX_ADD_BATCH):
+                        add_vectors(vs, new_ids[start:start + INDEX_ADD_BATCH],
+                                    vectors[start:start + INDEX_ADD_BATCH])
+                else:
+                    report(82, f"构建 {index_type} 索引 ({total} 个片段)...")
+                    ids = list(new_ids)
+                    if vs is not None:
+                        ids += self.spool_survivors(vs, set(pending_stale), spool, stats)
+                        vectors = spool.array()
+                    dim = vs.index.d if vs is not None else spool.dim
+                    params = make_params(index_type, total, dim)
+                    if vs is not None:
+                        # 沿用旧版本号，保证sqlite后端写出新一代文件而不是覆盖正在被映射的文件
+                        params["generation"] = vs.index_params.get("generation", 0)
+                    index = build_index(vectors, params, batch_size=INDEX_ADD_BATCH)
+                    del vectors
+                    # 过期片段和(完整重建时)文档库中不属于新索引的旧行，保存新索引后删除
+                    obsolete = set(pending_stale) if vs is not None else set(getattr(docstore, "all_ids", list)())
+                    obsolete.difference_update(ids)
+                    if obsolete:
+                        docstore.delete(list(obsolete))
+                    vs = FAISS(embedding_function=self.embeddings, index=index, docstore=docstore,
+                               index_to_docstore_id=dict(enumerate(ids)))
+        finally:
+            spool.close()
+
+        if self.lexical is not None and survivors == 0:
+            with tracer.span("lexical_update"):
+                self.lexical.optimize()
+
+        stats["failed"] = sorted(self.loader.failed)
+        for rel, sha in changed:
+            ids = file_ids.get(rel, [])
+            if rel in self.loader.failed and not ids:
+                # 无法读取的文件不记入清单，下次更新时重试，而不是当作没有片段的文件跳过
+                continue
+            near = {i for i, is_near in zip(ids, file_near.get(rel, [])) if is_near}
+            near.difference_update(i for i, is_near in zip(ids, file_near.get(rel, [])) if not is_near)
+            self.manifest.set_file(rel, current_files[rel], sha, ids, file_pages.get(rel, []), near)
+        self.refresh_sources(docstore, sorted(shared))
+        stats["chunks_added"] = len(new_ids)
+        stats["index_type"] = params["type"]
+
+        report(90, "保存索引...")
+        with tracer.span("save", backend=self.store_backend):
+            params = save_vector_store(vs, self.store_dir, params, self.store_backend, self.store_compress)
+            self.manifest.save()
+
+        stats["chunks"] = len(vs.index_to_docstore_id)
+        return vs, stats
+
+
+class ShardedIndexBuilder:
+    """
+    按 docs 下的一级子文件夹分片建索引，每个分片是独立的 IndexBuilder 目录(索引、文档库、清单、词法索引)
+    只有文件发生变化或删除标记超过阈值的分片才会加载和重建，其余分片原样沿用
+    """
+
+    def __init__(self, embeddings, docs_dir, store_dir, **builder_kwargs):
+        self.embeddings = embeddings
+        self.docs_dir = Path(docs_dir)
+        self.store_dir = str(store_dir)
+        self.builder_kwargs = builder_kwargs
+        self.settings = split_settings(builder_kwargs.get("splitter", DEFAULT_SPLITTER),
+                                       builder_kwargs.get("chunk_size", DEFAULT_CHUNK_SIZE),
+                                       builder_kwargs.get("chunk_overlap", DEFAULT_CHUNK_OVERLAP))
+
+    def builder(self, shard):
+        return IndexBuilder(self.embeddings, self.docs_dir, shard_dir(self.store_dir, shard),
+                            shard=shard, **self.builder_kwargs)
+
+    def dirty_shards(self, current_files):
+        """
+        比较各分片的清单，返回 (有文件新增、修改或删除的分片名, 其中需要压缩的分片名, 按分片分组的文件)
+        """
+        by_shard = {}
+        for rel, st in current_files.items():
+            by_shard.setdefault(shard_of(rel), {})[rel] = st
+        dirty, compact = [], set()
+        ratio = self.builder_kwargs.get("compact_ratio", DEFAULT_COMPACT_RATIO)
+        backend = self.builder_kwargs.get("store_backend", "pickle")
+        max_tombstones = self.builder_kwargs.get("compact_max_tombstones", DEFAULT_COMPACT_MAX_TOMBSTONES)
+        for name in sorted(set(by_shard) | set(list_shards(self.store_dir))):
+            directory = shard_dir(self.store_dir, name)
+            manifest = IndexManifest(directory, self.settings).load()
+            changed, removed, touched = manifest.diff(self.docs_dir, by_shard.get(name, {}))
+            dead = tombstone_count(directory) if vector_store_exists(directory) else 0
+            if needs_compaction(dead, len(manifest.all_chunk_ids()) + dead, ratio, max_tombstones):
+                compact.add(name)
+            if read_params(directory).get("backend", "pickle") != backend:
+                # 存储格式与设置不同的分片也要重新构建保存(不能只追加增量段)
+                compact.add(name)
+            if changed or removed or name in compact or not vector_store_exists(directory):
+                dirty.append(name)
+            elif touched:
+                for rel, meta in touched.items():
+                    manifest.files[rel].update(meta)
+                manifest.save()
+        return dirty, compact, by_shard
+
+    def remove_shard(self, name):
+        # Windows下仍被映射的文件删不掉，残留的目录没有索引参数文件，不会再被当作分片加载
+        directory = shard_dir(self.store_dir, name)
+        for file_name in (INDEX_PARAMS_NAME, "index.faiss"):
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except OSError:
+                pass
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def update(self, vs=None, progress_callback=None, live=False):
+        """
+        重建有变化的分片并保存，返回 (分片向量库, 统计信息)
+        vs 为正在使用的分片向量库时沿用其中未变化的分片
+        live=True 时文件变化直接应用到分片的增量段和删除标记，只有需要压缩的分片才重建
+        """
+        with tracer.span("sharded_index_build") as span:
+            store, stats = self._update(vs, progress_callback, live)
+            span.set(**{key: stats.get(key) for key in (
+                "added", "updated", "removed", "chunks", "shards", "shards_updated")})
+        return store, stats
+
+    def _update(self, vs, progress_callback, live):
+        def report(value, message):
+            if progress_callback:
+                progress_callback(value, message)
+
+        report(2, "扫描文档目录...")
+        current_files = scan_documents(self.docs_dir)
+        if not current_files:
+            raise NoDocumentsError("未找到文档! 请将PDF/DOCX文件放入docs文件夹")
+        dirty, compact, by_shard = self.dirty_shards(current_files)
+
+        shards = dict(vs.shards) if isinstance(vs, ShardedVectorStore) else {}
+        clean = [name for name in list_shards(self.store_dir) if name not in dirty and name not in shards]
+        for name in clean:
+            shards[name] = load_vector_store(shard_dir(self.store_dir, name), self.embeddings)
+
+        stats = {"added": 0, "updated": 0, "removed": 0, "chunks_added": 0, "chunks_removed": 0,
+                 "cache_hits": 0, "cache_misses": 0, "embed_rate": 0.0, "shards_updated": len(dirty),
+                 "needs_compaction": False, "duplicates_exact": 0, "duplicates_near": 0, "failed": []}
+        for i, name in enumerate(dirty):
+            def shard_report(value, message, i=i, name=name):
+                report(5 + int(90 * (i + value / 100) / len(dirty)), f"[{name}] {message}")
+
+            if name not in by_shard:
+                # 整个子文件夹已删除
+                stats["removed"] += len(IndexManifest(shard_dir(self.store_dir, name)).load().files)
+                self.remove_shard(name)
+                shards.pop(name, None)
+                continue
+            builder = self.builder(name)
+            result = None
+            if live and name in shards and name not in compact:
+                result = builder.apply_live(shards[name], shard_report)
+            if result is None:
+                try:
+                    result = builder.build(progress_callback=shard_report)
+                except NoDocumentsError as e:
+                    print(f"分片 {name} 没有可索引的文本，已移除: {e}")
+                    self.remove_shard(name)
+                    shards.pop(name, None)
+                    continue
+            shards[name], shard_stats = result
+            for key in ("added", "updated", "removed", "chunks_added", "chunks_removed",
+                        "cache_hits", "cache_misses", "duplicates_exact", "duplicates_near"):
+                stats[key] += shard_stats.get(key, 0)
+            stats["embed_rate"] = shard_stats.get("embed_rate") or stats["embed_rate"]
+            stats["needs_compaction"] |= shard_stats.get("needs_compaction", False)
+            stats["failed"] += shard_stats.get("failed", [])
+
+        if not shards:
+            raise NoDocumentsError("未能从文档中提取到文本! 请检查docs文件夹中的PDF/DOCX文件")
+        store = ShardedVectorStore(self.embeddings, shards)
+        stats["unchanged"] = len(current_files) - stats["added"] - stats["updated"]
+        stats["shards"] = len(shards)
+        stats["chunks"] = sum(shard_size(shard) for shard in shards.values())
+        stats["index_type"] = "sharded"
+        report(100, f"索引已更新 ({stats['shards_updated']}/{stats['shards']} 个分片有变化)")
+        return store, stats
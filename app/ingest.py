@@ -0,0 +1,184 @@
+# app/ingest.py
+import os
+from collections import deque
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 单个任务最多处理的PDF页数，超出的大文件按页码区间拆给多个进程
+PDF_PAGES_PER_TASK = 50
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _pdf_page_count(path):
+    import fitz
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def _extract_pdf_pages(path, start, end):
+    """提取PDF的[start, end)页，元数据与PyMuPDFLoader保持一致"""
+    import fitz
+    pages = []
+    with fitz.open(path) as doc:
+        doc_meta = {k: v for k, v in (doc.metadata or {}).items() if isinstance(v, (str, int))}
+        for i in range(start, end):
+            page = doc[i]
+            pages.append((page.get_text(), dict(
+                doc_meta,
+                source=path,
+                file_path=path,
+                page=i,
+                total_pages=doc.page_count,
+            )))
+    return pages
+
+
+def _extract_docx(path):
+    import docx2txt
+    return [(docx2txt.process(path), {"source": path})]
+
+
+def _run_task(task):
+    """
+    工作进程入口: 只返回 (文本, 元数据) 元组
+    本模块不在顶层导入langchain，Document只在主进程合并结果时构造，子进程无需加载langchain
+    """
+    kind, path, start, end = task
+    if kind == "pdf":
+        return _extract_pdf_pages(path, start, end)
+    return _extract_docx(path)
+
+
+class ParallelLoader:
+    """
+    多进程加载PDF/DOCX，大型PDF按页码区间拆分，结果按文件和页码顺序合并
+    failed 记录最近一次加载中无法打开或读取的文件 {相对路径: 错误信息}
+    """
+
+    def __init__(self, docs_dir, max_workers=None, pages_per_task=PDF_PAGES_PER_TASK):
+        self.docs_dir = Path(docs_dir)
+        self.max_workers = max_workers or default_workers()
+        self.pages_per_task = pages_per_task
+        self.failed = {}
+
+    def fail(self, rel, message):
+        print(message)
+        self.failed.setdefault(rel, message)
+
+    def plan(self, rels):
+        """把文件拆成任务列表 [(相对路径, (类型, 绝对路径, 起始页, 结束页)), ...]"""
+        self.failed = {}
+        tasks = []
+        for rel in rels:
+            path = str(self.docs_dir / rel)
+            if rel.lower().endswith(".pdf"):
+                try:
+                    count = _pdf_page_count(path)
+                except Exception as e:
+                    self.fail(rel, f"PDF打开错误 {rel}: {e}")
+                    continue
+                for start in range(0, count, self.pages_per_task):
+                    tasks.append((rel, ("pdf", path, start, min(start + self.pages_per_task, count))))
+            else:
+                tasks.append((rel, ("docx", path, 0, 0)))
+        return tasks
+
+    def load(self, rels, progress_callback=None):
+        """
+        并行加载文件
+        返回 {相对路径: [Document, ...]}，键顺序与rels一致，页面按页码排列
+        progress_callback(已完成文件数, 文件总数, 相对路径) 在每个文件全部完成时调用
+        """
+        from langchain_core.documents import Document
+        rels = list(rels)
+        tasks = self.plan(rels)
+        pending = {}
+        for rel, _ in tasks:
+            pending[rel] = pending.get(rel, 0) + 1
+        parts = {rel: [] for rel in rels}
+        done_files = 0
+
+        def collect(rel, task, result):
+            nonlocal done_files
+            parts[rel].append((task[2], result))
+            pending[rel] -= 1
+            if pending[rel] == 0:
+                done_files += 1
+                if progress_callback:
+                    progress_callback(done_files, len(pending), rel)
+
+        if len(tasks) <= 1 or self.max_workers == 1:
+            for rel, task in tasks:
+                try:
+                    collect(rel, task, _run_task(task))
+                except Exception as e:
+                    self.fail(rel, f"文档加载错误 {rel}: {e}")
+                    collect(rel, task, [])
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as pool:
+                futures = {pool.submit(_run_task, task): (rel, task) for rel, task in tasks}
+                for future in as_completed(futures):
+                    rel, task = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.fail(rel, f"文档加载错误 {rel} (页 {task[2]}-{task[3]}): {e}")
+                        result = []
+                    collect(rel, task, result)
+
+        docs = {}
+        for rel in rels:
+            docs[rel] = [
+                Document(page_content=text, metadata=meta)
+                for _, result in sorted(parts[rel], key=lambda p: p[0])
+                for text, meta in result
+            ]
+        return docs
+
+    def iter_load(self, rels):
+        """
+        按文件和页码顺序逐段产出 (相对路径, [Document, ...], 是否为该文件最后一段)
+        多进程时同时在途的任务不超过 2*max_workers，先完成的任务等前面的任务产出后再产出
+        调用方处理完一段再取下一段，内存中只有少数几段页面
+        """
+        from langchain_core.documents import Document
+        tasks = self.plan(list(rels))
+        last = {rel: i for i, (rel, _) in enumerate(tasks)}
+
+        def documents(result):
+            return [Document(page_content=text, metadata=meta) for text, meta in result]
+
+        if len(tasks) <= 1 or self.max_workers == 1:
+            for i, (rel, task) in enumerate(tasks):
+                try:
+                    result = _run_task(task)
+                except Exception as e:
+                    self.fail(rel, f"文档加载错误 {rel}: {e}")
+                    result = []
+                yield rel, documents(result), last[rel] == i
+            return
+
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as pool:
+            upcoming = iter(enumerate(tasks))
+            pending = deque()
+
+            def submit():
+                item = next(upcoming, None)
+                if item is not None:
+                    i, (rel, task) = item
+                    pending.append((i, rel, task, pool.submit(_run_task, task)))
+
+            for _ in range(self.max_workers * 2):
+                submit()
+            while pending:
+                i, rel, task, future = pending.popleft()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.fail(rel, f"文档加载错误 {rel} (页 {task[2]}-{task[3]}): {e}")
+                    result = []
+                submit()
+                yield rel, documents(result), last[rel] == i
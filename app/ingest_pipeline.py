@@ -0,0 +1,190 @@
+# app/ingest_pipeline.py
+import os
+import time
+import queue
+import tempfile
+import threading
+
+import numpy as np
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+class IngestPipeline:
+    """
+    流式入库: 加载 → 切分 → 嵌入 各占一个线程，阶段之间用有界队列连接，调用方逐批写入索引
+    队列满时上游阻塞等待，内存中只有几段页面和几批片段，峰值内存与文档总量无关
+    load(文件列表) 逐段产出 (文件, 页面列表, 是否最后一段)
+    split(文件, 页面列表) 返回片段列表
+    assign(片段列表) 返回 (片段ID列表, 是否为新片段列表)，重复片段不再嵌入
+    embed(文本列表) 返回向量列表
+    stats 中的 *_seconds 为各阶段的忙碌时间，不含在队列上等待的时间
+    """
+
+    def __init__(self, load, split, assign, embed, batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE):
+        self.load = load
+        self.split = split
+        self.assign = assign
+        self.embed = embed
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.stats = {"files": 0, "chunks": 0, "embedded": 0, "batches": 0,
+                      "load_seconds": 0.0, "split_seconds": 0.0, "dedup_seconds": 0.0, "embed_seconds": 0.0}
+
+    def run(self, files):
+        """
+        逐批产出 (文件列表, 片段列表, 片段ID列表, 是否为新片段列表, 向量列表)
+        前四个列表一一对应，向量只对应其中的新片段
+        """
+        stop = threading.Event()
+        errors = []
+        pages = queue.Queue(self.queue_size)
+        chunks = queue.Queue(self.queue_size)
+        embedded = queue.Queue(self.queue_size)
+
+        def put(q, item):
+            # 下游已停止时放弃，不让上游永远阻塞在满队列上
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def drain(q):
+            while True:
+                try:
+                    item = q.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set():
+                        return
+                    continue
+                if item is _DONE:
+                    return
+                yield item
+
+        def timed(stage, func, *args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.stats[f"{stage}_seconds"] += time.perf_counter() - start
+
+        def load_stage():
+            items = iter(self.load(files))
+            while True:
+                item = timed("load", next, items, _DONE)
+                if item is _DONE or not put(pages, item):
+                    return
+
+        def split_stage():
+            batch = []
+            for rel, docs, is_last in drain(pages):
+                file_chunks = timed("split", self.split, rel, docs)
+                ids, fresh = timed("dedup", self.assign, file_chunks)
+                if is_last:
+                    self.stats["files"] += 1
+                batch.extend(zip([rel] * len(file_chunks), file_chunks, ids, fresh))
+                while len(batch) >= self.batch_size:
+                    if not put(chunks, batch[:self.batch_size]):
+                        return
+                    del batch[:self.batch_size]
+            if batch:
+                put(chunks, batch)
+
+        def embed_stage():
+            for batch in drain(chunks):
+                texts = [chunk.page_content for _, chunk, _, is_fresh in batch if is_fresh]
+                vectors = timed("embed", self.embed, texts) if texts else []
+                if not put(embedded, (batch, vectors)):
+                    return
+
+        def start(body, output):
+            def runner():
+                try:
+                    body()
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+                finally:
+                    if output is not None:
+                        put(output, _DONE)
+            thread = threading.Thread(target=runner, daemon=True)
+            thread.start()
+            return thread
+
+        threads = [start(load_stage, pages), start(split_stage, chunks), start(embed_stage, embedded)]
+        try:
+            for batch, vectors in drain(embedded):
+                self.stats["chunks"] += len(batch)
+                self.stats["embedded"] += len(vectors)
+                self.stats["batches"] += 1
+                rels, batch_chunks, ids, fresh = (list(column) for column in zip(*batch))
+                yield rels, batch_chunks, ids, fresh, vectors
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+
+class VectorSpool:
+    """
+    构建索引期间把向量顺序写入磁盘临时文件，不在内存中累积
+    写完后以内存映射方式读取，交给FAISS按批写入或抽样训练
+    """
+
+    PREFIX = "spool-"
+
+    @classmethod
+    def remove_leftovers(cls, directory):
+        """清理上次构建中断时留下的暂存文件"""
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.startswith(cls.PREFIX) and name.endswith(".f32"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix=self.PREFIX, suffix=".f32", dir=directory)
+        self.file = os.fdopen(fd, "wb")
+        self.dim = None
+        self.count = 0
+        self._array = None
+
+    def append(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not vectors.size:
+            return
+        vectors = vectors.reshape(len(vectors), -1)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        vectors.tofile(self.file)
+        self.count += len(vectors)
+
+    def array(self):
+        """全部向量的只读内存映射 (count, dim)"""
+        self.file.flush()
+        if not self.count:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        if self._array is None or len(self._array) != self.count:
+            self._array = np.memmap(self.path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        return self._array
+
+    def close(self):
+        self.file.close()
+        # Windows下映射未释放时无法删除文件
+        self._array = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
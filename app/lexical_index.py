@@ -0,0 +1,125 @@
+# app/lexical_index.py
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+LEXICAL_INDEX_NAME = "lexical.sqlite"
+
+# 中文按字二元组切分；字母数字串(含条款号中的点和横线)整体保留，同时拆出各段
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+# 查询最多使用的词项数；片段数超过 STOPWORD_MIN_CHUNKS 时，文档频率超过该比例的词视为停用词
+MAX_QUERY_TERMS = 32
+STOPWORD_DF_RATIO = 0.2
+STOPWORD_MIN_CHUNKS = 1000
+
+
+def tokenize(text):
+    text = text.lower()
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    for word in _WORD.findall(text):
+        tokens.append(word)
+        parts = re.split(r"[.\-]", word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    基于SQLite FTS5的倒排索引，文本预先切成中文二元组和字母数字词，BM25排序
+    与向量索引使用同一套片段ID，随索引构建增量增删
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self.conn
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5("
+            "tokens, tokenize=\"unicode61 tokenchars '.-'\")"
+        )
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS fts_vocab USING fts5vocab(fts, 'row')")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_rows ("
+            " chunk_id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE)"
+        )
+        conn.commit()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM chunk_rows").fetchone()[0]
+
+    def add(self, ids, texts):
+        conn = self.conn
+        for chunk_id, text in zip(ids, texts):
+            cursor = conn.execute("INSERT INTO fts(tokens) VALUES (?)", (" ".join(tokenize(text)),))
+            conn.execute("INSERT OR REPLACE INTO chunk_rows VALUES (?, ?)", (chunk_id, cursor.lastrowid))
+        conn.commit()
+
+    def delete(self, ids):
+        conn = self.conn
+        for chunk_id in ids:
+            row = conn.execute("SELECT row FROM chunk_rows WHERE chunk_id=?", (chunk_id,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM fts WHERE rowid=?", row)
+                conn.execute("DELETE FROM chunk_rows WHERE chunk_id=?", (chunk_id,))
+        conn.commit()
+
+    def reset(self):
+        conn = self.conn
+        conn.execute("DELETE FROM fts")
+        conn.execute("DELETE FROM chunk_rows")
+        conn.commit()
+
+    def optimize(self):
+        """合并FTS5的段，大批量写入后调用可减小体积、加快查询"""
+        self.conn.execute("INSERT INTO fts(fts) VALUES ('optimize')")
+        self.conn.commit()
+
+    def query_terms(self, query):
+        """去重后按文档频率从低到高取查询词，过滤掉出现过于普遍的词"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        df = {}
+        for term in terms:
+            # fts5vocab 只对 term= 约束走索引，逐个查询
+            row = self.conn.execute("SELECT doc FROM fts_vocab WHERE term=?", (term,)).fetchone()
+            df[term] = row[0] if row else 0
+        total = len(self)
+        limit = total * STOPWORD_DF_RATIO if total > STOPWORD_MIN_CHUNKS else total
+        terms = [t for t in terms if 0 < df[t] <= limit]
+        terms.sort(key=lambda t: df[t])
+        return terms[:MAX_QUERY_TERMS]
+
+    def search(self, query, k):
+        """返回 [(片段ID, BM25分数), ...]，分数越大越相关"""
+        terms = self.query_terms(query)
+        if not terms:
+            return []
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        rows = self.conn.execute(
+            "SELECT chunk_rows.chunk_id, -bm25(fts) AS score FROM fts"
+            " JOIN chunk_rows ON chunk_rows.row = fts.rowid"
+            " WHERE fts MATCH ? ORDER BY bm25(fts) LIMIT ?",
+            (match, k),
+        ).fetchall()
+        return [(chunk_id, float(score)) for chunk_id, score in rows]
@@ -0,0 +1,129 @@
+# app/model_loading.py
+import time
+
+import torch
+
+from .tracing import tracer
+
+# 生成参数，文本生成管道和服务端批量生成共用
+GENERATION_KWARGS = {
+    "max_new_tokens": 1024,
+    "temperature": 0.2,
+    "top_p": 0.8,
+    "do_sample": True,
+}
+
+
+def detect_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class StageTimer:
+    """记录各加载阶段耗时"""
+
+    def __init__(self, callback=None):
+        self.timings = {}
+        self.callback = callback
+
+    def run(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        with tracer.span(name):
+            result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        self.timings[name] = elapsed
+        if self.callback:
+            self.callback(name, elapsed)
+        return result
+
+
+def load_embeddings(embedding_path, device=None):
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    # 使用本地文件
+    return HuggingFaceEmbeddings(
+        model_name=embedding_path,
+        model_kwargs={"device": device or detect_device()},
+        cache_folder=embedding_path,
+        local_files_only=True
+    )
+
+
+def load_tokenizer(model_path):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(
+        model_path,
+        trust_remote_code=True,
+        local_files_only=True
+    )
+
+
+def load_model(model_path, device=None, quantization="none", quant_cache_dir=None):
+    """
+    加载ChatGLM模型
+    quantization 为 int8 / int4 时仅在CPU上生效，量化后的模型缓存在 quant_cache_dir 中
+    """
+    from transformers import AutoModel
+    device = torch.device(device or detect_device())
+
+    def load_float_model():
+        return AutoModel.from_pretrained(
+            model_path,
+            trust_remote_code=True,
+            torch_dtype=torch.float16 if device.type == "cuda" else torch.float32,
+            local_files_only=True
+        ).to(device).eval()
+
+    def build_empty_model():
+        # 只构建模型结构，参数放在 meta 设备上不占内存；ChatGLM 的 device 参数让其内部 skip_init 也留在 meta 上
+        from transformers import AutoConfig
+        config = AutoConfig.from_pretrained(model_path, trust_remote_code=True, local_files_only=True)
+        with torch.device("meta"):
+            return AutoModel.from_config(config, trust_remote_code=True, torch_dtype=torch.float32, device="meta")
+
+    if quantization != "none":
+        if device.type == "cuda":
+            print(f"GPU环境使用float16，忽略CPU量化设置: {quantization}")
+        else:
+            from .quantization import load_quantized_model
+            return load_quantized_model(model_path, quantization, quant_cache_dir, load_float_model,
+                                        build_empty_model)
+    return load_float_model()
+
+
+def create_llm(model, tokenizer, device=None):
+    from transformers import pipeline
+    from langchain_community.llms import HuggingFacePipeline
+    device = device or detect_device()
+    pipe = pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        device=0 if device == "cuda" else -1,
+        **GENERATION_KWARGS,
+    )
+    return HuggingFacePipeline(pipeline=pipe)
+
+
+def warm_up(llm, prompt="你好", max_new_tokens=8):
+    """执行一次很短的生成，提前完成内核初始化和内存分配，避免第一个真实问题变慢"""
+    llm.pipeline(prompt, max_new_tokens=max_new_tokens, return_full_text=False)
+
+
+def load_llm(model_path, device=None, warmup=True, timer=None, progress_callback=None,
+             quantization="none", quant_cache_dir=None):
+    """依次加载tokenizer、模型和生成管道，可选预热"""
+    timer = timer or StageTimer()
+
+    def report(value, message):
+        if progress_callback:
+            progress_callback(value, message)
+
+    report(10, "加载ChatGLM Tokenizer...")
+    tokenizer = timer.run("tokenizer", load_tokenizer, model_path)
+    report(30, "加载ChatGLM模型..." if quantization == "none" else f"加载ChatGLM模型 ({quantization})...")
+    model = timer.run("llm_weights", load_model, model_path, device, quantization, quant_cache_dir)
+    report(80, "创建文本生成管道...")
+    llm = timer.run("pipeline", create_llm, model, tokenizer, device)
+    if warmup:
+        report(90, "预热生成模型...")
+        timer.run("warmup", warm_up, llm)
+    return llm
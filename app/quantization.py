@@ -0,0 +1,182 @@
+# app/quantization.py
+import os
+import hashlib
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+QUANT_MODES = ("none", "int8", "int4")
+INT4_GROUP_SIZE = 128
+# 前向时每次只反量化这么多个权重(约16MB float32)，临时内存与层的大小无关
+INT4_BLOCK_ELEMENTS = 1 << 22
+# 不做int4量化的层: ChatGLM3的输出层(4096×65024)每个token都要整层参与计算，量化误差也直接落在词表分布上
+INT4_SKIP_MODULES = ("output_layer", "lm_head")
+# 量化方式或缓存格式改变后旧缓存失效
+QUANT_CACHE_VERSION = 3
+
+
+class Int4Linear(nn.Module):
+    """
+    仅权重int4量化的线性层: 每 group_size 个输入通道共用一个缩放系数，
+    两个4bit权重打包进一个uint8，前向时按输出通道分块反量化为float32再做矩阵乘
+    """
+
+    def __init__(self, in_features, out_features, bias=True, group_size=INT4_GROUP_SIZE):
+        super().__init__()
+        # 两个权重打包进一个字节，输入通道数必须为偶数(奇数的层由 quantize_model 保留为float32)
+        if in_features % group_size:
+            group_size = in_features
+        self.in_features = in_features
+        self.out_features = out_features
+        self.group_size = group_size
+        self.register_buffer("qweight", torch.zeros(out_features, in_features // 2, dtype=torch.uint8))
+        self.register_buffer("scales", torch.zeros(out_features, in_features // group_size, dtype=torch.float16))
+        if bias:
+            self.register_buffer("bias", torch.zeros(out_features, dtype=torch.float32))
+        else:
+            self.bias = None
+
+    @classmethod
+    def from_linear(cls, linear, group_size=INT4_GROUP_SIZE):
+        layer = cls(linear.in_features, linear.out_features, linear.bias is not None, group_size)
+        weight = linear.weight.detach().float()
+        grouped = weight.reshape(layer.out_features, -1, layer.group_size)
+        scales = grouped.abs().amax(dim=-1).clamp(min=1e-8) / 7
+        q = torch.round(grouped / scales[..., None]).clamp(-8, 7).to(torch.int16) + 8
+        q = q.reshape(layer.out_features, -1).to(torch.uint8)
+        layer.qweight.copy_(q[:, 0::2] | (q[:, 1::2] << 4))
+        layer.scales.copy_(scales.to(torch.float16))
+        if linear.bias is not None:
+            layer.bias.copy_(linear.bias.detach().float())
+        return layer
+
+    def dequantize(self, start=0, stop=None):
+        """反量化第 start 到 stop 个输出通道的权重"""
+        qweight = self.qweight[start:stop]
+        rows = qweight.shape[0]
+        low = (qweight & 0x0F).to(torch.int8) - 8
+        high = (qweight >> 4).to(torch.int8) - 8
+        q = torch.stack((low, high), dim=-1).reshape(rows, -1, self.group_size)
+        return (q.float() * self.scales[start:stop].float()[..., None]).reshape(rows, self.in_features)
+
+    def forward(self, x):
+        dtype = x.dtype
+        x = x.float()
+        step = max(1, INT4_BLOCK_ELEMENTS // self.in_features)
+        if step >= self.out_features:
+            return F.linear(x, self.dequantize(), self.bias).to(dtype)
+        out = torch.cat([F.linear(x, self.dequantize(start, start + step))
+                         for start in range(0, self.out_features, step)], dim=-1)
+        if self.bias is not None:
+            out += self.bias
+        return out.to(dtype)
+
+
+def _replace_linear(module, factory, skip=()):
+    """factory 返回原层时表示该层不替换"""
+    for name, child in module.named_children():
+        if name in skip:
+            continue
+        if isinstance(child, nn.Linear):
+            setattr(module, name, factory(child))
+        else:
+            _replace_linear(child, factory, skip)
+
+
+def _int4_linear(linear):
+    if linear.in_features % 2:
+        return linear
+    return Int4Linear.from_linear(linear)
+
+
+def _empty_int4_linear(linear):
+    if linear.in_features % 2:
+        return linear
+    return Int4Linear(linear.in_features, linear.out_features, linear.bias is not None)
+
+
+def _empty_int8_linear(linear):
+    # 与 quantize_dynamic 一致: 只替换类型恰好是 nn.Linear 的层
+    if type(linear) is not nn.Linear:
+        return linear
+    return torch.ao.nn.quantized.dynamic.Linear(
+        linear.in_features, linear.out_features, bias_=linear.bias is not None, dtype=torch.qint8)
+
+
+def quantize_model(model, mode):
+    """
+    把模型中的nn.Linear替换为int8动态量化层或int4仅权重量化层(输出层和输入通道数为奇数的层除外)
+    原地替换，不复制一份float32模型，首次量化时的内存峰值不超过原模型
+    """
+    if mode == "int8":
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    if mode == "int4":
+        _replace_linear(model, _int4_linear, INT4_SKIP_MODULES)
+        return model
+    raise ValueError(f"未知的量化模式: {mode}")
+
+
+def _empty_quantized_model(model, mode):
+    """把 meta 设备上的模型骨架换成与 quantize_model 结果相同结构的空模型，等待加载权重"""
+    if mode == "int8":
+        _replace_linear(model, _empty_int8_linear)
+    elif mode == "int4":
+        _replace_linear(model, _empty_int4_linear, INT4_SKIP_MODULES)
+    else:
+        raise ValueError(f"未知的量化模式: {mode}")
+    return model.to_empty(device="cpu")
+
+
+def model_fingerprint(model_path):
+    """权重文件名、大小和修改时间的哈希，模型文件更新后量化缓存自动失效"""
+    h = hashlib.sha256(f"v{QUANT_CACHE_VERSION}".encode("utf-8"))
+    for path in sorted(Path(model_path).iterdir()):
+        if path.suffix in (".bin", ".safetensors", ".json", ".py"):
+            st = path.stat()
+            h.update(f"{path.name}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def quantized_cache_path(cache_dir, model_path, mode):
+    return Path(cache_dir) / f"{Path(model_path).name}-{mode}-{model_fingerprint(model_path)}.pt"
+
+
+def load_quantized_model(model_path, mode, cache_dir, load_float_model, build_empty_model):
+    """
+    读取量化缓存；首次使用时加载float32模型、量化并写入缓存
+    缓存只保存 state_dict，用 weights_only=True 读取，不执行缓存文件中的任何代码;
+    build_empty_model 在 meta 设备上构建模型结构(不分配权重内存)，替换为量化层后再加载权重
+    """
+    cache_path = quantized_cache_path(cache_dir, model_path, mode)
+    if cache_path.exists():
+        try:
+            state_dict = torch.load(cache_path, map_location="cpu", weights_only=True)
+            model = _empty_quantized_model(build_empty_model(), mode)
+            model.load_state_dict(state_dict)
+            return model.eval()
+        except Exception as e:
+            print(f"量化缓存读取失败，重新量化: {e}")
+
+    model = quantize_model(load_float_model(), mode).eval()
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, cache_path)
+    # 清理同一模型其他版本的旧缓存
+    for old in cache_path.parent.glob(f"{Path(model_path).name}-{mode}-*.pt"):
+        if old != cache_path:
+            old.unlink(missing_ok=True)
+    return model
+
+
+def model_size_bytes(model):
+    """模型权重占用的字节数(包括int8打包参数)"""
+    total = 0
+    for value in model.state_dict().values():
+        tensors = value if isinstance(value, (tuple, list)) else (value,)
+        for t in tensors:
+            if isinstance(t, torch.Tensor):
+                total += t.numel() * t.element_size()
+    return total
@@ -0,0 +1,408 @@
+# app/query_service.py
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import (
+    SERVICE_HOST, SERVICE_PORT, SERVICE_MAX_PENDING, SERVICE_MAX_BATCH, SERVICE_BATCH_WINDOW_MS,
+    LLM_QUANTIZATION, SERVICE_ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY,
+)
+from .generation import build_prompt, document_sources, generate_batch
+from .batch_query import percentile
+
+MAX_BODY_BYTES = 64 * 1024
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class GenerationJob:
+    def __init__(self, prompt, loop):
+        self.prompt = prompt
+        self.loop = loop
+        self.events = asyncio.Queue()
+        self.cancelled = False
+
+    def send(self, *event):
+        """可在生成线程中调用"""
+        self.loop.call_soon_threadsafe(self.events.put_nowait, event)
+
+
+class MicroBatcher:
+    """
+    把同时到达的生成请求合并成一批，共享一次 model.generate 的前向计算
+    第一个请求到达后最多再等 window_ms 凑批；生成在单独的线程中串行执行，不阻塞事件循环
+    """
+
+    def __init__(self, pipe, generation_kwargs, max_batch=SERVICE_MAX_BATCH,
+                 window_ms=SERVICE_BATCH_WINDOW_MS, metrics=None):
+        self.pipe = pipe
+        self.generation_kwargs = generation_kwargs
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.metrics = metrics
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generate")
+
+    def submit(self, job):
+        self.queue.put_nowait(job)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # 等待期间断开的客户端不再占用生成资源
+            batch = [job for job in batch if not job.cancelled]
+            if not batch:
+                continue
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch))
+            await loop.run_in_executor(self.executor, self.generate, batch)
+
+    def generate(self, batch):
+        done = set()
+
+        def finish(row, result):
+            # 该行答案已完整，立即返回给客户端；同批其余行继续生成
+            done.add(row)
+            batch[row].send("done", result["text"], result["tokens"])
+
+        try:
+            # 客户端断开后该行不再输出，整批都已结束或断开时提前停止生成
+            generate_batch(self.pipe, [job.prompt for job in batch], self.generation_kwargs,
+                           lambda row, text: batch[row].send("token", text), finish,
+                           lambda row: batch[row].cancelled)
+        except Exception as e:
+            for row, job in enumerate(batch):
+                if row not in done and not job.cancelled:
+                    job.send("error", f"生成失败: {e}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class ServiceMetrics:
+    """服务运行指标，只在事件循环线程中更新"""
+
+    def __init__(self, window=1000, rate_window_seconds=60):
+        self.started = time.time()
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.tokens_total = 0
+        self.latencies = deque(maxlen=window)
+        self.first_token = deque(maxlen=window)
+        self.rate_window = rate_window_seconds
+        self.token_events = deque()
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batched_requests += size
+
+    def record_tokens(self, count):
+        now = time.monotonic()
+        self.tokens_total += count
+        self.token_events.append((now, count))
+
+    def tokens_per_second(self):
+        now = time.monotonic()
+        while self.token_events and now - self.token_events[0][0] > self.rate_window:
+            self.token_events.popleft()
+        if not self.token_events:
+            return 0.0
+        span = max(now - self.token_events[0][0], 1.0)
+        return sum(count for _, count in self.token_events) / span
+
+    def snapshot(self, **extra):
+        latencies = list(self.latencies)
+        first_token = list(self.first_token)
+        data = {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "cache_hits": self.cache_hits,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+            "tokens_total": self.tokens_total,
+            "tokens_per_second": round(self.tokens_per_second(), 2),
+            "latency_p50_ms": round(percentile(latencies, 50), 1),
+            "latency_p95_ms": round(percentile(latencies, 95), 1),
+            "latency_p99_ms": round(percentile(latencies, 99), 1),
+            "first_token_p50_ms": round(percentile(first_token, 50), 1),
+            "first_token_p95_ms": round(percentile(first_token, 95), 1),
+        }
+        data.update(extra)
+        return data
+
+
+class QueryService:
+    """
+    基于asyncio的本地HTTP问答服务
+    GET  /health       服务状态和队列深度
+    GET  /metrics      吞吐、延迟分位数等运行指标
+    POST /ask          {"question": ...} → {"answer", "sources", "from_cache", "latency_ms"}
+    POST /ask/stream   同上，以NDJSON逐行返回 {"type": "token"|"done"|"error", ...}
+    同时受理的请求超过 max_pending 时直接返回503，客户端稍后重试
+    """
+
+    def __init__(self, qa, answer_cache=None, max_pending=SERVICE_MAX_PENDING,
+                 max_batch=SERVICE_MAX_BATCH, batch_window_ms=SERVICE_BATCH_WINDOW_MS,
+                 retrieval_workers=4):
+        from .model_loading import GENERATION_KWARGS
+
+        self.qa = qa
+        self.answer_cache = answer_cache
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.metrics = ServiceMetrics()
+        self.batcher = MicroBatcher(
+            qa.combine_documents_chain.llm_chain.llm.pipeline, GENERATION_KWARGS,
+            max_batch, batch_window_ms, self.metrics,
+        )
+        self.retrieval_executor = ThreadPoolExecutor(
+            max_workers=retrieval_workers, thread_name_prefix="retrieve"
+        )
+
+    def prepare(self, question):
+        """检索、组装提示词(在线程池中执行)"""
+        docs = self.qa.retriever.invoke(question)
+        return build_prompt(self.qa, question, docs), document_sources(docs)
+
+    async def answer_events(self, question):
+        """依次产出 ("token", 文本) ... ("done", 结果字典) 或 ("error", 信息)"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        if self.answer_cache is not None:
+            cached = await loop.run_in_executor(self.retrieval_executor, self.answer_cache.lookup, question)
+            if cached is not None:
+                answer, sources = cached
+                self.metrics.cache_hits += 1
+                yield "token", answer
+                yield "done", {"answer": answer, "sources": sources, "from_cache": True,
+                               "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+                return
+
+        try:
+            prompt, sources = await loop.run_in_executor(self.retrieval_executor, self.prepare, question)
+        except Exception as e:
+            self.metrics.errors += 1
+            yield "error", f"检索失败: {e}"
+            return
+        job = GenerationJob(prompt, loop)
+        self.batcher.submit(job)
+        first_token_at = None
+        try:
+            while True:
+                event = await job.events.get()
+                if event[0] == "token":
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        self.metrics.first_token.append((first_token_at - start) * 1000)
+                    yield event
+                elif event[0] == "done":
+                    _, answer, tokens = event
+                    self.metrics.record_tokens(tokens)
+                    latency = (time.perf_counter() - start) * 1000
+                    self.metrics.latencies.append(latency)
+                    if self.answer_cache is not None:
+                        await loop.run_in_executor(
+                            self.retrieval_executor, self.answer_cache.put, question, answer, sources
+                        )
+                    yield "done", {"answer": answer, "sources": sources, "from_cache": False,
+                                   "latency_ms": round(latency, 1)}
+                    return
+                else:
+                    self.metrics.errors += 1
+                    yield event
+                    return
+        finally:
+            job.cancelled = True
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_BYTES:
+                await self.send_json(writer, 413, {"error": "请求体过大"})
+                return
+            body = await reader.readexactly(length) if length else b""
+            await self.dispatch(method, path.split("?", 1)[0], body, writer)
+        except (ValueError, asyncio.IncompleteReadError):
+            await self.send_json(writer, 400, {"error": "无法解析的请求"})
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            print(f"处理请求失败: {e}")
+            await self.send_json(writer, 500, {"error": str(e)})
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def dispatch(self, method, path, body, writer):
+        if path == "/health":
+            await self.send_json(writer, 200, {
+                "status": "ok", "queue_depth": self.batcher.queue.qsize(), "in_flight": self.in_flight,
+            })
+            return
+        if path == "/metrics":
+            await self.send_json(writer, 200, self.metrics.snapshot(
+                queue_depth=self.batcher.queue.qsize(), in_flight=self.in_flight,
+                max_pending=self.max_pending, max_batch=self.batcher.max_batch,
+            ))
+            return
+        if path not in ("/ask", "/ask/stream"):
+            await self.send_json(writer, 404, {"error": "未知路径"})
+            return
+        if method != "POST":
+            await self.send_json(writer, 405, {"error": "只支持POST"})
+            return
+
+        question = str(json.loads(body.decode("utf-8") or "{}").get("question", "")).strip()
+        if not question:
+            await self.send_json(writer, 400, {"error": "缺少question"})
+            return
+        if self.in_flight >= self.max_pending:
+            self.metrics.rejected += 1
+            await self.send_json(writer, 503, {"error": "服务繁忙，请稍后重试"}, {"Retry-After": "2"})
+            return
+
+        self.in_flight += 1
+        self.metrics.requests += 1
+        try:
+            if path == "/ask":
+                await self.respond(question, writer)
+            else:
+                await self.respond_stream(question, writer)
+        finally:
+            self.in_flight -= 1
+
+    async def respond(self, question, writer):
+        events = self.answer_events(question)
+        try:
+            async for kind, payload in events:
+                if kind == "done":
+                    await self.send_json(writer, 200, payload)
+                elif kind == "error":
+                    await self.send_json(writer, 500, {"error": payload})
+        finally:
+            await events.aclose()
+
+    async def respond_stream(self, question, writer):
+        writer.write(self.head(200, "application/x-ndjson", {"Transfer-Encoding": "chunked"}))
+        events = self.answer_events(question)
+        try:
+            async for kind, payload in events:
+                if kind == "token":
+                    line = {"type": "token", "text": payload}
+                elif kind == "done":
+                    line = dict(payload, type="done")
+                else:
+                    line = {"type": "error", "message": payload}
+                data = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+                writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                # 客户端断开时 drain 抛出 ConnectionError，关闭事件流后排队中的生成任务被跳过
+                await writer.drain()
+        finally:
+            await events.aclose()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def head(status, content_type, extra_headers=None, length=None):
+        lines = [f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}",
+                 f"Content-Type: {content_type}; charset=utf-8", "Connection: close"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        for name, value in (extra_headers or {}).items():
+            lines.append(f"{name}: {value}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def send_json(self, writer, status, payload, extra_headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(self.head(status, "application/json", extra_headers, len(data)) + data)
+        await writer.drain()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        batcher_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"问答服务已启动: http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+            self.batcher.shutdown()
+            self.retrieval_executor.shutdown(wait=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地HTTP问答服务，多个桌面客户端共用一份模型")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--max-pending", type=int, default=SERVICE_MAX_PENDING, help="同时受理的请求上限")
+    parser.add_argument("--max-batch", type=int, default=SERVICE_MAX_BATCH, help="合并到一次生成的最多请求数")
+    parser.add_argument("--batch-window-ms", type=int, default=SERVICE_BATCH_WINDOW_MS, help="凑批最长等待时间")
+    parser.add_argument("--quantization", default=LLM_QUANTIZATION, choices=["none", "int8", "int4"])
+    parser.add_argument("--no-answer-cache", action="store_true", help="不使用问答缓存")
+    args = parser.parse_args(argv)
+
+    from .model_loading import StageTimer
+    from .rag_pipeline import load_components
+    from .vector_index import index_build_id
+
+    timer = StageTimer(lambda name, elapsed: print(f"加载 {name}: {elapsed:.2f}s"))
+    try:
+        embeddings, vector_store, _, qa = load_components(quantization=args.quantization, timer=timer)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    qa.retriever.builder.log = False
+
+    answer_cache = None
+    if not args.no_answer_cache:
+        from .answer_cache import AnswerCache
+        try:
+            answer_cache = AnswerCache(
+                SERVICE_ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY, embeddings
+            )
+            answer_cache.set_generation(index_build_id(vector_store))
+        except Exception as e:
+            print(f"问答缓存不可用: {e}")
+
+    service = QueryService(qa, answer_cache, args.max_pending, args.max_batch, args.batch_window_ms)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("问答服务已停止")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
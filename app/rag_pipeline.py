@@ -0,0 +1,56 @@
+# app/rag_pipeline.py
+from langchain.chains import RetrievalQA
+
+from .config import (
+    MODEL_PATH, EMBEDDING_PATH, VECTOR_STORE_PATH, LLM_QUANTIZATION, QUANTIZED_MODEL_DIR,
+    RETRIEVAL_K, RETRIEVAL_CACHE_ENTRIES, HYBRID_RETRIEVAL, HYBRID_ALPHA, CONTEXT_TOKEN_BUDGET,
+)
+from .retrievers import CachingRetriever, ContextBudgetRetriever, HybridRetriever, RetrievalCache
+from .context_builder import ContextBuilder
+from .sharded_store import open_lexical_index
+from .vector_index import index_build_id
+
+
+def create_retriever(vector_store, retrieval_cache, store_dir=VECTOR_STORE_PATH, k=RETRIEVAL_K):
+    """所有检索都经过带缓存的检索器，索引变化时缓存自动清空"""
+    retrieval_cache.set_generation(index_build_id(vector_store))
+    lexical = open_lexical_index(store_dir) if HYBRID_RETRIEVAL else None
+    if lexical is not None:
+        return HybridRetriever(
+            vectorstore=vector_store, cache=retrieval_cache, k=k,
+            lexical=lexical, alpha=HYBRID_ALPHA,
+        )
+    return CachingRetriever(vectorstore=vector_store, cache=retrieval_cache, k=k)
+
+
+def create_qa(llm, retriever, token_budget=CONTEXT_TOKEN_BUDGET):
+    """在检索器外加上下文预算裁剪，创建stuff方式的问答链"""
+    budget_retriever = ContextBudgetRetriever(
+        base=retriever,
+        builder=ContextBuilder(llm.pipeline.tokenizer, token_budget),
+    )
+    return RetrievalQA.from_chain_type(llm=llm, retriever=budget_retriever)
+
+
+def load_components(load_model=True, k=RETRIEVAL_K, quantization=LLM_QUANTIZATION, timer=None):
+    """
+    不依赖界面加载嵌入模型、向量库和大模型，供命令行和服务端使用
+    返回 (embeddings, vector_store, retriever, qa)；索引不存在时抛出 FileNotFoundError
+    """
+    from .model_loading import StageTimer, load_embeddings, load_llm
+    from .sharded_store import load_store, store_exists
+
+    if not store_exists(VECTOR_STORE_PATH):
+        raise FileNotFoundError(f"文档索引不存在: {VECTOR_STORE_PATH}，请先在桌面程序中创建索引")
+    timer = timer or StageTimer()
+    embeddings = timer.run("embeddings", load_embeddings, EMBEDDING_PATH)
+    vector_store = timer.run("index", load_store, VECTOR_STORE_PATH, embeddings)
+    retriever = create_retriever(
+        vector_store, RetrievalCache(RETRIEVAL_CACHE_ENTRIES, RETRIEVAL_CACHE_ENTRIES), k=k
+    )
+    qa = None
+    if load_model:
+        llm = load_llm(MODEL_PATH, timer=timer, quantization=quantization,
+                       quant_cache_dir=QUANTIZED_MODEL_DIR)
+        qa = create_qa(llm, retriever)
+    return embeddings, vector_store, retriever, qa
@@ -1,80 +1,139 @@
 # app/rag_system.py
 import os
 import sys
+import time
 import shutil
-import torch
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QPushButton, QLabel, QTextEdit, QLineEdit, QFileDialog, 
                             QProgressBar, QMessageBox, QGroupBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QIcon
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
-from langchain_community.document_loaders import DirectoryLoader, PyMuPDFLoader, Docx2txtLoader
-from transformers import AutoModel, AutoTokenizer, pipeline
-from langchain_community.llms import HuggingFacePipeline
-from pathlib import Path
-
-# 获取应用根目录
-APP_ROOT = Path(__file__).resolve().parent.parent
-
-# 模型常量
-MODEL_PATH = str(APP_ROOT / "models" / "chatglm3-6b")
-EMBEDDING_PATH = str(APP_ROOT / "models" / "bge-small-zh")
-DOCS_DIR = str(APP_ROOT / "docs")
-VECTOR_STORE_PATH = str(APP_ROOT / "vector_store")
+from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal
+from PyQt5.QtGui import QIcon, QTextCursor
+from .config import (
+    APP_ROOT, MODEL_PATH, EMBEDDING_PATH, DOCS_DIR, VECTOR_STORE_PATH,
+    EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, EMBED_BATCH_SIZE, EMBED_WORKERS,
+    TEXT_SPLITTER, CHUNK_SIZE, CHUNK_OVERLAP, INGEST_BATCH_SIZE, INGEST_QUEUE_SIZE, DEDUP_NEAR_DISTANCE,
+    INDEX_TYPE, STORE_BACKEND, STORE_COMPRESS, STORE_SHARDING, COMPACT_TOMBSTONE_RATIO,
+    COMPACT_MAX_TOMBSTONES, LLM_WARMUP, LLM_QUANTIZATION,
+    QUANTIZED_MODEL_DIR, ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIMILARITY, RETRIEVAL_CACHE_ENTRIES, HYBRID_RETRIEVAL, SERVICE_URL,
+    TRACE_LOG_PATH, TRACE_LOG_MAX_BYTES, TRACE_LOG_BACKUPS, WATCH_DOCS, WATCH_DEBOUNCE_SECONDS,
+)
+from .docs_watcher import DocsWatcher
+from .index_manifest import NoDocumentsError
+from .service_client import ServiceClient
+from .tracing import tracer
 
-class ModelLoader(QThread):
+# torch/transformers/langchain/faiss 只在后台线程或首次使用时导入，窗口无需等待它们加载
+# (scripts/check_import_time.py 检查本模块的导入耗时)
+
+# 启动阶段的显示名称
+STAGE_NAMES = {
+    "embeddings": "嵌入模型",
+    "index": "索引",
+    "tokenizer": "Tokenizer",
+    "llm_weights": "大模型权重",
+    "pipeline": "生成管道",
+    "warmup": "预热",
+    "retrieval": "检索",
+    "context_build": "上下文裁剪",
+    "prompt_build": "提示词",
+    "generation": "生成",
+    "load_documents": "加载文档",
+    "split": "切分",
+    "embed": "嵌入",
+    "faiss_build": "建索引",
+    "lexical_update": "词法索引",
+    "save": "保存",
+    "startup_retrieval": "启动(检索)",
+    "startup_llm": "启动(大模型)",
+    "index_build": "索引构建",
+    "live_ingest": "增量写入",
+    "delta_append": "追加片段",
+    "sharded_index_build": "分片索引构建",
+    "tombstone": "删除标记",
+    "stream_ingest": "流式入库",
+    "dedup": "去重",
+}
+
+
+def format_ms(ms):
+    return f"{ms / 1000:.1f}s" if ms >= 1000 else f"{ms:.0f}ms"
+
+
+def format_trace(record):
+    """一条调用链的各阶段耗时，只列出第一层子区间"""
+    parts = [f"合计 {format_ms(record['duration_ms'])}"]
+    for span in record["spans"]:
+        if span["depth"] != 1:
+            continue
+        text = f"{STAGE_NAMES.get(span['name'], span['name'])} {format_ms(span['duration_ms'] or 0)}"
+        attrs = span["attrs"]
+        if span["name"] == "generation" and attrs.get("tokens"):
+            text += f" ({attrs['tokens']} tokens, {attrs.get('tokens_per_second', 0)} tokens/s"
+            if "first_token_ms" in attrs:
+                text += f", 首token {format_ms(attrs['first_token_ms'])}"
+            text += ")"
+        parts.append(text)
+    return " | ".join(parts)
+
+
+class DocsChangeBridge(QObject):
+    """把监视线程中的文件变化转到界面线程"""
+    changed = pyqtSignal(list)
+
+
+class TraceBridge(QObject):
+    """把后台线程结束的调用链转发到界面线程"""
+    trace_finished = pyqtSignal(dict)
+
+class RetrievalLoader(QThread):
+    """加载嵌入模型和已有索引，完成后即可检索，不等待大模型"""
     progress = pyqtSignal(int, str)
+    stage_timed = pyqtSignal(str, float)
     finished = pyqtSignal(object, object)
     error = pyqtSignal(str)
 
     def run(self):
         try:
-            self.progress.emit(10, "初始化嵌入模型...")
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            
-            # 使用本地文件
-            emb = HuggingFaceEmbeddings(
-                model_name=EMBEDDING_PATH,
-                model_kwargs={"device": device},
-                cache_folder=EMBEDDING_PATH,
-                local_files_only=True
-            )
-            
-            self.progress.emit(30, "加载ChatGLM Tokenizer...")
-            tokenizer = AutoTokenizer.from_pretrained(
-                MODEL_PATH, 
-                trust_remote_code=True,
-                local_files_only=True
-            )
-            
-            self.progress.emit(50, "加载ChatGLM模型...")
-            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            model = AutoModel.from_pretrained(
-                MODEL_PATH,
-                trust_remote_code=True,
-                torch_dtype=torch.float16 if device.type == "cuda" else torch.float32,
-                local_files_only=True
-            ).to(device).eval()
-            
-            self.progress.emit(70, "创建文本生成管道...")
-            pipe = pipeline(
-                "text-generation",
-                model=model,
-                tokenizer=tokenizer,
-                max_new_tokens=1024,
-                temperature=0.2,
-                top_p=0.8,
-                do_sample=True,
-                device=0 if torch.cuda.is_available() else -1,
-            )
-            llm = HuggingFacePipeline(pipeline=pipe)
+            from .model_loading import StageTimer, load_embeddings
+            from .sharded_store import load_store, store_exists
+            timer = StageTimer(self.stage_timed.emit)
+            with tracer.span("startup_retrieval"):
+                self.progress.emit(10, "初始化嵌入模型...")
+                emb = timer.run("embeddings", load_embeddings, EMBEDDING_PATH)
+                
+                vs = None
+                if store_exists(VECTOR_STORE_PATH):
+                    self.progress.emit(20, "加载文档索引...")
+                    vs = timer.run("index", load_store, VECTOR_STORE_PATH, emb)
+                # 预先导入界面线程随后要用到的模块
+                from . import answer_cache, generation, rag_pipeline
+            self.finished.emit(emb, vs)
             
+        except Exception as e:
+            import traceback
+            error_msg = f"检索模块加载失败: {str(e)}\n{traceback.format_exc()}"
+            self.error.emit(error_msg)
+
+class ModelLoader(QThread):
+    """加载ChatGLM，与RetrievalLoader并行运行"""
+    progress = pyqtSignal(int, str)
+    stage_timed = pyqtSignal(str, float)
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+    def run(self):
+        try:
+            from .model_loading import StageTimer, load_llm
+            timer = StageTimer(self.stage_timed.emit)
+            with tracer.span("startup_llm", quantization=LLM_QUANTIZATION):
+                llm = load_llm(MODEL_PATH, warmup=LLM_WARMUP, timer=timer,
+                               progress_callback=self.progress.emit,
+                               quantization=LLM_QUANTIZATION,
+                               quant_cache_dir=QUANTIZED_MODEL_DIR)
             self.progress.emit(100, "模型加载完成")
-            self.finished.emit(emb, llm)
+            self.finished.emit(llm)
             
         except Exception as e:
             import traceback
@@ -86,65 +145,163 @@ class DocumentIndexer(QThread):
     finished = pyqtSignal(object)
     error = pyqtSignal(str)
 
-    def __init__(self, embeddings):
+    def __init__(self, embeddings, vector_store=None, compact=False):
         super().__init__()
         self.embeddings = embeddings
+        # 传入正在使用的向量库时，文件变化直接写入增量段和删除标记，不重建索引
+        self.vector_store = vector_store
+        # 压缩: 重建删除标记过多的索引，物理剔除已删除的片段
+        self.compact = compact
+        self.live = vector_store is not None and not compact
+        self.summary = ""
+        self.stats = {}
 
     def run(self):
         try:
-            self.progress.emit(10, "加载文档...")
-            docs = []
-            try:
-                docs += DirectoryLoader(DOCS_DIR, glob="**/*.pdf", loader_cls=PyMuPDFLoader).load()
-            except Exception as e:
-                print(f"PDF加载错误: {e}")
-            
-            try:
-                docs += DirectoryLoader(DOCS_DIR, glob="**/*.docx", loader_cls=Docx2txtLoader).load()
-            except Exception as e:
-                print(f"DOCX加载错误: {e}")
-            
-            if not docs:
-                self.error.emit("未找到文档! 请将PDF/DOCX文件放入docs文件夹")
-                return
-                
-            self.progress.emit(30, f"处理 {len(docs)} 个文档...")
-            splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-            chunks = splitter.split_documents(docs)
-            
-            self.progress.emit(60, "创建向量索引...")
-            vs = FAISS.from_documents(chunks, self.embeddings)
-            
-            self.progress.emit(80, "保存索引...")
-            vs.save_local(VECTOR_STORE_PATH)
-            
-            self.progress.emit(100, f"索引创建完成! {len(chunks)} 个文档片段")
+            from .indexing import IndexBuilder, ShardedIndexBuilder
+            builder_kwargs = dict(
+                splitter=TEXT_SPLITTER,
+                chunk_size=CHUNK_SIZE,
+                chunk_overlap=CHUNK_OVERLAP,
+                cache_path=EMBEDDING_CACHE_PATH,
+                cache_max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                embed_batch_size=EMBED_BATCH_SIZE,
+                embed_workers=EMBED_WORKERS,
+                index_type=INDEX_TYPE,
+                store_backend=STORE_BACKEND,
+                store_compress=STORE_COMPRESS,
+                lexical=HYBRID_RETRIEVAL,
+                compact_ratio=COMPACT_TOMBSTONE_RATIO,
+                compact_max_tombstones=COMPACT_MAX_TOMBSTONES,
+                ingest_batch_size=INGEST_BATCH_SIZE,
+                ingest_queue_size=INGEST_QUEUE_SIZE,
+                near_duplicate_distance=DEDUP_NEAR_DISTANCE,
+            )
+            if STORE_SHARDING == "folder":
+                builder = ShardedIndexBuilder(self.embeddings, DOCS_DIR, VECTOR_STORE_PATH, **builder_kwargs)
+                vs, stats = builder.update(self.vector_store, progress_callback=self.progress.emit,
+                                           live=self.live)
+                layout = f"{stats['shards']} 个分片, 本次更新 {stats['shards_updated']} 个"
+            else:
+                builder = IndexBuilder(self.embeddings, DOCS_DIR, VECTOR_STORE_PATH, **builder_kwargs)
+                result = None
+                if self.live:
+                    result = builder.apply_live(self.vector_store, progress_callback=self.progress.emit)
+                if result is None:
+                    result = builder.build(progress_callback=self.progress.emit)
+                vs, stats = result
+                layout = f"{stats['index_type']} 索引"
+            self.summary = (
+                f"索引更新完成! 新增 {stats['added']} / 修改 {stats['updated']} / "
+                f"删除 {stats['removed']} / 未变化 {stats['unchanged']} 个文件, "
+                f"共 {stats['chunks']} 个文档片段 ({layout}); "
+                f"重复片段 {stats['duplicates_exact']} / 近似重复 {stats['duplicates_near']} 个已合并; "
+                f"嵌入缓存 命中 {stats['cache_hits']} / 未命中 {stats['cache_misses']}; "
+                f"嵌入速度 {stats['embed_rate']:.1f} 片段/秒"
+            )
+            if stats.get("failed"):
+                self.summary += f"; {len(stats['failed'])} 个文件无法读取，下次更新时重试: {', '.join(stats['failed'])}"
+            self.stats = stats
+            self.progress.emit(100, self.summary)
             self.finished.emit(vs)
             
+        except NoDocumentsError as e:
+            self.error.emit(str(e))
         except Exception as e:
             import traceback
             error_msg = f"文档索引创建失败: {str(e)}\n{traceback.format_exc()}"
             self.error.emit(error_msg)
 
 class QueryWorker(QThread):
+    token = pyqtSignal(str)
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
 
-    def __init__(self, qa, question):
+    def __init__(self, qa, question, retriever=None, answer_cache=None):
         super().__init__()
         self.qa = qa
         self.question = question
+        self.retriever = retriever
+        self.answer_cache = answer_cache
+        self.from_cache = False
 
     def run(self):
         try:
-            result = self.qa.run(self.question)
-            cleaned_answer = result.replace("<|im_end|>", "").replace("<|im_start|>", "")
-            self.finished.emit(cleaned_answer)
+            with tracer.span("query") as span:
+                self.answer(span)
         except Exception as e:
             import traceback
             error_msg = f"查询失败: {str(e)}\n{traceback.format_exc()}"
             self.error.emit(error_msg)
 
+    def answer(self, span):
+        from .generation import clean_text, format_passages, stream_answer, supports_streaming
+        cached = None
+        if self.qa is not None and self.answer_cache is not None:
+            cached = self.answer_cache.get(self.question)
+        if cached is not None:
+            self.from_cache = True
+            span.set(from_cache=True)
+            self.finished.emit(cached)
+            return
+        
+        if self.qa is None:
+            # 大模型尚未就绪: 只返回检索到的文档片段
+            span.set(retrieval_only=True)
+            with tracer.span("retrieval"):
+                docs = self.retriever.invoke(self.question)
+            self.finished.emit(format_passages(docs))
+        elif supports_streaming(self.qa):
+            # 流式生成: 每段文本生成后立即发送给界面
+            pieces = []
+            for piece in stream_answer(self.qa, self.question):
+                pieces.append(piece)
+                self.token.emit(piece)
+            self.store_answer("".join(pieces))
+        else:
+            with tracer.span("generation"):
+                result = self.qa.run(self.question)
+            self.store_answer(clean_text(result))
+
+    def store_answer(self, answer):
+        if self.answer_cache is not None:
+            self.answer_cache.put(self.question, answer)
+        self.finished.emit(answer)
+
+class RemoteQueryWorker(QThread):
+    """瘦客户端模式: 向问答服务发送问题并逐段接收答案"""
+    token = pyqtSignal(str)
+    finished = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, client, question):
+        super().__init__()
+        self.client = client
+        self.question = question
+        self.from_cache = False
+        self.latency_ms = None
+
+    def run(self):
+        try:
+            with tracer.span("query", remote=True):
+                self.receive()
+        except Exception as e:
+            self.error.emit(f"查询失败: {str(e)}")
+
+    def receive(self):
+        for event in self.client.stream(self.question):
+            if event["type"] == "token":
+                self.token.emit(event["text"])
+            elif event["type"] == "done":
+                self.from_cache = event.get("from_cache", False)
+                self.latency_ms = event.get("latency_ms")
+                self.finished.emit(event["answer"])
+                return
+            else:
+                self.error.emit(f"查询失败: {event.get('message', '')}")
+                return
+        self.error.emit("查询失败: 问答服务提前断开了连接")
+
 class RAGDesktopApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -160,6 +317,23 @@ class RAGDesktopApp(QMainWindow):
         self.llm = None
         self.vector_store = None
         self.qa = None
+        self.answer_cache = None
+        self.retrieval_cache = None
+        self.stage_timings = {}
+        self.service = ServiceClient(SERVICE_URL) if SERVICE_URL else None
+        self.recent_queries = deque(maxlen=5)
+        self.task_traces = {}
+        self.indexer = None
+        self.ingest_pending = False
+        self.compact_pending = False
+        self.docs_watcher = None
+        self.init_tracing()
+        
+        if self.service is not None:
+            # 瘦客户端: 模型和索引都在问答服务端
+            self.init_ui()
+            self.connect_service()
+            return
         
         # 验证模型路径
         self.validate_model_paths()
@@ -167,6 +341,16 @@ class RAGDesktopApp(QMainWindow):
         self.init_ui()
         self.load_models()
 
+    def init_tracing(self):
+        """分段计时写入滚动日志，结束的调用链转发到性能面板"""
+        try:
+            tracer.configure(TRACE_LOG_PATH, TRACE_LOG_MAX_BYTES, TRACE_LOG_BACKUPS)
+        except OSError as e:
+            print(f"性能日志不可用: {e}")
+        self.trace_bridge = TraceBridge()
+        self.trace_bridge.trace_finished.connect(self.on_trace)
+        tracer.add_listener(self.trace_bridge.trace_finished.emit)
+
     def validate_model_paths(self):
         """验证模型路径是否存在"""
         errors = []
@@ -226,6 +410,15 @@ class RAGDesktopApp(QMainWindow):
         
         qa_group.setLayout(qa_layout)
         
+        perf_group = QGroupBox("性能")
+        perf_layout = QVBoxLayout()
+        self.perf_view = QTextEdit()
+        self.perf_view.setReadOnly(True)
+        self.perf_view.setMaximumHeight(120)
+        self.perf_view.setStyleSheet("font-size: 11px;")
+        perf_layout.addWidget(self.perf_view)
+        perf_group.setLayout(perf_layout)
+        
         self.status_bar = QLabel("正在初始化...")
         self.status_bar.setAlignment(Qt.AlignCenter)
         self.status_bar.setStyleSheet("background-color: #f0f0f0; padding: 5px;")
@@ -233,31 +426,96 @@ class RAGDesktopApp(QMainWindow):
         main_layout.addLayout(title_layout)
         main_layout.addWidget(doc_group)
         main_layout.addWidget(qa_group)
+        main_layout.addWidget(perf_group)
         main_layout.addWidget(self.status_bar)
         
         main_widget.setLayout(main_layout)
         self.setCentralWidget(main_widget)
 
     def load_models(self):
+        """检索模块和大模型并行加载，检索就绪后即可查询文档片段"""
         self.status_bar.setText("正在加载AI模型，请稍候...")
+        self.retrieval_loader = RetrievalLoader()
+        self.retrieval_loader.progress.connect(self.update_progress)
+        self.retrieval_loader.stage_timed.connect(self.on_stage_timed)
+        self.retrieval_loader.finished.connect(self.on_retrieval_ready)
+        self.retrieval_loader.error.connect(self.show_error)
+        
         self.model_loader = ModelLoader()
         self.model_loader.progress.connect(self.update_progress)
+        self.model_loader.stage_timed.connect(self.on_stage_timed)
         self.model_loader.finished.connect(self.on_models_loaded)
         self.model_loader.error.connect(self.show_error)
+        
+        self.retrieval_loader.start()
         self.model_loader.start()
 
+    def connect_service(self):
+        self.index_btn.setEnabled(False)
+        self.add_docs_btn.setEnabled(False)
+        self.index_status.setText("索引状态: 由问答服务管理")
+        try:
+            health = self.service.health()
+        except Exception as e:
+            self.show_error(f"无法连接问答服务 {SERVICE_URL}: {e}")
+            return
+        self.ask_btn.setEnabled(True)
+        self.status_bar.setText(f"已连接问答服务 {SERVICE_URL}，排队请求: {health.get('queue_depth', 0)}")
+
     def build_document_index(self):
         if not self.embeddings:
             self.show_error("请先等待模型加载完成")
             return
+        if self.indexer_running():
+            self.show_warning("索引正在更新，请稍候")
+            return
             
         self.status_bar.setText("开始构建文档索引...")
-        self.indexer = DocumentIndexer(self.embeddings)
+        self.start_indexer(DocumentIndexer(self.embeddings))
+
+    def indexer_running(self):
+        return self.indexer is not None and self.indexer.isRunning()
+
+    def start_indexer(self, indexer):
+        self.indexer = indexer
         self.indexer.progress.connect(self.update_progress)
         self.indexer.finished.connect(self.on_index_created)
-        self.indexer.error.connect(self.show_error)
+        self.indexer.error.connect(self.on_index_error)
         self.indexer.start()
 
+    def start_docs_watcher(self):
+        """docs文件夹中的文件变化防抖后触发增量写入"""
+        if not WATCH_DOCS or self.docs_watcher is not None:
+            return
+        self.docs_bridge = DocsChangeBridge()
+        self.docs_bridge.changed.connect(self.on_docs_changed)
+        watcher = DocsWatcher(DOCS_DIR, self.docs_bridge.changed.emit, WATCH_DEBOUNCE_SECONDS)
+        if watcher.start():
+            self.docs_watcher = watcher
+
+    def on_docs_changed(self, paths):
+        self.schedule_ingest()
+
+    def schedule_ingest(self):
+        """在后台把新文档写入索引；正在更新索引时，等它结束后再处理"""
+        if not self.embeddings:
+            return
+        if self.indexer_running():
+            self.ingest_pending = True
+            return
+        self.ingest_pending = False
+        self.status_bar.setText("正在把新文档写入索引...")
+        self.start_indexer(DocumentIndexer(self.embeddings, self.vector_store))
+
+    def run_pending_ingest(self):
+        if self.ingest_pending:
+            self.schedule_ingest()
+        elif self.compact_pending and not self.indexer_running():
+            # 后台重建删除标记过多的索引，期间仍用旧索引回答问题
+            self.compact_pending = False
+            self.status_bar.setText("正在后台压缩索引...")
+            self.start_indexer(DocumentIndexer(self.embeddings, self.vector_store, compact=True))
+
     def add_documents(self):
         files, _ = QFileDialog.getOpenFileNames(
             self, "选择文档", "", 
@@ -265,10 +523,12 @@ class RAGDesktopApp(QMainWindow):
         )
         
         if files:
+            os.makedirs(DOCS_DIR, exist_ok=True)
             for file in files:
                 dest = os.path.join(DOCS_DIR, os.path.basename(file))
                 shutil.copy(file, dest)
-            self.show_info(f"已添加 {len(files)} 个文档到 docs 文件夹")
+            self.status_bar.setText(f"已添加 {len(files)} 个文档到 docs 文件夹，正在写入索引...")
+            self.schedule_ingest()
 
     def ask_question(self):
         question = self.question_input.text().strip()
@@ -276,8 +536,25 @@ class RAGDesktopApp(QMainWindow):
             self.show_warning("请输入问题")
             return
             
-        self.answer_area.setText("思考中...")
-        self.worker = QueryWorker(self.qa, question)
+        if self.service is not None:
+            self.answer_area.setText("思考中...")
+            self.streaming_started = False
+            self.worker = RemoteQueryWorker(self.service, question)
+            self.worker.token.connect(self.on_answer_token)
+            self.worker.finished.connect(self.on_answer_received)
+            self.worker.error.connect(self.show_error)
+            self.worker.start()
+            return
+            
+        if self.qa is None:
+            self.answer_area.setText("大模型仍在加载中，正在检索相关文档片段...")
+            retriever = self.make_retriever()
+        else:
+            self.answer_area.setText("思考中...")
+            retriever = None
+        self.streaming_started = False
+        self.worker = QueryWorker(self.qa, question, retriever, self.answer_cache)
+        self.worker.token.connect(self.on_answer_token)
         self.worker.finished.connect(self.on_answer_received)
         self.worker.error.connect(self.show_error)
         self.worker.start()
@@ -286,39 +563,125 @@ class RAGDesktopApp(QMainWindow):
         self.progress_bar.setValue(value)
         self.status_bar.setText(message)
 
-    def on_models_loaded(self, emb, llm):
-        self.embeddings = emb
-        self.llm = llm
-        self.status_bar.setText("AI模型加载完成!")
-        
-        index_file = os.path.join(VECTOR_STORE_PATH, "index.faiss")
-        if os.path.exists(index_file):
-            try:
-                self.vector_store = FAISS.load_local(
-                    VECTOR_STORE_PATH, self.embeddings, allow_dangerous_deserialization=True
-                )
-                self.qa = RetrievalQA.from_chain_type(
-                    llm=self.llm, retriever=self.vector_store.as_retriever()
-                )
-                self.ask_btn.setEnabled(True)
-                self.index_status.setText("索引状态: 已加载")
-                self.show_info("文档索引已加载，可以开始提问")
-            except Exception as e:
-                self.show_error(f"加载索引失败: {str(e)}")
+    def timing_summary(self):
+        return " | ".join(
+            f"{STAGE_NAMES.get(name, name)} {elapsed:.1f}s" for name, elapsed in self.stage_timings.items()
+        )
+
+    def on_stage_timed(self, name, elapsed):
+        self.stage_timings[name] = elapsed
+
+    def make_retriever(self):
+        from .rag_pipeline import create_retriever
+        from .retrievers import RetrievalCache
+        if self.retrieval_cache is None:
+            self.retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_ENTRIES, RETRIEVAL_CACHE_ENTRIES)
+        return create_retriever(self.vector_store, self.retrieval_cache)
+
+    def update_qa(self):
+        """检索和大模型都就绪后创建问答链；索引变化时旧的缓存答案随之失效"""
+        from .rag_pipeline import create_qa
+        from .vector_index import index_build_id
+        if self.vector_store is not None and self.answer_cache is not None:
+            self.answer_cache.set_generation(index_build_id(self.vector_store))
+        if self.vector_store is not None and self.llm is not None:
+            self.qa = create_qa(self.llm, self.make_retriever())
         else:
+            self.qa = None
+        self.ask_btn.setEnabled(self.vector_store is not None)
+
+    def on_retrieval_ready(self, emb, vs):
+        self.embeddings = emb
+        self.start_docs_watcher()
+        try:
+            from .answer_cache import AnswerCache
+            self.answer_cache = AnswerCache(
+                ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY, emb
+            )
+        except Exception as e:
+            print(f"问答缓存不可用: {e}")
+        if vs is None:
             self.index_status.setText("索引状态: 未创建")
+            return
+        self.vector_store = vs
+        self.update_qa()
+        self.index_status.setText("索引状态: 已加载")
+        if self.llm is None:
+            self.status_bar.setText("检索已就绪，大模型仍在加载中，可先检索文档片段")
+
+    def on_models_loaded(self, llm):
+        self.llm = llm
+        self.update_qa()
+        if self.qa is not None:
+            self.show_info("文档索引已加载，可以开始提问")
+        self.status_bar.setText(f"AI模型加载完成! 启动耗时: {self.timing_summary()}")
 
     def on_index_created(self, vs):
+        indexer = self.indexer
         self.vector_store = vs
-        self.qa = RetrievalQA.from_chain_type(
-            llm=self.llm, retriever=self.vector_store.as_retriever()
-        )
-        self.ask_btn.setEnabled(True)
-        self.index_status.setText("索引状态: 已创建")
-        self.show_info("文档索引创建完成，可以开始提问")
+        self.update_qa()
+        if indexer.live or indexer.compact:
+            self.index_status.setText("索引状态: 已更新")
+        else:
+            self.index_status.setText("索引状态: 已创建")
+            self.show_info("文档索引创建完成，可以开始提问")
+        self.status_bar.setText(indexer.summary)
+        if indexer.live and indexer.stats.get("needs_compaction"):
+            self.compact_pending = True
+        self.run_pending_ingest()
+
+    def on_index_error(self, message):
+        self.show_error(message)
+        self.run_pending_ingest()
+
+    def on_answer_token(self, text):
+        if not self.streaming_started:
+            self.streaming_started = True
+            self.answer_area.clear()
+        cursor = self.answer_area.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.answer_area.setTextCursor(cursor)
+        self.answer_area.ensureCursorVisible()
 
     def on_answer_received(self, answer):
         self.answer_area.setText(answer)
+        if self.worker.from_cache:
+            self.status_bar.setText("答案来自缓存")
+        elif self.service is not None:
+            self.status_bar.setText(f"问答服务耗时: {self.worker.latency_ms}ms")
+        else:
+            stats = self.retrieval_cache.stats()
+            self.status_bar.setText(
+                f"检索缓存命中率: 问题向量 {stats['query_vector_hit_rate']:.0%} / "
+                f"检索结果 {stats['result_hit_rate']:.0%}"
+            )
+
+    def on_trace(self, record):
+        if record["name"] == "query":
+            self.recent_queries.appendleft(record)
+        else:
+            self.task_traces[record["name"]] = record
+        self.update_perf_panel()
+
+    def update_perf_panel(self):
+        lines = []
+        if self.recent_queries:
+            lines.append("最近查询:")
+            for record in self.recent_queries:
+                stamp = time.strftime("%H:%M:%S", time.localtime(record["start"]))
+                note = " (缓存)" if record["attrs"].get("from_cache") else ""
+                lines.append(f"  {stamp}{note}  {format_trace(record)}")
+            averages = tracer.averages("query")
+            count, total = averages["query"]
+            parts = [
+                f"{STAGE_NAMES[name]} {format_ms(averages[name][1])}"
+                for name in ("retrieval", "context_build", "prompt_build", "generation") if name in averages
+            ]
+            lines.append(f"平均 ({count} 次查询): " + " | ".join([f"合计 {format_ms(total)}"] + parts))
+        for record in self.task_traces.values():
+            lines.append(f"{STAGE_NAMES.get(record['name'], record['name'])}: {format_trace(record)}")
+        self.perf_view.setPlainText("\n".join(lines))
 
     def show_error(self, message):
         QMessageBox.critical(self, "错误", message)
@@ -0,0 +1,263 @@
+# app/retrievers.py
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+import faiss
+from langchain_core.retrievers import BaseRetriever
+
+from .tracing import tracer
+
+DEFAULT_K = 4
+# 有删除标记时首次多取的条数；多数查询的前几名里没有已删除片段，不必按删除标记总数多取
+TOMBSTONE_OVERFETCH = 16
+
+
+class LRUCache:
+    """线程安全的定长LRU缓存，带命中计数"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        # 只判断是否存在，不计入命中统计也不调整顺序
+        with self._lock:
+            return key in self._data
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class RetrievalCache:
+    """
+    检索层缓存: 问题文本 → 问题向量，(问题, k) → 排好序的片段ID
+    两级缓存都绑定索引版本号，索引重建后自动清空
+    """
+
+    def __init__(self, max_queries=2048, max_results=2048):
+        self.query_vectors = LRUCache(max_queries)
+        self.results = LRUCache(max_results)
+        self.generation = None
+
+    def set_generation(self, generation):
+        if generation != self.generation:
+            self.query_vectors.clear()
+            self.results.clear()
+            self.generation = generation
+
+    def stats(self):
+        return {
+            "query_vector_hit_rate": self.query_vectors.hit_rate,
+            "result_hit_rate": self.results.hit_rate,
+            "query_vector_entries": len(self.query_vectors),
+            "result_entries": len(self.results),
+        }
+
+
+def search_ids_batch(vectorstore, vectors, k):
+    """一次查询FAISS索引检索多个向量，返回每个向量的 [(片段ID, 距离), ...]"""
+    query = np.array(vectors, dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(query)
+    if hasattr(vectorstore, "shards"):
+        # 分片向量库: 并行查询各分片后合并
+        return vectorstore.search_ids_batch(query, k)
+    # 已删除的片段仍在索引中，多取少量再过滤；过滤后不足k个且还有更多结果时加倍重取
+    dead = getattr(vectorstore, "tombstones", None) or ()
+    limit = k + len(dead)
+    fetch = min(limit, k + TOMBSTONE_OVERFETCH) if dead else k
+    while True:
+        results, complete = _search_live(vectorstore, query, k, fetch, dead)
+        if complete or fetch >= limit:
+            break
+        fetch = min(limit, fetch * 2)
+    for row in results:
+        row.sort(key=lambda item: item[1])
+        del row[k:]
+    return results
+
+
+def _search_live(vectorstore, query, k, fetch, dead):
+    """
+    查询主索引和增量段各 fetch 条并去掉已删除的片段
+    返回 (每行结果, 是否每行都已足够): 某一来源剩下不足k个且取满了 fetch 条时，后面可能还有未取到的片段
+    """
+    scores, indices = vectorstore.index.search(query, fetch)
+    results = []
+    complete = True
+    for row_scores, row_indices in zip(scores, indices):
+        row = []
+        found = 0
+        for score, i in zip(row_scores, row_indices):
+            if i == -1:
+                continue
+            found += 1
+            chunk_id = vectorstore.index_to_docstore_id[int(i)]
+            if chunk_id not in dead:
+                row.append((chunk_id, float(score)))
+        complete = complete and (len(row) >= k or found < fetch)
+        results.append(row)
+    # 主索引之后新增的片段在增量段中，两边结果按距离合并
+    delta = getattr(vectorstore, "delta", None)
+    if delta:
+        for row, extra in zip(results, delta.search(query, fetch)):
+            live = [item for item in extra if item[0] not in dead]
+            complete = complete and (len(live) >= k or len(extra) < fetch)
+            row.extend(live)
+    return results, complete
+
+
+def search_ids(vectorstore, vector, k):
+    """直接查询FAISS索引，返回 [(片段ID, 距离), ...]"""
+    return search_ids_batch(vectorstore, [vector], k)[0]
+
+
+def fetch_documents(vectorstore, ids):
+    docstore = vectorstore.docstore
+    if hasattr(docstore, "mget"):
+        found = docstore.mget(ids)
+        return [found[i] for i in ids if i in found]
+    docs = [docstore.search(i) for i in ids]
+    return [d for d in docs if not isinstance(d, str)]
+
+
+class CachingRetriever(BaseRetriever):
+    """在FAISS向量库外包一层查询向量缓存和检索结果缓存"""
+
+    vectorstore: Any
+    cache: Any
+    k: int = DEFAULT_K
+
+    def rank(self, query, k):
+        return search_ids(self.vectorstore, self.embed_query(query), k)
+
+    def embed_query(self, query):
+        vector = self.cache.query_vectors.get(query)
+        if vector is None:
+            vector = self.vectorstore.embedding_function.embed_query(query)
+            self.cache.query_vectors.put(query, vector)
+        return vector
+
+    def embed_queries(self, queries):
+        """批量计算问题向量，只对缓存中没有的问题调用一次嵌入模型"""
+        missing = [q for q in dict.fromkeys(queries) if q not in self.cache.query_vectors]
+        if missing:
+            vectors = self.vectorstore.embedding_function.embed_documents(missing)
+            for query, vector in zip(missing, vectors):
+                self.cache.query_vectors.put(query, vector)
+        return [self.embed_query(q) for q in queries]
+
+    def rank_batch(self, queries, k):
+        return search_ids_batch(self.vectorstore, self.embed_queries(queries), k)
+
+    def prefetch(self, queries, k=None):
+        """批量预取多个问题的检索结果写入缓存，之后逐个调用 invoke 直接命中缓存"""
+        k = k or self.k
+        pending = [q for q in dict.fromkeys(queries) if (q, k) not in self.cache.results]
+        if pending:
+            for query, ranked in zip(pending, self.rank_batch(pending, k)):
+                self.cache.results.put((query, k), ranked)
+
+    def search(self, query, k=None):
+        """返回 [(片段ID, 距离), ...]，按相关性从高到低排列"""
+        k = k or self.k
+        key = (query, k)
+        ranked = self.cache.results.get(key)
+        if ranked is None:
+            ranked = self.rank(query, k)
+            self.cache.results.put(key, ranked)
+        return ranked
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        ranked = self.search(query)
+        return fetch_documents(self.vectorstore, [chunk_id for chunk_id, _ in ranked])
+
+
+def _min_max(scores):
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high - low < 1e-12:
+        return {key: 1.0 for key in scores}
+    return {key: (value - low) / (high - low) for key, value in scores.items()}
+
+
+def fuse_scores(dense, lexical, alpha):
+    """
+    向量距离和BM25分数各自归一化到[0, 1]后加权求和
+    dense: [(ID, L2距离)]，距离越小越相关；lexical: [(ID, BM25)]，分数越大越相关
+    """
+    dense_scores = _min_max({chunk_id: -distance for chunk_id, distance in dense})
+    lexical_scores = _min_max(dict(lexical))
+    fused = {}
+    for chunk_id in dense_scores.keys() | lexical_scores.keys():
+        fused[chunk_id] = alpha * dense_scores.get(chunk_id, 0.0) + (1 - alpha) * lexical_scores.get(chunk_id, 0.0)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(CachingRetriever):
+    """向量检索与BM25词法检索融合，条款号、标准编号等精确词也能在较小的k内命中"""
+
+    lexical: Any
+    alpha: float = 0.6
+    candidates: int = 20
+
+    def rank(self, query, k):
+        pool = max(k, self.candidates)
+        dense = search_ids(self.vectorstore, self.embed_query(query), pool)
+        lexical = self.lexical.search(query, pool)
+        return fuse_scores(dense, lexical, self.alpha)[:k]
+
+    def rank_batch(self, queries, k):
+        pool = max(k, self.candidates)
+        dense_batch = search_ids_batch(self.vectorstore, self.embed_queries(queries), pool)
+        return [
+            fuse_scores(dense, self.lexical.search(query, pool), self.alpha)[:k]
+            for query, dense in zip(queries, dense_batch)
+        ]
+
+
+class ContextBudgetRetriever(BaseRetriever):
+    """对检索结果去重并按token预算裁剪，问答链拼接提示词时直接使用裁剪后的片段"""
+
+    base: Any
+    builder: Any
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with tracer.span("retrieval") as span:
+            docs = self.base.invoke(query)
+            span.set(chunks=len(docs))
+        with tracer.span("context_build") as span:
+            trimmed = self.builder.build(query, docs)
+            span.set(**self.builder.last_stats)
+        return trimmed
@@ -0,0 +1,53 @@
+# app/service_client.py
+import json
+import urllib.error
+import urllib.request
+
+
+class ServiceBusyError(RuntimeError):
+    """服务端请求队列已满(HTTP 503)"""
+
+
+class ServiceClient:
+    """问答服务的客户端，只依赖标准库，桌面程序以瘦客户端方式运行时使用"""
+
+    def __init__(self, base_url, timeout=600):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, payload=None, timeout=None):
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(
+            self.base_url + path, data=data, headers={"Content-Type": "application/json"},
+            method="GET" if data is None else "POST",
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=timeout or self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 503:
+                raise ServiceBusyError("问答服务繁忙，请稍后重试") from e
+            try:
+                message = json.loads(e.read().decode("utf-8")).get("error", str(e))
+            except ValueError:
+                message = str(e)
+            raise RuntimeError(f"问答服务返回错误 {e.code}: {message}") from e
+
+    def health(self, timeout=5):
+        with self._request("/health", timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def metrics(self, timeout=5):
+        with self._request("/metrics", timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def ask(self, question):
+        with self._request("/ask", {"question": question}) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def stream(self, question):
+        """逐行产出服务端事件 {"type": "token"|"done"|"error", ...}"""
+        with self._request("/ask/stream", {"question": question}) as response:
+            for line in response:
+                line = line.strip()
+                if line:
+                    yield json.loads(line.decode("utf-8"))
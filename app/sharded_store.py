@@ -0,0 +1,180 @@
+# app/sharded_store.py
+import os
+import hashlib
+import itertools
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import SHARD_SEARCH_WORKERS
+from .lexical_index import LEXICAL_INDEX_NAME, LexicalIndex
+from .retrievers import search_ids_batch
+from .vector_index import index_build_id, load_vector_store, vector_store_exists
+
+SHARDS_DIR_NAME = "shards"
+ROOT_SHARD = "_root"  # docs 根目录下的文件
+
+_executor = None
+
+
+def _pool():
+    # 所有分片向量库共用一个线程池，索引更新换出新对象时不会遗留线程
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="shard")
+    return _executor
+
+
+def parallel_map(func, items):
+    """分片多于一个时在线程池中并行执行；FAISS和SQLite检索时会释放GIL"""
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    return list(_pool().map(func, items))
+
+
+def shard_of(rel):
+    """按 docs 下的一级子文件夹分片，根目录下的文件归入 ROOT_SHARD"""
+    parts = rel.split("/", 1)
+    return parts[0] if len(parts) > 1 else ROOT_SHARD
+
+
+def shard_dir(store_dir, shard):
+    return os.path.join(store_dir, SHARDS_DIR_NAME, shard)
+
+
+def list_shards(store_dir):
+    """已保存的分片名"""
+    root = os.path.join(store_dir, SHARDS_DIR_NAME)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if vector_store_exists(os.path.join(root, name))
+    )
+
+
+def merge_unique(rows, k, reverse=False):
+    """
+    合并各分片的 [(片段ID, 距离或分数), ...]，同一片段只保留最好的一次，返回前k个
+    判重只在分片内进行，正文相同的片段可能同时存在于多个分片
+    """
+    merged = sorted(itertools.chain.from_iterable(rows), key=itemgetter(1), reverse=reverse)
+    seen = set()
+    result = []
+    for chunk_id, value in merged:
+        if chunk_id in seen:
+            continue
+        seen.add(chunk_id)
+        result.append((chunk_id, value))
+        if len(result) == k:
+            break
+    return result
+
+
+def shard_size(vs):
+    """有效片段数: 主索引 + 增量段 - 删除标记"""
+    return (len(vs.index_to_docstore_id) + len(getattr(vs, "delta", None) or ())
+            - len(getattr(vs, "tombstones", None) or ()))
+
+
+class ShardedDocstore:
+    """按片段ID到各分片的文档库中查找，ID全局唯一，不需要路由表"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def mget(self, ids):
+        found = {}
+        remaining = list(ids)
+        for vs in self.store.shards.values():
+            if not remaining:
+                break
+            if hasattr(vs.docstore, "mget"):
+                found.update(vs.docstore.mget(remaining))
+            else:
+                for chunk_id in remaining:
+                    doc = vs.docstore.search(chunk_id)
+                    if not isinstance(doc, str):
+                        found[chunk_id] = doc
+            remaining = [i for i in remaining if i not in found]
+        return found
+
+    def search(self, search):
+        return self.mget([search]).get(search, f"ID {search} not found.")
+
+
+class ShardedVectorStore:
+    """
+    多个独立构建、保存和加载的向量库分片
+    查询并行发往各分片，每个分片返回前k个，按片段ID去重后合并出全局前k个
+    分片内片段ID不重复，全局前k个不同片段在其最近的分片中必然排在前k，每个分片取k个即可
+    只提供检索器用到的接口(embedding_function / docstore / index_params)
+    """
+
+    _normalize_L2 = False
+
+    def __init__(self, embeddings, shards):
+        self.embedding_function = embeddings
+        self.shards = dict(sorted(shards.items()))
+        self.docstore = ShardedDocstore(self)
+
+    @property
+    def index_params(self):
+        # 任一分片变化(包括增量段追加)都会得到新的版本号
+        key = "|".join(f"{name}:{index_build_id(vs)}" for name, vs in self.shards.items())
+        return {"type": "sharded", "shards": len(self.shards),
+                "build_id": hashlib.sha1(key.encode("utf-8")).hexdigest()}
+
+    def __len__(self):
+        return sum(shard_size(vs) for vs in self.shards.values())
+
+    def search_ids_batch(self, query, k):
+        """query 为二维float32数组，返回每行的 [(片段ID, 距离), ...]"""
+        per_shard = parallel_map(lambda vs: search_ids_batch(vs, query, k), self.shards.values())
+        return [merge_unique(rows, k) for rows in zip(*per_shard)] if per_shard else [[] for _ in range(len(query))]
+
+
+class ShardedLexicalIndex:
+    """各分片的BM25索引并行查询后按分数合并(IDF按分片各自统计)"""
+
+    def __init__(self, indexes):
+        self.indexes = list(indexes)
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes)
+
+    def search(self, query, k):
+        results = parallel_map(lambda index: index.search(query, k), self.indexes)
+        return merge_unique(results, k, reverse=True)
+
+
+def sharded_store_exists(store_dir):
+    return bool(list_shards(store_dir))
+
+
+def store_exists(store_dir):
+    return sharded_store_exists(store_dir) or vector_store_exists(store_dir)
+
+
+def load_sharded_store(store_dir, embeddings, mmap=True):
+    """并行加载全部分片"""
+    names = list_shards(store_dir)
+    stores = parallel_map(lambda name: load_vector_store(shard_dir(store_dir, name), embeddings, mmap), names)
+    return ShardedVectorStore(embeddings, dict(zip(names, stores)))
+
+
+def load_store(store_dir, embeddings):
+    """有分片时加载分片向量库，否则加载未分片的旧格式索引"""
+    if sharded_store_exists(store_dir):
+        return load_sharded_store(store_dir, embeddings)
+    return load_vector_store(store_dir, embeddings)
+
+
+def open_lexical_index(store_dir):
+    """打开与向量库对应的词法索引，不存在时返回None"""
+    if sharded_store_exists(store_dir):
+        paths = [os.path.join(shard_dir(store_dir, name), LEXICAL_INDEX_NAME) for name in list_shards(store_dir)]
+        paths = [p for p in paths if os.path.exists(p)]
+        return ShardedLexicalIndex(LexicalIndex(p) for p in paths) if paths else None
+    path = os.path.join(store_dir, LEXICAL_INDEX_NAME)
+    return LexicalIndex(path) if os.path.exists(path) else None
@@ -0,0 +1,120 @@
+# app/text_splitter.py
+import re
+import copy
+
+from langchain_core.documents import Document
+
+# 条款开头(行首): 第X章/节/条/款、3.2.1 形式的条款号、"3 基本规定" 形式的章标题
+CLAUSE_START = re.compile(
+    r"^[ \t\u3000]*(?:第[0-9一二三四五六七八九十百零〇两]+[章节条款]"
+    r"|\d+(?:\.\d+)+(?=[ \t\u3000\u4e00-\u9fff])"
+    r"|\d{1,2}[ \t\u3000]+(?=[\u4e00-\u9fff]))",
+    re.M,
+)
+# 句子: 到句末标点(连同后面的引号、括号)或空行为止
+_SENTENCE = re.compile(r".*?(?:[。！？；!?;…]+[”’」』）)\]]*|\n[ \t\u3000]*\n|$)", re.S)
+# 过长的句子先在逗号、顿号、冒号后断开
+_CLAUSE_PART = re.compile(r".*?(?:[，、：,:]+|$)", re.S)
+
+# bge等BERT类模型的 [CLS] [SEP]
+SPECIAL_TOKENS = 2
+
+
+def char_lengths(texts):
+    return [len(t) for t in texts]
+
+
+class ChineseTextSplitter:
+    """
+    面向中文规范、技术文档的单遍切分:
+    先按条款开头(第X条、3.2.1)分块、块内按句末标点分句，每段只计算一次token数，
+    再顺序装箱，片段尽量从条款开头起始，token数不超过 chunk_size
+    token_length(文本列表) 返回各文本的token数，默认按字符计
+    """
+
+    def __init__(self, chunk_size=500, chunk_overlap=50, token_length=None, min_fill=0.5):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.token_length = token_length or char_lengths
+        # 当前片段已达到该比例时遇到新条款就另起一个片段
+        self.min_tokens = int(chunk_size * min_fill)
+
+    @classmethod
+    def from_embeddings(cls, embeddings, chunk_size=500, chunk_overlap=50, **kwargs):
+        """用嵌入模型自己的tokenizer计数，chunk_size 不超过模型的最大序列长度"""
+        client = getattr(embeddings, "client", None)
+        tokenizer = getattr(client, "tokenizer", None)
+        if tokenizer is None:
+            return cls(chunk_size, chunk_overlap, **kwargs)
+        max_length = getattr(client, "max_seq_length", None)
+        if max_length:
+            chunk_size = min(chunk_size, max_length - SPECIAL_TOKENS)
+        # 切分与嵌入在不同线程中进行，快速tokenizer不能被并发调用，使用独立的副本
+        tokenizer = copy.deepcopy(tokenizer)
+
+        def token_length(texts):
+            if not texts:
+                return []
+            return tokenizer(texts, add_special_tokens=False, return_length=True)["length"]
+
+        return cls(chunk_size, min(chunk_overlap, chunk_size // 2), token_length, **kwargs)
+
+    def units(self, text):
+        """[(文本, 是否为条款开头)]，各段首尾相接即为原文"""
+        starts = sorted({0, *(m.start() for m in CLAUSE_START.finditer(text))})
+        units = []
+        for begin, end in zip(starts, starts[1:] + [len(text)]):
+            sentences = [m.group() for m in _SENTENCE.finditer(text, begin, end) if m.group()]
+            units.extend((s, i == 0 and begin > 0) for i, s in enumerate(sentences))
+        return units
+
+    def pieces(self, text, tokens):
+        """把超过 chunk_size 的句子断开: 先在逗号处，仍然过长则按字数均分"""
+        if tokens <= self.chunk_size:
+            return [(text, tokens)]
+        parts = [m.group() for m in _CLAUSE_PART.finditer(text) if m.group()]
+        if len(parts) == 1:
+            step = max(1, len(text) * self.chunk_size // (tokens + 1))
+            parts = [text[i:i + step] for i in range(0, len(text), step)]
+        result = []
+        for part, part_tokens in zip(parts, self.token_length(parts)):
+            result.extend(self.pieces(part, part_tokens))
+        return result
+
+    def split_text(self, text):
+        units = self.units(text)
+        if not units:
+            return []
+        chunks = []
+        current, current_tokens = [], 0
+        for (unit, clause), tokens in zip(units, self.token_length([u for u, _ in units])):
+            for piece, piece_tokens in self.pieces(unit, tokens):
+                if current and (current_tokens + piece_tokens > self.chunk_size
+                                or (clause and current_tokens >= self.min_tokens)):
+                    chunks.append("".join(t for t, _ in current))
+                    # 按长度断开时保留末尾几句作为重叠；在条款开头断开时新片段从条款开始
+                    current = [] if clause else self.overlap(current, piece_tokens)
+                    current_tokens = sum(n for _, n in current)
+                current.append((piece, piece_tokens))
+                current_tokens += piece_tokens
+                clause = False
+        if current:
+            chunks.append("".join(t for t, _ in current))
+        return [c.strip() for c in chunks if c.strip()]
+
+    def overlap(self, current, next_tokens):
+        """末尾不超过 chunk_overlap 个token的几段，且与下一段合计不超过 chunk_size"""
+        tail, tokens = [], 0
+        for text, n in reversed(current):
+            if tokens + n > self.chunk_overlap or tokens + n + next_tokens > self.chunk_size:
+                break
+            tail.insert(0, (text, n))
+            tokens += n
+        return tail
+
+    def split_documents(self, documents):
+        return [
+            Document(page_content=chunk, metadata=copy.deepcopy(doc.metadata))
+            for doc in documents
+            for chunk in self.split_text(doc.page_content)
+        ]
@@ -0,0 +1,168 @@
+# app/tracing.py
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 5 * 2**20
+DEFAULT_BACKUPS = 3
+
+
+class Span:
+    """一段计时区间，同一线程内嵌套的区间构成一条调用链"""
+
+    def __init__(self, name, attrs, parent=None):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.parent = parent
+        self.root = parent.root if parent else self
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.children = []
+        self.start = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    def walk(self, depth=0):
+        yield self, depth
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+    def to_record(self):
+        """整条调用链转成一条日志记录，子区间按先序展开"""
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": round(self.start, 3),
+            "duration_ms": round(self.duration_ms, 2),
+            "attrs": self.attrs,
+            "spans": [
+                {
+                    "name": span.name,
+                    "depth": depth,
+                    "offset_ms": round((span.start - self.start) * 1000, 2),
+                    "duration_ms": round(span.duration_ms, 2) if span.duration_ms is not None else None,
+                    "attrs": span.attrs,
+                }
+                for span, depth in self.walk() if span is not self
+            ],
+        }
+
+
+class Tracer:
+    """
+    轻量的分段计时: with tracer.span("retrieval"): ...
+    最外层区间结束时，整条调用链写入滚动的JSONL日志并通知监听者
+    另外在内存中保留最近的调用链和各阶段的累计耗时，供界面显示平均值
+    """
+
+    def __init__(self, recent=50):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._logger = None
+        self._listeners = []
+        self.recent = deque(maxlen=recent)
+        # (根区间名, 区间名) → [次数, 总耗时ms]
+        self.totals = {}
+
+    def configure(self, log_path, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS):
+        """启用JSONL日志，文件超过 max_bytes 后滚动，保留 backups 个旧文件"""
+        Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+        logger = logging.getLogger("rag.trace")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        self._logger = logger
+
+    def add_listener(self, callback):
+        """callback(record) 在结束调用链的线程中被调用"""
+        self._listeners.append(callback)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, **attrs):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(name, attrs, parent)
+        if parent is not None:
+            parent.children.append(span)
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.finish()
+            stack.pop()
+            if parent is None:
+                self._finish(span)
+
+    def add_span(self, name, duration_ms, **attrs):
+        """
+        在当前区间下记一个已结束的子区间，用于其他线程中累计的耗时(如流水线各阶段的忙碌时间)
+        子区间从父区间开始时算起；没有当前区间时忽略
+        """
+        parent = self.current()
+        if parent is None:
+            return
+        span = Span(name, attrs, parent)
+        span.start = parent.start
+        span.duration_ms = duration_ms
+        parent.children.append(span)
+
+    def _finish(self, root):
+        record = root.to_record()
+        with self._lock:
+            self.recent.append(record)
+            for span, _ in root.walk():
+                entry = self.totals.setdefault((root.name, span.name), [0, 0.0])
+                entry[0] += 1
+                entry[1] += span.duration_ms
+        if self._logger is not None:
+            try:
+                self._logger.info(json.dumps(record, ensure_ascii=False, default=str))
+            except Exception as e:
+                print(f"写入性能日志失败: {e}")
+        for callback in self._listeners:
+            try:
+                callback(record)
+            except Exception as e:
+                print(f"性能监听回调失败: {e}")
+
+    def averages(self, root_name):
+        """某类调用链中各阶段的平均耗时 {区间名: (次数, 平均ms)}"""
+        with self._lock:
+            return {
+                name: (count, total / count)
+                for (root, name), (count, total) in self.totals.items()
+                if root == root_name and count
+            }
+
+
+# 全局默认实例，各模块直接 from .tracing import tracer
+tracer = Tracer()
@@ -0,0 +1,325 @@
+# app/vector_index.py
+import os
+import json
+import math
+import uuid
+
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from .delta_index import DeltaSegment, Tombstones, remove_delta
+from .docstore import DOCSTORE_NAME, IdArrayMap, SQLiteDocstore
+
+INDEX_PARAMS_NAME = "index_params.json"
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# 自动选择索引类型的片段数阈值
+HNSW_MIN_CHUNKS = 20_000
+IVFPQ_MIN_CHUNKS = 500_000
+
+DEFAULT_PARAMS = {
+    "hnsw": {"hnsw_m": 32, "ef_construction": 200, "ef_search": 64},
+    "ivf": {"nprobe": 16},
+    "ivfpq": {"nprobe": 32, "pq_bits": 8},
+}
+
+
+def choose_index_type(num_chunks):
+    """按片段数选择索引: 小库暴力检索最准，中等规模用HNSW，超大规模用IVF-PQ压缩内存"""
+    if num_chunks < HNSW_MIN_CHUNKS:
+        return "flat"
+    if num_chunks < IVFPQ_MIN_CHUNKS:
+        return "hnsw"
+    return "ivfpq"
+
+
+def pq_min_chunks(params=None):
+    """PQ每个子空间要聚出 2^pq_bits 个码字，训练向量少于此数时FAISS无法训练"""
+    return 1 << (params or DEFAULT_PARAMS["ivfpq"])["pq_bits"]
+
+
+def resolve_index_type(index_type, num_chunks):
+    """auto 按片段数选择；片段数不足以训练PQ时 ivfpq 改用暴力索引(这种规模下暴力检索又快又准)"""
+    if index_type == "auto":
+        index_type = choose_index_type(num_chunks)
+    if index_type == "ivfpq" and num_chunks < pq_min_chunks():
+        return "flat"
+    return index_type
+
+
+def _pq_subquantizers(dim):
+    """PQ子空间数需整除维度，每个子空间取8维左右"""
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def make_params(index_type, num_chunks, dim):
+    index_type = resolve_index_type(index_type, num_chunks)
+    params = {"type": index_type, "dim": dim}
+    params.update(DEFAULT_PARAMS.get(index_type, {}))
+    if index_type in ("ivf", "ivfpq"):
+        # 聚类数约为4*sqrt(N)，且每个聚类至少有39个训练样本
+        params["nlist"] = max(1, min(int(4 * math.sqrt(num_chunks)), num_chunks // 39))
+    if index_type == "ivfpq":
+        params["pq_m"] = _pq_subquantizers(dim)
+    return params
+
+
+def new_index(params):
+    """按参数创建空的FAISS索引(IVF类尚未训练)"""
+    dim = params["dim"]
+    index_type = params["type"]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, params["nlist"])
+    elif index_type == "ivfpq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, params["nlist"],
+                                 params["pq_m"], params["pq_bits"])
+    else:
+        raise ValueError(f"未知的索引类型: {index_type}")
+    return index
+
+
+def build_index(vectors, params, batch_size=None):
+    """
+    按参数创建并训练FAISS索引，写入全部向量
+    vectors 可以是内存映射的数组，指定 batch_size 时分批读入写入，不把全部向量复制到内存
+    """
+    if not isinstance(vectors, np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+    index = new_index(params)
+    if not index.is_trained:
+        # 训练样本上限 256*nlist，足够聚类且不必扫描全部向量
+        sample_size = min(len(vectors), 256 * params["nlist"])
+        rows = np.sort(np.random.default_rng(0).choice(len(vectors), sample_size, replace=False))
+        index.train(np.ascontiguousarray(vectors[rows], dtype=np.float32))
+    step = batch_size or max(1, len(vectors))
+    for start in range(0, len(vectors), step):
+        index.add(np.ascontiguousarray(vectors[start:start + step], dtype=np.float32))
+    apply_search_params(index, params)
+    return index
+
+
+def add_vectors(vs, ids, vectors):
+    """把正文已写入文档库的片段向量追加到索引末尾"""
+    start = vs.index.ntotal
+    vs.index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    vs.index_to_docstore_id.update({start + i: chunk_id for i, chunk_id in enumerate(ids)})
+
+
+def apply_search_params(index, params):
+    """设置检索时参数，加载已保存的索引后也需要调用"""
+    if params.get("type") == "hnsw":
+        index.hnsw.efSearch = params["ef_search"]
+    elif params.get("type") in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+
+
+def index_type_of(index):
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf"
+    return "flat"
+
+
+def reconstruct_vectors(index, start=0, count=None):
+    """取回索引中从 start 起 count 条原始向量；PQ等有损编码无法还原时返回None"""
+    index_type = index_type_of(index)
+    if index_type == "ivfpq":
+        return None
+    if index_type == "ivf":
+        ivf = faiss.extract_index_ivf(index)
+        if ivf.direct_map.no():
+            ivf.make_direct_map()
+    if count is None:
+        count = index.ntotal - start
+    return index.reconstruct_n(start, count)
+
+
+def create_store(embeddings, docs, ids, vectors, params):
+    """用预先计算的向量和指定索引类型直接组装LangChain的FAISS向量库"""
+    index = build_index(vectors, params)
+    docstore = InMemoryDocstore(dict(zip(ids, docs)))
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+
+
+def read_params(store_dir):
+    path = os.path.join(store_dir, INDEX_PARAMS_NAME)
+    if not os.path.exists(path):
+        return {"type": "flat", "backend": "pickle"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_params(store_dir, params):
+    """原子写入索引参数，对sqlite后端而言这一步就是切换到新版本索引的提交点"""
+    tmp_path = os.path.join(store_dir, INDEX_PARAMS_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(params, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, os.path.join(store_dir, INDEX_PARAMS_NAME))
+
+
+def vector_store_exists(store_dir):
+    params = read_params(store_dir)
+    if params.get("backend") == "sqlite":
+        return os.path.exists(os.path.join(store_dir, params["index_file"]))
+    return os.path.exists(os.path.join(store_dir, "index.faiss"))
+
+
+def _read_index(path, mmap):
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"索引不支持内存映射，改为完整读取: {e}")
+    return faiss.read_index(path)
+
+
+def load_vector_store(store_dir, embeddings, mmap=True):
+    """
+    加载向量库并恢复保存时的索引类型和检索参数
+    sqlite后端: 向量以内存映射方式打开，片段正文留在SQLite中按需读取，启动耗时与库大小基本无关
+    mmap=False 时完整读入内存，得到可以继续增删的向量库(供索引构建使用)
+    之后追加的增量段: 内存映射时挂在 vs.delta 上参与检索，完整读入时直接并入索引
+    已删除片段的标记挂在 vs.tombstones 上，检索时过滤，重建时剔除
+    """
+    params = read_params(store_dir)
+    if params.get("backend") == "sqlite":
+        index = _read_index(os.path.join(store_dir, params["index_file"]), mmap)
+        ids = np.load(os.path.join(store_dir, params["ids_file"]), mmap_mode="r" if mmap else None)
+        if mmap:
+            mapping = IdArrayMap(ids)
+        else:
+            mapping = {pos: chunk_id.decode("utf-8") for pos, chunk_id in enumerate(ids)}
+        docstore = SQLiteDocstore(os.path.join(store_dir, DOCSTORE_NAME), params.get("compress", True))
+        vs = FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=mapping,
+        )
+        delta = DeltaSegment.open(store_dir, index.d, params.get("build_id"))
+        vs.tombstones = Tombstones.open(store_dir, params.get("build_id"))
+        if mmap:
+            vs.delta = delta
+        elif len(delta):
+            add_vectors(vs, delta.ids, delta.vectors())
+    else:
+        vs = FAISS.load_local(store_dir, embeddings, allow_dangerous_deserialization=True)
+    apply_search_params(vs.index, params)
+    vs.index_params = params
+    return vs
+
+
+def _save_pickle(vs, store_dir):
+    docstore, mapping = vs.docstore, vs.index_to_docstore_id
+    if not isinstance(docstore, InMemoryDocstore) or not isinstance(mapping, dict):
+        ids = [mapping[pos] for pos in range(len(mapping))]
+        docstore = InMemoryDocstore({chunk_id: docstore.search(chunk_id) for chunk_id in ids})
+        mapping = dict(enumerate(ids))
+    FAISS(
+        embedding_function=vs.embedding_function,
+        index=vs.index,
+        docstore=docstore,
+        index_to_docstore_id=mapping,
+    ).save_local(store_dir)
+
+
+def _save_sqlite(vs, store_dir, params, compress):
+    """写入新一代的索引文件和ID数组；旧版本文件可能仍被正在运行的程序映射，不能原地覆盖"""
+    generation = params.get("generation", 0) + 1
+    index_file = f"index-{generation}.faiss"
+    ids_file = f"ids-{generation}.npy"
+    faiss.write_index(vs.index, os.path.join(store_dir, index_file))
+
+    mapping = vs.index_to_docstore_id
+    ids = [mapping[pos] for pos in range(len(mapping))]
+    encoded = [chunk_id.encode("utf-8") for chunk_id in ids]
+    width = max((len(b) for b in encoded), default=1)
+    np.save(os.path.join(store_dir, ids_file), np.array(encoded, dtype=f"S{width}"))
+
+    docstore_path = os.path.join(store_dir, DOCSTORE_NAME)
+    docstore = vs.docstore
+    if not (isinstance(docstore, SQLiteDocstore)
+            and os.path.abspath(docstore.path) == os.path.abspath(docstore_path)):
+        target = SQLiteDocstore(docstore_path, compress)
+        existing = set(target.all_ids())
+        target.add(
+            {chunk_id: docstore.search(chunk_id) for chunk_id in ids if chunk_id not in existing},
+            overwrite=False,
+        )
+        target.delete(existing.difference(ids))
+        docstore = target
+
+    params = dict(params, backend="sqlite", compress=compress, generation=generation,
+                  index_file=index_file, ids_file=ids_file)
+    return params, docstore
+
+
+def _remove_old_generations(store_dir, params):
+    """清理旧版本的索引文件(包括迁移前pickle格式的文件)"""
+    keep = {params.get("index_file"), params.get("ids_file")}
+    for name in os.listdir(store_dir):
+        if name in ("index.faiss", "index.pkl") or \
+                (name.startswith("index-") and name.endswith(".faiss")) or \
+                (name.startswith("ids-") and name.endswith(".npy")):
+            if name in keep:
+                continue
+            try:
+                os.remove(os.path.join(store_dir, name))
+            except OSError:
+                # Windows下仍被映射的旧文件删不掉，留到下次保存时再清理
+                pass
+
+
+def save_vector_store(vs, store_dir, params, backend="pickle", compress=True):
+    """保存向量库，返回写入的索引参数；每次保存都会生成新的 build_id"""
+    os.makedirs(store_dir, exist_ok=True)
+    if backend == "sqlite":
+        params, docstore = _save_sqlite(vs, store_dir, params, compress)
+        params["build_id"] = uuid.uuid4().hex
+        write_params(store_dir, params)
+        # 新索引已生效，再删除不再引用的片段；增量段已并入新索引
+        docstore.flush()
+        remove_delta(store_dir)
+        _remove_old_generations(store_dir, params)
+        # 之后新增和删除的文件记入属于新版本的空增量段和删除标记
+        vs.delta = DeltaSegment(store_dir, vs.index.d, params["build_id"])
+        vs.tombstones = Tombstones(store_dir, params["build_id"])
+    else:
+        _save_pickle(vs, store_dir)
+        params = {k: v for k, v in params.items()
+                  if k not in ("backend", "compress", "generation", "index_file", "ids_file")}
+        params["backend"] = "pickle"
+        params["build_id"] = uuid.uuid4().hex
+        write_params(store_dir, params)
+    vs.index_params = params
+    return params
+
+
+def index_build_id(vs):
+    """索引版本标识，索引内容每次变化后都不同，供各级缓存判断是否失效"""
+    build_id = getattr(vs, "index_params", {}).get("build_id", "legacy")
+    delta = getattr(vs, "delta", None)
+    tombstones = getattr(vs, "tombstones", None)
+    if delta:
+        build_id += f"+{len(delta)}"
+    if tombstones is not None and tombstones.version:
+        build_id += f"-{tombstones.version}"
+    return build_id
@@ -0,0 +1,363 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import statistics
+import tempfile
+from pathlib import Path
+from typing import Any
+
+# 将项目根目录添加到sys.path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from benchmark_corpus import generate_corpus, generate_questions
+
+PRESETS = {
+    # (PDF数, DOCX数, 每个PDF页数, 每个DOCX条款数)
+    "tiny": (2, 2, 3, 20),
+    "small": (4, 4, 10, 60),
+    "medium": (16, 16, 30, 200),
+    "large": (64, 64, 60, 400),
+}
+STUB_DIM = 512
+# 阶段耗时超过基线该比例时视为性能回退
+DEFAULT_TOLERANCE = 0.10
+
+
+# ---------------- 桩模型: 不加载任何权重，只保留接口和确定性的输出 ----------------
+
+def make_stub_embeddings(dim=STUB_DIM):
+    from langchain_core.embeddings import Embeddings
+    import numpy as np
+
+    class StubEmbeddings(Embeddings):
+        """字二元组哈希到固定维度并归一化，速度只取决于文本长度"""
+
+        model_name = "stub-embeddings"
+
+        def _embed(self, text):
+            vector = np.zeros(dim, dtype=np.float32)
+            for i in range(max(1, len(text) - 1)):
+                digest = hashlib.blake2b(text[i:i + 2].encode("utf-8"), digest_size=4).digest()
+                value = int.from_bytes(digest, "little")
+                vector[value % dim] += 1.0 if value & 0x80000000 else -1.0
+            norm = np.linalg.norm(vector)
+            return (vector / norm if norm > 0 else vector).tolist()
+
+        def embed_documents(self, texts):
+            return [self._embed(t) for t in texts]
+
+        def embed_query(self, text):
+            return self._embed(text)
+
+    return StubEmbeddings()
+
+
+class StubTokenizer:
+    """按字符计token，只实现ContextBuilder和计数用到的调用方式"""
+
+    def __call__(self, texts, add_special_tokens=False, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        return {"input_ids": [[ord(c) for c in t] for t in texts]}
+
+
+class StubPipeline:
+    """模仿transformers文本生成管道的调用和返回格式，固定返回一段答案"""
+
+    answer = "根据检索到的规范条文，应按有关规定进行复核计算，并满足安全系数要求。"
+
+    def __init__(self):
+        self.tokenizer = StubTokenizer()
+
+    def __call__(self, prompt, **kwargs):
+        return [{"generated_text": self.answer}]
+
+
+def make_stub_llm():
+    from langchain_core.language_models.llms import LLM
+
+    class StubLLM(LLM):
+        pipeline: Any = None
+
+        @property
+        def _llm_type(self):
+            return "stub"
+
+        def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+            return self.pipeline(prompt)[0]["generated_text"]
+
+    return StubLLM(pipeline=StubPipeline())
+
+
+# ---------------- 测量 ----------------
+
+class Stages:
+    """按阶段记录耗时和处理量"""
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, func, *args, items=None, unit=None, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        entry = {"seconds": round(seconds, 4)}
+        count = items(result) if callable(items) else items
+        if count is not None:
+            entry["items"] = count
+            entry["unit"] = unit
+            entry["rate"] = round(count / seconds, 2) if seconds > 0 else None
+        self.results[name] = entry
+        print(f"  {name:<16}{seconds:>10.3f}s" + (f"  {count} {unit}" if count is not None else ""))
+        return result
+
+
+def percentile_ms(values, pct):
+    from app.batch_query import percentile
+    return round(percentile(values, pct) * 1000, 2)
+
+
+def last_trace(name):
+    from app.tracing import tracer
+    return next((record for record in reversed(tracer.recent) if record["name"] == name), None)
+
+
+def record_spans(stages, prefix, record):
+    """
+    把一次调用链中的子区间记为 "前缀.区间名" 阶段(嵌套的为 "前缀.父区间.区间名")，处理量取区间属性
+    流式入库的 加载/切分/判重/嵌入 并行运行，记录的是各自的忙碌时间，之和可能超过 stream_ingest
+    """
+    if record is None:
+        return
+    path = [prefix]
+    for span in record["spans"]:
+        del path[span["depth"]:]
+        path.append(span["name"])
+        if span["duration_ms"] is None:
+            continue
+        entry = {"seconds": round(span["duration_ms"] / 1000, 4)}
+        entry.update({key: value for key, value in span["attrs"].items() if isinstance(value, (int, float, str))})
+        stages.results[".".join(path)] = entry
+        print(f"{'  ' * (span['depth'] + 1)}{span['name']:<{22 - 2 * span['depth']}}{entry['seconds']:>10.3f}s")
+
+
+def run_once(corpus_dir, work_dir, embeddings, llm, args):
+    from app.indexing import IndexBuilder
+    from app.retrievers import RetrievalCache
+    from app.rag_pipeline import create_qa, create_retriever
+    from app.generation import build_prompt
+    from app.vector_index import load_vector_store
+
+    stages = Stages()
+    store_dir = Path(work_dir) / "vector_store"
+    shutil.rmtree(store_dir, ignore_errors=True)
+
+    # 与桌面程序相同的建索引路径: 文件清单 → 流式 加载/切分/判重/嵌入 → FAISS → 词法索引 → 保存
+    # 嵌入缓存放在索引目录中，每轮都从空缓存开始
+    builder = IndexBuilder(
+        embeddings, corpus_dir, store_dir, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+        splitter=args.splitter, load_workers=args.load_workers,
+        cache_path=str(store_dir / "embedding_cache.sqlite") if args.embedding_cache else None,
+        embed_batch_size=args.embed_batch_size, embed_workers=1 if args.models == "stub" else args.embed_workers,
+        index_type=args.index_type, store_backend=args.store_backend, near_duplicate_distance=args.near_distance,
+    )
+    vs, stats = stages.run("index_build", builder.build, items=lambda result: result[1]["chunks"], unit="chunks")
+    stages.results["index_build"].update({key: stats.get(key) for key in (
+        "added", "chunks", "index_type", "duplicates_exact", "duplicates_near", "cache_hits", "cache_misses",
+        "embed_rate")})
+    record_spans(stages, "index_build", last_trace("index_build"))
+
+    # 文档未变化时的再次构建: 扫描目录、比对清单、加载已有索引
+    stages.run("index_noop", builder.build, items=lambda result: result[1]["unchanged"], unit="files")
+    del vs
+    vs = stages.run("index_load", load_vector_store, str(store_dir), embeddings)
+
+    # 检索: 冷缓存下逐个查询，统计单次延迟
+    questions = generate_questions(args.queries, args.seed)
+    retriever = create_retriever(vs, RetrievalCache(), store_dir=str(store_dir), k=args.k)
+    latencies = []
+
+    def retrieve_all():
+        for question in questions:
+            start = time.perf_counter()
+            retriever.invoke(question)
+            latencies.append(time.perf_counter() - start)
+
+    stages.run("retrieval", retrieve_all, items=len(questions), unit="queries")
+    stages.results["retrieval"].update(
+        p50_ms=percentile_ms(latencies, 50), p95_ms=percentile_ms(latencies, 95)
+    )
+
+    # 生成: 检索 + 上下文裁剪 + 提示词 + 生成
+    if llm is not None and args.generate > 0:
+        qa = create_qa(llm, retriever)
+        qa.retriever.builder.log = False
+        pipe = llm.pipeline
+        gen_latencies, tokens = [], 0
+
+        def generate_all():
+            nonlocal tokens
+            for question in questions[:args.generate]:
+                start = time.perf_counter()
+                prompt = build_prompt(qa, question, qa.retriever.invoke(question))
+                output = pipe(prompt, max_new_tokens=args.max_new_tokens, return_full_text=False)
+                gen_latencies.append(time.perf_counter() - start)
+                answer = output[0]["generated_text"]
+                tokens += len(pipe.tokenizer(answer, add_special_tokens=False)["input_ids"])
+
+        stages.run("generation", generate_all, items=min(args.generate, len(questions)), unit="answers")
+        total = sum(gen_latencies)
+        stages.results["generation"].update(
+            p50_ms=percentile_ms(gen_latencies, 50), p95_ms=percentile_ms(gen_latencies, 95),
+            tokens=tokens, tokens_per_second=round(tokens / total, 2) if total > 0 else None,
+        )
+
+    return stages.results
+
+
+def median_results(runs):
+    """多次运行时每个阶段取耗时中位数的那一次"""
+    merged = {}
+    for name in runs[0]:
+        entries = sorted((run[name] for run in runs if name in run), key=lambda e: e["seconds"])
+        merged[name] = dict(entries[len(entries) // 2])
+        if len(entries) > 1:
+            merged[name]["runs"] = [e["seconds"] for e in entries]
+            merged[name]["stdev"] = round(statistics.stdev(e["seconds"] for e in entries), 4)
+    return merged
+
+
+def compare(results, baseline, tolerance):
+    """与基线逐阶段对比，返回回退的阶段列表"""
+    regressions = []
+    print(f"\n{'阶段':<16}{'基线(s)':>10}{'本次(s)':>10}{'变化':>10}")
+    for name, entry in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None or not base.get("seconds"):
+            print(f"{name:<16}{'-':>10}{entry['seconds']:>10.3f}{'新增':>10}")
+            continue
+        change = entry["seconds"] / base["seconds"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  ← 变慢"
+        print(f"{name:<16}{base['seconds']:>10.3f}{entry['seconds']:>10.3f}{change:>+10.1%}{flag}")
+    if baseline.get("meta", {}).get("models") != results["meta"]["models"] or \
+            baseline.get("meta", {}).get("corpus") != results["meta"]["corpus"]:
+        print("注意: 基线使用的模型或语料与本次不同，对比结果仅供参考")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端性能测试: 加载、切分、嵌入、建索引、保存/加载、检索、生成")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small", help="语料规模")
+    parser.add_argument("--corpus", help="使用已有文档目录，不生成合成语料")
+    parser.add_argument("--models", choices=["auto", "stub", "real"], default="auto",
+                        help="stub: 桩模型(秒级完成); real: 本地ChatGLM和bge模型; auto: 模型存在时用real")
+    parser.add_argument("--repeat", type=int, default=1, help="重复次数，各阶段取中位数")
+    parser.add_argument("--queries", type=int, default=50, help="检索测试的问题数")
+    parser.add_argument("--generate", type=int, default=3, help="生成测试的问题数，0 表示跳过")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--splitter", choices=["chinese", "recursive"], default="chinese")
+    parser.add_argument("--embed-batch-size", type=int, default=32)
+    parser.add_argument("--embed-workers", type=int)
+    parser.add_argument("--load-workers", type=int)
+    parser.add_argument("--index-type", default="auto")
+    parser.add_argument("--store-backend", choices=["sqlite", "pickle"], default="sqlite")
+    parser.add_argument("--near-distance", type=int, help="近似重复判定的SimHash距离阈值，默认只做精确去重")
+    parser.add_argument("--no-embedding-cache", dest="embedding_cache", action="store_false",
+                        help="建索引时不使用嵌入缓存")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="临时文件目录，默认使用系统临时目录并在结束后删除")
+    parser.add_argument("--output", help="结果保存为JSON文件")
+    parser.add_argument("--baseline", help="与该JSON结果对比")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的变慢比例")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有阶段变慢时以非零状态退出")
+    args = parser.parse_args()
+
+    from app.config import EMBEDDING_PATH, MODEL_PATH, LLM_QUANTIZATION, QUANTIZED_MODEL_DIR
+
+    if args.models == "auto":
+        args.models = "real" if os.path.exists(MODEL_PATH) and os.path.exists(EMBEDDING_PATH) else "stub"
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="rag_bench_"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        if args.corpus:
+            corpus_dir = Path(args.corpus)
+            corpus = {"path": str(corpus_dir)}
+        else:
+            corpus_dir = work_dir / "docs"
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+            pdf_files, docx_files, pages, clauses = PRESETS[args.preset]
+            print(f"生成合成语料 ({args.preset})...")
+            corpus = generate_corpus(corpus_dir, pdf_files, docx_files, pages, clauses, args.seed)
+            corpus["preset"] = args.preset
+
+        print(f"加载模型 ({args.models})...")
+        model_timings = {}
+        if args.models == "stub":
+            embeddings = make_stub_embeddings()
+            llm = make_stub_llm() if args.generate > 0 else None
+        else:
+            from app.model_loading import StageTimer, load_embeddings, load_llm
+            timer = StageTimer()
+            embeddings = timer.run("embeddings", load_embeddings, EMBEDDING_PATH)
+            llm = None
+            if args.generate > 0:
+                llm = load_llm(MODEL_PATH, timer=timer, quantization=LLM_QUANTIZATION,
+                               quant_cache_dir=QUANTIZED_MODEL_DIR)
+            model_timings = {name: round(seconds, 3) for name, seconds in timer.timings.items()}
+
+        runs = []
+        for i in range(args.repeat):
+            print(f"第 {i + 1}/{args.repeat} 轮:")
+            runs.append(run_once(corpus_dir, work_dir, embeddings, llm, args))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "models": args.models,
+            "corpus": corpus,
+            "settings": {key: getattr(args, key) for key in (
+                "queries", "generate", "max_new_tokens", "k", "splitter", "chunk_size", "chunk_overlap",
+                "embed_batch_size", "embed_workers", "load_workers", "index_type", "store_backend",
+                "near_distance", "embedding_cache", "repeat", "seed")},
+        },
+        "model_load": model_timings,
+        "stages": median_results(runs),
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"变慢超过 {args.tolerance:.0%} 的阶段: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import sys
+import random
+import zipfile
+import argparse
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+# 合成语料用到的词表，模拟水利设计规范的章节、条款和标准编号
+SUBJECTS = ["重力坝", "拱坝", "土石坝", "面板堆石坝", "溢洪道", "泄洪洞", "引水隧洞", "调压井",
+            "发电厂房", "消力池", "堤防", "水闸", "渡槽", "泵站", "围堰", "护岸工程"]
+ASPECTS = ["抗滑稳定", "渗流控制", "基础处理", "混凝土温控", "抗震设计", "结构计算", "防渗帷幕",
+           "排水系统", "安全监测", "施工导流", "消能防冲", "边坡稳定", "冻融防护", "泥沙淤积"]
+STANDARDS = ["GB 50201-2014", "SL 252-2017", "SL 319-2018", "DL/T 5077-1997", "SL 274-2020",
+             "GB 50286-2013", "SL 265-2016", "NB/T 35026-2014"]
+METHODS = ["有限元法", "刚体极限平衡法", "材料力学法", "拟静力法", "动力时程分析法", "数值模拟"]
+TEMPLATES = [
+    "{s}的{a}应按{std}的有关规定执行。",
+    "{s}{a}计算时，荷载组合应分为基本组合和特殊组合，并分别核算。",
+    "当{s}高度超过{n}m时，{a}应进行专门论证，必要时开展模型试验。",
+    "{s}{a}的安全系数不应小于{f}，特殊组合下可适当降低但不得小于{f2}。",
+    "{a}设计应结合地形地质条件，经技术经济比较后确定{s}的布置方案。",
+    "对于{grade}级建筑物，{s}的{a}应采用{method}进行复核。",
+    "{s}在运行期间应定期检查{a}情况，发现异常应及时分析原因并采取处理措施。",
+    "设计洪水标准应根据工程等别和{s}级别确定，{a}应满足校核洪水位的要求。",
+    "{s}基础开挖后应进行地质编录，{a}方案应根据揭露的地质条件进行调整。",
+    "采用{method}计算{s}{a}时，计算参数应根据试验成果并结合类似工程经验选取。",
+]
+CHINESE_DIGITS = "零一二三四五六七八九"
+
+
+def chinese_number(n):
+    """1~99 转为中文数字，用于“第X章”“第X条”"""
+    if n < 10:
+        return CHINESE_DIGITS[n]
+    tens, ones = divmod(n, 10)
+    text = ("" if tens == 1 else CHINESE_DIGITS[tens]) + "十"
+    return text + (CHINESE_DIGITS[ones] if ones else "")
+
+
+def make_sentence(rng):
+    return rng.choice(TEMPLATES).format(
+        s=rng.choice(SUBJECTS), a=rng.choice(ASPECTS), std=rng.choice(STANDARDS),
+        method=rng.choice(METHODS), grade=rng.randint(1, 5), n=rng.choice([30, 50, 70, 100, 150]),
+        f=rng.choice(["1.05", "1.10", "1.30", "3.0"]), f2=rng.choice(["1.00", "1.05", "2.5"]),
+    )
+
+
+def make_chapter(rng, chapter, sections, clauses_per_section):
+    """生成一章规范文本，条款编号形如 3.2.1"""
+    lines = [f"第{chinese_number(chapter)}章 {rng.choice(SUBJECTS)}{rng.choice(ASPECTS)}"]
+    for section in range(1, sections + 1):
+        lines.append(f"{chapter}.{section} {rng.choice(ASPECTS)}")
+        for clause in range(1, clauses_per_section + 1):
+            body = "".join(make_sentence(rng) for _ in range(rng.randint(2, 5)))
+            lines.append(f"{chapter}.{section}.{clause} {body}")
+    return lines
+
+
+def write_pdf(path, pages):
+    """每页一段文本，使用PyMuPDF内置的简体中文字体"""
+    import fitz
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50),
+                            text, fontname="china-s", fontsize=10)
+    doc.save(str(path))
+    doc.close()
+
+
+def write_docx(path, paragraphs):
+    """直接写出最小的DOCX包(只含正文)，不依赖python-docx"""
+    body = "".join(
+        f'<w:p><w:r><w:t xml:space="preserve">{escape(p)}</w:t></w:r></w:p>' for p in paragraphs
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-'
+            'officedocument.wordprocessingml.document.main+xml"/></Types>'
+        ))
+        z.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+            'relationships/officeDocument" Target="word/document.xml"/></Relationships>'
+        ))
+        z.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>'
+        ))
+
+
+def generate_corpus(out_dir, pdf_files=4, docx_files=4, pages_per_pdf=10, clauses_per_docx=60, seed=0):
+    """
+    在 out_dir 下生成合成的中文规范文档，同样的参数和种子得到同样的内容
+    返回语料统计 {"pdf_files", "docx_files", "pages", "chars", "bytes"}
+    """
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stats = {"pdf_files": pdf_files, "docx_files": docx_files, "pages": 0, "chars": 0, "bytes": 0}
+
+    for i in range(pdf_files):
+        pages = []
+        for page in range(pages_per_pdf):
+            text = "\n".join(make_chapter(rng, page % 20 + 1, 2, 3))
+            pages.append(text)
+            stats["chars"] += len(text)
+        path = out_dir / f"规范_{i + 1:03d}.pdf"
+        write_pdf(path, pages)
+        stats["pages"] += pages_per_pdf
+        stats["bytes"] += path.stat().st_size
+
+    for i in range(docx_files):
+        paragraphs = []
+        chapter = clause = 0
+        while clause < clauses_per_docx:
+            chapter += 1
+            paragraphs.append(f"第{chinese_number((chapter - 1) % 99 + 1)}章 {rng.choice(SUBJECTS)}")
+            for _ in range(min(10, clauses_per_docx - clause)):
+                clause += 1
+                paragraphs.append(f"第{chinese_number((clause - 1) % 99 + 1)}条 "
+                                  + "".join(make_sentence(rng) for _ in range(rng.randint(2, 4))))
+        stats["chars"] += sum(len(p) for p in paragraphs)
+        path = out_dir / f"技术要求_{i + 1:03d}.docx"
+        write_docx(path, paragraphs)
+        stats["bytes"] += path.stat().st_size
+
+    return stats
+
+
+def generate_questions(count, seed=0):
+    rng = random.Random(seed + 1)
+    forms = ["{s}的{a}有哪些要求？", "{std}中关于{s}{a}的规定是什么？",
+             "{s}{a}计算应采用什么方法？", "{s}{a}的安全系数取多少？"]
+    return [
+        rng.choice(forms).format(s=rng.choice(SUBJECTS), a=rng.choice(ASPECTS), std=rng.choice(STANDARDS))
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成的中文PDF/DOCX规范文档，用于性能测试")
+    parser.add_argument("output", help="输出目录")
+    parser.add_argument("--pdf-files", type=int, default=4)
+    parser.add_argument("--docx-files", type=int, default=4)
+    parser.add_argument("--pages-per-pdf", type=int, default=10)
+    parser.add_argument("--clauses-per-docx", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    stats = generate_corpus(args.output, args.pdf_files, args.docx_files, args.pages_per_pdf,
+                            args.clauses_per_docx, args.seed)
+    print(f"已生成 {stats['pdf_files']} 个PDF ({stats['pages']} 页)、{stats['docx_files']} 个DOCX，"
+          f"共 {stats['chars']} 字，{stats['bytes'] / 2**20:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
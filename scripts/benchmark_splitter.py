@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+
+# 将项目根目录添加到sys.path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from benchmark_corpus import SUBJECTS, chinese_number, make_chapter, make_sentence
+
+
+def synthetic_documents(pages, seed=0):
+    """在内存中生成规范文本页(不写PDF/DOCX)，一半为 3.2.1 形式的条款号，一半为“第X条”"""
+    from langchain_core.documents import Document
+    rng = random.Random(seed)
+    docs = []
+    for page in range(pages):
+        if page % 2 == 0:
+            text = "\n".join(make_chapter(rng, page % 20 + 1, 2, 3))
+        else:
+            lines = [f"第{chinese_number(page % 20 + 1)}章 {rng.choice(SUBJECTS)}"]
+            for clause in range(1, 11):
+                lines.append(f"第{chinese_number(clause)}条 "
+                             + "".join(make_sentence(rng) for _ in range(rng.randint(2, 4))))
+            text = "\n".join(lines)
+        docs.append(Document(page_content=text, metadata={"source": f"synthetic_{page // 50:03d}", "page": page % 50}))
+    return docs
+
+
+def load_documents(corpus_dir):
+    from app.ingest import ParallelLoader
+    from app.index_manifest import scan_documents
+    rels = sorted(scan_documents(corpus_dir))
+    loaded = ParallelLoader(corpus_dir).load(rels)
+    return [doc for rel in rels for doc in loaded.get(rel, [])]
+
+
+def load_token_length(path):
+    """用嵌入模型的tokenizer计数；模型不存在时按字符计"""
+    if not path or not os.path.exists(path):
+        return None, "chars"
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(path)
+
+    def token_length(texts):
+        if not texts:
+            return []
+        return tokenizer(texts, add_special_tokens=False, return_length=True)["length"]
+
+    return token_length, os.path.basename(path.rstrip("/\\"))
+
+
+def measure(name, splitter, docs, token_length, max_tokens, repeat):
+    """切分耗时取最快一次；片段长度统计按同一个tokenizer计数"""
+    from app.batch_query import percentile
+    from app.text_splitter import CLAUSE_START, char_lengths
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        chunks = splitter.split_documents(docs)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    texts = [c.page_content for c in chunks]
+    lengths = []
+    for i in range(0, len(texts), 1000):
+        lengths.extend((token_length or char_lengths)(texts[i:i + 1000]))
+    chars = sum(len(d.page_content) for d in docs)
+    return {
+        "splitter": name,
+        "seconds": round(best, 4),
+        "chars_per_second": round(chars / best) if best > 0 else None,
+        "chunks": len(chunks),
+        "tokens_mean": round(sum(lengths) / len(lengths), 1) if lengths else 0,
+        "tokens_p95": percentile(lengths, 95),
+        "tokens_max": max(lengths, default=0),
+        "over_limit": sum(1 for n in lengths if n > max_tokens),
+        "clause_start_ratio": round(sum(1 for t in texts if CLAUSE_START.match(t)) / len(texts), 3) if texts else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 RecursiveCharacterTextSplitter 与中文条款切分的速度和片段长度")
+    parser.add_argument("--corpus", help="使用已有文档目录(如 benchmark_corpus.py 生成的)，默认在内存中生成合成语料")
+    parser.add_argument("--pages", type=int, default=20000, help="合成语料页数")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--max-tokens", type=int, default=510, help="嵌入模型最大序列长度(不含特殊token)")
+    parser.add_argument("--tokenizer", help="tokenizer目录，默认使用本地bge模型")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果保存为JSON文件")
+    args = parser.parse_args()
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from app.config import EMBEDDING_PATH
+    from app.text_splitter import ChineseTextSplitter
+
+    token_length, unit = load_token_length(args.tokenizer or EMBEDDING_PATH)
+    if args.corpus:
+        docs = load_documents(args.corpus)
+        corpus = {"path": args.corpus}
+    else:
+        docs = synthetic_documents(args.pages, args.seed)
+        corpus = {"pages": args.pages, "seed": args.seed}
+    corpus["documents"] = len(docs)
+    corpus["chars"] = sum(len(d.page_content) for d in docs)
+    print(f"语料: {len(docs)} 页, {corpus['chars']} 字; 片段长度按 {unit} 计")
+
+    splitters = {
+        "recursive": RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap),
+        "chinese": ChineseTextSplitter(min(args.chunk_size, args.max_tokens), args.chunk_overlap, token_length),
+    }
+    results = [measure(name, splitter, docs, token_length, args.max_tokens, args.repeat)
+               for name, splitter in splitters.items()]
+
+    print(f"\n{'切分器':<12}{'耗时(s)':>10}{'字/秒':>12}{'片段数':>10}{'平均':>8}{'P95':>8}{'最大':>8}"
+          f"{'超长':>8}{'条款起始':>10}")
+    for r in results:
+        print(f"{r['splitter']:<12}{r['seconds']:>10.3f}{r['chars_per_second'] or 0:>12}{r['chunks']:>10}"
+              f"{r['tokens_mean']:>8}{r['tokens_p95']:>8}{r['tokens_max']:>8}{r['over_limit']:>8}"
+              f"{r['clause_start_ratio']:>10.1%}")
+    base, new = results
+    if new["seconds"] > 0:
+        print(f"\n速度: chinese 为 recursive 的 {base['seconds'] / new['seconds']:.2f} 倍")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"corpus": corpus, "token_unit": unit, "settings": vars(args), "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+# 将项目根目录添加到sys.path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 界面模块导入时不应加载的重量级依赖，它们只能在后台线程中导入
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "langchain", "langchain_core",
+                 "langchain_community", "faiss", "numpy", "fitz"]
+DEFAULT_BUDGET_MS = 500
+
+MEASURE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module):
+    """在新进程中导入模块，返回 (耗时秒, 已加载的重量级模块, -X importtime 输出)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", MEASURE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, cwd=str(project_root),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result["seconds"], result["heavy"], proc.stderr
+
+
+def slowest_imports(importtime_output, top=10):
+    """解析 -X importtime 输出，返回直接导入的模块中累计耗时最长的几个 [(模块, 毫秒)]"""
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth <= 1:
+            rows.append((name.strip(), int(cumulative) / 1000))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查界面模块的导入耗时，确保窗口能快速显示")
+    parser.add_argument("--module", default="app.rag_system", help="要检查的模块")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="导入耗时上限(毫秒)")
+    parser.add_argument("--runs", type=int, default=3, help="测量次数，取最快一次(排除磁盘缓存影响)")
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(max(1, args.runs)):
+        result = measure(args.module)
+        if best is None or result[0] < best[0]:
+            best = result
+    seconds, heavy, output = best
+
+    print(f"导入 {args.module}: {seconds * 1000:.0f}ms (上限 {args.budget_ms:.0f}ms)")
+    print("耗时最长的导入:")
+    for name, ms in slowest_imports(output):
+        print(f"  {name:<40}{ms:>10.1f}ms")
+
+    failed = False
+    if heavy:
+        print(f"失败: 导入时加载了重量级模块 {', '.join(heavy)}，应改为在使用处延迟导入")
+        failed = True
+    if seconds * 1000 > args.budget_ms:
+        print("失败: 导入耗时超出上限")
+        failed = True
+    if not failed:
+        print("通过")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
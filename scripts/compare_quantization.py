@@ -0,0 +1,169 @@
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+# 将项目根目录添加到sys.path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+PROMPT = "请简要说明重力坝抗滑稳定计算需要考虑哪些荷载组合。"
+
+# ChatGLM3-6B 的结构参数，--synthetic 模式按此构造随机权重的线性层
+CHATGLM3_HIDDEN = 4096
+CHATGLM3_FFN = 13696
+CHATGLM3_QKV = 4608  # 32个查询头 + 2组键值头，每头128维
+CHATGLM3_LAYERS = 28
+CHATGLM3_VOCAB = 65024
+
+
+def peak_memory_mb():
+    """当前进程的峰值常驻内存"""
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(model_path, mode, cache_dir, new_tokens):
+    """在当前进程中加载一种模式并测量，结果以JSON打印到stdout"""
+    import torch
+    from app.model_loading import load_model, load_tokenizer
+    from app.quantization import model_size_bytes
+
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    tokenizer = load_tokenizer(model_path)
+    model = load_model(model_path, "cpu", mode, cache_dir)
+    load_seconds = time.perf_counter() - start
+
+    inputs = tokenizer(PROMPT, return_tensors="pt")
+    with torch.no_grad():
+        model.generate(**inputs, max_new_tokens=4, do_sample=False)
+        start = time.perf_counter()
+        output = model.generate(**inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False)
+        elapsed = time.perf_counter() - start
+    generated = output.shape[1] - inputs["input_ids"].shape[1]
+
+    print(json.dumps({
+        "mode": mode,
+        "load_seconds": round(load_seconds, 2),
+        "weights_mb": round(model_size_bytes(model) / 2**20, 1),
+        "peak_rss_mb": round(peak_memory_mb(), 1),
+        "tokens": generated,
+        "tokens_per_second": round(generated / elapsed, 2),
+    }))
+
+
+def measure_synthetic(mode, new_tokens):
+    """
+    没有模型权重时的近似测量: 只构造一层ChatGLM3形状的线性层和输出层(随机权重)，
+    逐token做矩阵乘计时，再按28层外推整个模型的权重大小和生成速度(不含注意力计算和嵌入层查表)
+    """
+    import torch
+    import torch.nn as nn
+    from app.quantization import quantize_model, model_size_bytes
+
+    class Layer(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.query_key_value = nn.Linear(CHATGLM3_HIDDEN, CHATGLM3_QKV)
+            self.dense = nn.Linear(CHATGLM3_HIDDEN, CHATGLM3_HIDDEN, bias=False)
+            self.dense_h_to_4h = nn.Linear(CHATGLM3_HIDDEN, CHATGLM3_FFN * 2, bias=False)
+            self.dense_4h_to_h = nn.Linear(CHATGLM3_FFN, CHATGLM3_HIDDEN, bias=False)
+
+        def forward(self, x):
+            self.query_key_value(x)
+            x = x + self.dense(x)
+            gate, up = self.dense_h_to_4h(x).chunk(2, dim=-1)
+            return x + self.dense_4h_to_h(nn.functional.silu(gate) * up)
+
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    layer = Layer().eval()
+    head = nn.Module()
+    head.output_layer = nn.Linear(CHATGLM3_HIDDEN, CHATGLM3_VOCAB, bias=False)
+    if mode != "none":
+        quantize_model(layer, mode)
+        quantize_model(head, mode)
+    load_seconds = time.perf_counter() - start
+
+    x = torch.randn(1, 1, CHATGLM3_HIDDEN)
+    with torch.no_grad():
+        layer(x), head.output_layer(x)
+        layer_seconds = head_seconds = 0.0
+        for _ in range(new_tokens):
+            start = time.perf_counter()
+            layer(x)
+            layer_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            head.output_layer(x)
+            head_seconds += time.perf_counter() - start
+    step = (layer_seconds * CHATGLM3_LAYERS + head_seconds) / new_tokens
+    # 嵌入层不量化，按float32计入
+    weights = (model_size_bytes(layer) * CHATGLM3_LAYERS + model_size_bytes(head)
+               + CHATGLM3_VOCAB * CHATGLM3_HIDDEN * 4)
+
+    print(json.dumps({
+        "mode": mode,
+        "load_seconds": round(load_seconds, 2),
+        "weights_mb": round(weights / 2**20, 1),
+        "peak_rss_mb": round(peak_memory_mb(), 1),
+        "tokens": new_tokens,
+        "tokens_per_second": round(1 / step, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较 float32 / int8 / int4 三种CPU推理模式的内存占用和生成速度")
+    parser.add_argument("--model", default=str(project_root / "models" / "chatglm3-6b"))
+    parser.add_argument("--cache-dir", default=str(project_root / "data" / "quantized"))
+    parser.add_argument("--modes", nargs="+", default=["none", "int8", "int4"])
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--output", help="结果保存为JSON文件")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="不加载模型，用一层ChatGLM3形状的随机权重测量并外推到28层(峰值内存为单层进程的值)")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        if args.synthetic:
+            measure_synthetic(args.single, args.new_tokens)
+        else:
+            measure(args.model, args.single, args.cache_dir, args.new_tokens)
+        return
+
+    # 每种模式在独立进程中运行，峰值内存互不影响
+    results = []
+    for mode in args.modes:
+        print(f"测量模式: {mode} ...")
+        proc = subprocess.run(
+            [sys.executable, __file__, "--single", mode, "--model", args.model,
+             "--cache-dir", args.cache_dir, "--new-tokens", str(args.new_tokens)]
+            + (["--synthetic"] if args.synthetic else []),
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"  失败: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    baseline = next((r for r in results if r["mode"] == "none"), None)
+    print(f"\n{'模式':<8}{'加载(s)':>10}{'权重(MB)':>12}{'峰值内存(MB)':>16}{'tokens/s':>12}{'加速比':>8}")
+    for r in results:
+        speedup = r["tokens_per_second"] / baseline["tokens_per_second"] if baseline else float("nan")
+        print(f"{r['mode']:<8}{r['load_seconds']:>10}{r['weights_mb']:>12}"
+              f"{r['peak_rss_mb']:>16}{r['tokens_per_second']:>12}{speedup:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
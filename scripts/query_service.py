@@ -0,0 +1,11 @@
+import sys
+from pathlib import Path
+
+# 将项目根目录添加到sys.path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.query_service import main
+
+if __name__ == "__main__":
+    sys.exit(main())
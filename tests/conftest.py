@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "scripts"))
+
+
+@pytest.fixture
+def embeddings():
+    """scripts/benchmark.py 的桩嵌入模型: 字二元组哈希向量，确定且不加载权重"""
+    from benchmark import make_stub_embeddings
+    return make_stub_embeddings(64)
+
+
+@pytest.fixture
+def docs_dir(tmp_path):
+    path = tmp_path / "docs"
+    path.mkdir()
+    return path
+
+
+def write_docx(path, paragraphs):
+    from benchmark_corpus import write_docx as write
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    write(path, paragraphs)
+
+
+EOS, USER = 1, 3
+
+
+def make_pipe():
+    """生成测试用: 单层随机权重的小模型 + 逐字切分的tokenizer，<|user|> 为额外的结束符"""
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    vocab = {"<pad>": 0, "<eos>": EOS, "<unk>": 2, "<|user|>": USER}
+    for char in "abcdefghij问答题":
+        vocab[char] = len(vocab)
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Split("", "isolated")
+    backend.decoder = decoders.Fuse()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="<pad>", eos_token="<eos>",
+                                        unk_token="<unk>", additional_special_tokens=["<|user|>"])
+    tokenizer.padding_side = "right"
+    torch.manual_seed(0)
+    config = LlamaConfig(hidden_size=16, intermediate_size=32, num_hidden_layers=1, num_attention_heads=2,
+                         num_key_value_heads=1, vocab_size=len(vocab), pad_token_id=0, eos_token_id=EOS)
+    return SimpleNamespace(model=LlamaForCausalLM(config).eval(), tokenizer=tokenizer)
@@ -0,0 +1,54 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from conftest import make_pipe  # noqa: E402
+
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.prompts import PromptTemplate  # noqa: E402
+
+from app.batch_query import BatchQueryRunner  # noqa: E402
+
+
+class FakeRetriever:
+    def prefetch(self, questions):
+        pass
+
+    def invoke(self, question):
+        return [Document(page_content=question, metadata={"source": "a.docx"})]
+
+
+def make_qa(pipe):
+    chain = SimpleNamespace(
+        document_separator="\n", document_prompt=PromptTemplate.from_template("{page_content}"),
+        document_variable_name="context",
+        llm_chain=SimpleNamespace(prompt=PromptTemplate.from_template("{context}{question}"),
+                                  llm=SimpleNamespace(pipeline=pipe)),
+    )
+    return SimpleNamespace(retriever=FakeRetriever(), combine_documents_chain=chain)
+
+
+def test_concurrent_batches_share_model_serially():
+    pipe = make_pipe()
+    active = []
+    overlaps = []
+    generate = pipe.model.generate
+
+    def guarded(*args, **kwargs):
+        active.append(threading.get_ident())
+        overlaps.append(len(active))
+        try:
+            return generate(*args, **kwargs)
+        finally:
+            active.pop()
+
+    pipe.model.generate = guarded
+    runner = BatchQueryRunner(FakeRetriever(), make_qa(pipe), batch_size=2, concurrency=3, max_new_tokens=4)
+    items = [{"id": i, "question": q} for i, q in enumerate(["问答", "题a", "abc", "问题", "答b", "cd"])]
+    results = runner.run(items)
+    assert len(overlaps) == 3 and max(overlaps) == 1
+    assert all("error" not in r and r["generation_ms"] > 0 for r in results)
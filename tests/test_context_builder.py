@@ -0,0 +1,44 @@
+from langchain_core.documents import Document
+
+from app.context_builder import ContextBuilder, split_sentences
+
+
+def char_tokenizer(texts, add_special_tokens=True):
+    """每个字一个token"""
+    return {"input_ids": [list(t) for t in texts]}
+
+
+DOCS = [
+    Document(page_content="重力坝抗滑稳定计算应考虑基本荷载组合。特殊荷载组合包括地震情况。坝体混凝土标号不低于C20。",
+             metadata={"source": "a.pdf"}),
+    # 与上一片段重叠的句子和只差空白的句子
+    Document(page_content="特殊荷载组合包括地震情况。坝体混凝土 标号不低于C20。施工期应做好温控。",
+             metadata={"source": "b.pdf"}),
+    Document(page_content="厂房照明设计另见电气规范。", metadata={"source": "c.pdf"}),
+]
+
+
+def test_split_sentences():
+    assert split_sentences("第一句。第二句；\n第三句") == ["第一句。", "第二句；", "第三句"]
+
+
+def test_removes_overlap_and_keeps_order():
+    builder = ContextBuilder(char_tokenizer, token_budget=1000, log=False)
+    docs = builder.build("重力坝荷载组合", DOCS)
+    assert [d.page_content for d in docs] == [
+        "重力坝抗滑稳定计算应考虑基本荷载组合。特殊荷载组合包括地震情况。坝体混凝土标号不低于C20。",
+        "施工期应做好温控。",
+        "厂房照明设计另见电气规范。",
+    ]
+    assert [d.metadata["source"] for d in docs] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert builder.last_stats["tokens_before"] == sum(len(d.page_content) for d in DOCS)
+
+
+def test_budget_keeps_most_relevant_sentences():
+    builder = ContextBuilder(char_tokenizer, token_budget=35, log=False)
+    docs = builder.build("重力坝荷载组合", DOCS)
+    kept = "".join(d.page_content for d in docs)
+    assert builder.last_stats["tokens_after"] == len(kept) <= 35
+    assert "重力坝抗滑稳定计算应考虑基本荷载组合。" in kept and "特殊荷载组合包括地震情况。" in kept
+    assert "厂房照明" not in kept
+    assert builder.last_stats["chunks_after"] == len(docs) < 3
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from app.dedup import ChunkDeduplicator, NearDuplicateIndex, chunk_id, code_digest, code_tokens
+
+# 十条内容各不相同的条款，约330字
+CLAUSES = "".join(
+    f"第{n}条 闸门启闭机应定期检修，{item}的运行维护要求按本规程执行。"
+    for n, item in zip("一二三四五六七八九十", ["泄洪设施", "导流隧洞", "厂房结构", "边坡支护", "监测仪器",
+                                              "供水管道", "电气设备", "消防系统", "交通道路", "通信线路"])
+)
+
+
+def chunks(*texts):
+    return [SimpleNamespace(page_content=t) for t in texts]
+
+
+def test_chunk_id_ignores_layout():
+    assert chunk_id("重力坝 抗滑稳定\n计算") == chunk_id("重力坝抗滑稳定计算")
+    assert chunk_id("ＧＢ５００１０") == chunk_id("gb50010")
+    assert code_tokens("按GB50010-2010第3.2.1条取0.85") == ["gb50010-2010", "3.2.1", "0.85"]
+
+
+def test_exact_duplicates_merge_with_known_and_batch():
+    dedup = ChunkDeduplicator(known={chunk_id("旧片段")})
+    ids, fresh = dedup.assign(chunks("旧片段", "新片段", "新 片段"))
+    assert ids == [chunk_id("旧片段"), chunk_id("新片段"), chunk_id("新片段")]
+    assert fresh == [False, True, False]
+    assert dedup.stats == {"exact": 2, "near": 0}
+
+
+def test_near_duplicates_merge_unless_numbers_differ(tmp_path):
+    index = NearDuplicateIndex(tmp_path / "dedup.sqlite")
+    dedup = ChunkDeduplicator(near_index=index)
+    reworded = CLAUSES.replace("厂房结构", "厂房构造")
+    revised = CLAUSES.replace("应定期检修", "应每2年检修", 1)
+    assert code_digest(reworded) == code_digest(CLAUSES) != code_digest(revised)
+    ids, fresh = dedup.assign(chunks(CLAUSES, reworded, revised))
+    assert ids == [chunk_id(CLAUSES), chunk_id(CLAUSES), chunk_id(revised)]
+    assert fresh == [True, False, True]
+    assert dedup.stats == {"exact": 0, "near": 1}
+
+    # 被删除的片段不再作为归并目标
+    index.delete([chunk_id(CLAUSES)])
+    ids, fresh = ChunkDeduplicator(near_index=index).assign(chunks(reworded))
+    assert ids == [chunk_id(reworded)] and fresh == [True]
@@ -0,0 +1,31 @@
+import shutil
+
+from conftest import write_docx
+
+from app.embedding_cache import EmbeddingCache
+from app.indexing import IndexBuilder
+
+
+def test_eviction_keeps_recent_entries(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", "m", max_entries=10)
+    for start in range(0, 25, 5):
+        texts = [f"t{i}" for i in range(start, start + 5)]
+        cache.put_many(texts, [[float(i)] * 4 for i in range(start, start + 5)])
+        assert cache.row_count() <= 10
+    assert cache.get_many(["t24"]) == [[24.0] * 4]
+    assert cache.get_many(["t0"]) == [None]
+    cache.close()
+
+
+def test_build_reuses_cache(embeddings, docs_dir, tmp_path):
+    write_docx(docs_dir / "a.docx", [f"第{i}条 闸门启闭机应定期检修，检修周期不超过{i}年。" for i in range(1, 30)])
+    kwargs = dict(cache_path=tmp_path / "cache.sqlite", chunk_size=60, chunk_overlap=0,
+                  load_workers=1, embed_workers=1, lexical=False)
+    _, first = IndexBuilder(embeddings, docs_dir, tmp_path / "store", **kwargs).build()
+    assert first["cache_hits"] == 0 and first["cache_misses"] == first["chunks"]
+
+    shutil.rmtree(tmp_path / "store")
+    builder = IndexBuilder(embeddings, docs_dir, tmp_path / "store", **kwargs)
+    _, second = builder.build()
+    assert second["cache_hits"] == first["chunks"] and second["cache_misses"] == 0
+    assert builder.cache is None
@@ -0,0 +1,59 @@
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from conftest import EOS, USER, make_pipe  # noqa: E402
+
+from app.generation import generate_batch, stop_token_ids  # noqa: E402
+
+
+class ForceTokens(transformers.LogitsProcessor):
+    """按步数为每行指定下一个token: plan[行号] = [token, ...]，用完后一直输出 "a" """
+
+    def __init__(self, tokenizer, plan):
+        self.plan = plan
+        self.a = tokenizer.convert_tokens_to_ids("a")
+        self.steps = 0
+
+    def __call__(self, input_ids, scores):
+        scores = torch.full_like(scores, -1e9)
+        for row in range(scores.shape[0]):
+            tokens = self.plan.get(row, [])
+            scores[row, tokens[self.steps] if self.steps < len(tokens) else self.a] = 0
+        self.steps += 1
+        return scores
+
+
+def run(pipe, prompts, processor, max_new_tokens=8, cancelled=None):
+    events = []
+    results = generate_batch(
+        pipe, prompts, {"max_new_tokens": max_new_tokens, "do_sample": False,
+                        "logits_processor": transformers.LogitsProcessorList([processor])},
+        lambda row, text: events.append(("token", row, text)),
+        lambda row, result: events.append(("done", row, result["text"])), cancelled)
+    return results, events
+
+
+def test_user_token_stops_row_and_other_rows_continue():
+    pipe = make_pipe()
+    b = pipe.tokenizer.convert_tokens_to_ids("b")
+    assert {EOS, USER} <= stop_token_ids(pipe.model, pipe.tokenizer)
+    processor = ForceTokens(pipe.tokenizer, {0: [b, USER]})
+    results, events = run(pipe, ["问答", "题abc"], processor)
+    assert results[0]["text"] == "b" and results[0]["tokens"] == 1
+    assert results[1]["text"] == "a" * 8
+    # 第0行先结束并先回调
+    assert [e[1] for e in events if e[0] == "done"] == [0, 1]
+    assert results[0]["ms"] <= results[1]["ms"]
+    assert pipe.tokenizer.padding_side == "right"
+
+
+def test_cancelled_rows_stop_generation():
+    pipe = make_pipe()
+    processor = ForceTokens(pipe.tokenizer, {})
+    results, events = run(pipe, ["问答", "题abc"], processor, max_new_tokens=50,
+                          cancelled=lambda row: processor.steps >= 3)
+    assert processor.steps < 10
+    assert not [e for e in events if e[0] == "done"]
@@ -0,0 +1,17 @@
+import sys
+import subprocess
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).parent.parent
+
+
+def test_ui_import_time():
+    """界面模块的导入耗时不超过上限，且不加载重量级依赖(scripts/check_import_time.py 返回0)"""
+    pytest.importorskip("PyQt5")
+    proc = subprocess.run(
+        [sys.executable, str(project_root / "scripts" / "check_import_time.py")],
+        capture_output=True, text=True, cwd=str(project_root),
+    )
+    assert proc.returncode == 0, proc.stdout + proc.stderr
@@ -0,0 +1,54 @@
+import os
+
+from app.index_manifest import IndexManifest, file_sha256, scan_documents
+
+
+def write(path, data, mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_diff_classifies_files(docs_dir, tmp_path):
+    for name in ("same.pdf", "touched.pdf", "edited.pdf", "removed.pdf"):
+        write(docs_dir / name, name.encode(), mtime=1_000_000)
+    manifest = IndexManifest(tmp_path / "store", {"chunk_size": 500})
+    for rel, st in scan_documents(docs_dir).items():
+        manifest.set_file(rel, st, file_sha256(docs_dir / rel), [rel + "#0"])
+    manifest.save()
+
+    write(docs_dir / "touched.pdf", b"touched.pdf", mtime=2_000_000)
+    write(docs_dir / "edited.pdf", b"edited.pdf v2", mtime=1_000_000)
+    write(docs_dir / "sub" / "new.docx", b"new")
+    write(docs_dir / "notes.txt", b"ignored")
+    (docs_dir / "removed.pdf").unlink()
+
+    manifest = IndexManifest(tmp_path / "store", {"chunk_size": 500}).load()
+    current = scan_documents(docs_dir)
+    assert list(current) == ["edited.pdf", "same.pdf", "sub/new.docx", "touched.pdf"]
+    changed, removed, touched = manifest.diff(docs_dir, current)
+    assert [rel for rel, _ in changed] == ["edited.pdf", "sub/new.docx"]
+    assert changed[0][1] == file_sha256(docs_dir / "edited.pdf")
+    assert removed == ["removed.pdf"]
+    assert touched == {"touched.pdf": {"size": 11, "mtime": 2_000_000}}
+
+
+def test_settings_change_discards_manifest(docs_dir, tmp_path):
+    write(docs_dir / "a.pdf", b"a")
+    manifest = IndexManifest(tmp_path / "store", {"chunk_size": 500})
+    manifest.set_file("a.pdf", (docs_dir / "a.pdf").stat(), file_sha256(docs_dir / "a.pdf"), ["x", "y"])
+    manifest.save()
+    assert IndexManifest(tmp_path / "store", {"chunk_size": 500}).load().all_chunk_ids() == ["x", "y"]
+    assert IndexManifest(tmp_path / "store", {"chunk_size": 300}).load().files == {}
+
+
+def test_near_dependents_follow_removed_originals(tmp_path):
+    manifest = IndexManifest(tmp_path / "store")
+    st = os.stat_result((0,) * 10)
+    manifest.set_file("orig.pdf", st, "1", ["a", "b"])
+    manifest.set_file("copy.pdf", st, "2", ["a", "c"], near_ids=["a"])
+    manifest.set_file("other.pdf", st, "3", ["a"])
+    assert manifest.near_dependents(["orig.pdf"]) == []
+    assert manifest.near_dependents(["orig.pdf", "other.pdf"]) == ["copy.pdf"]
+    assert manifest.chunk_sources(["a"])["a"][-1] == ("copy.pdf", None)
@@ -0,0 +1,23 @@
+import time
+from types import SimpleNamespace
+
+from app.ingest_pipeline import IngestPipeline
+
+
+def test_stage_busy_time_recorded():
+    def load(files):
+        for rel in files:
+            yield rel, [SimpleNamespace(page_content=f"{rel}-{i}") for i in range(4)], True
+
+    def embed(texts):
+        time.sleep(0.02)
+        return [[0.0] for _ in texts]
+
+    pipeline = IngestPipeline(load, lambda rel, docs: docs, lambda chunks: (chunks, [True] * len(chunks)),
+                              embed, batch_size=4)
+    batches = list(pipeline.run(["a", "b", "c"]))
+    assert sum(len(ids) for _, _, ids, _, _ in batches) == 12
+    assert pipeline.stats["batches"] == 3
+    assert pipeline.stats["embed_seconds"] >= 0.06
+    # 其他阶段等待下游的时间不计入忙碌时间
+    assert pipeline.stats["load_seconds"] < 0.02
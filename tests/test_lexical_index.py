@@ -0,0 +1,36 @@
+from app.lexical_index import LexicalIndex, tokenize
+
+TEXTS = {
+    "a": "水利水电工程等级划分及洪水标准 SL 252-2017 适用于大中型工程。",
+    "b": "混凝土重力坝设计规范 SL 319-2018 规定了抗滑稳定计算方法。",
+    "c": "碾压混凝土坝的温度控制应结合施工进度安排。",
+}
+
+
+def make_index(tmp_path):
+    index = LexicalIndex(tmp_path / "lexical.sqlite")
+    index.add(list(TEXTS), list(TEXTS.values()))
+    return index
+
+
+def test_tokenize_keeps_codes_and_parts():
+    tokens = tokenize("按SL 252-2017执行")
+    assert "252-2017" in tokens and "252" in tokens and "2017" in tokens
+    assert "执行" in tokens and "sl" in tokens
+
+
+def test_search_ranks_exact_code(tmp_path):
+    index = make_index(tmp_path)
+    assert len(index) == 3
+    assert index.search("SL 252-2017", 3)[0][0] == "a"
+    assert index.search("重力坝抗滑稳定", 3)[0][0] == "b"
+    assert index.search("隧洞衬砌", 3) == []
+
+
+def test_delete_and_reopen(tmp_path):
+    make_index(tmp_path).delete(["a"])
+    index = LexicalIndex(tmp_path / "lexical.sqlite")
+    assert len(index) == 2
+    assert all(chunk_id != "a" for chunk_id, _ in index.search("SL 252-2017", 3))
+    index.reset()
+    assert len(index) == 0
@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import write_docx
+
+from app.dedup import chunk_id
+from app.index_manifest import IndexManifest
+from app.indexing import IndexBuilder, tombstone_count
+from app.retrievers import search_ids
+
+A = [f"第{i}条 闸门启闭机应定期检修，检修周期不超过{i}年。" for i in range(1, 10)]
+B = [f"第{i}条 溢洪道闸墩混凝土应每{i}年检测一次。" for i in range(1, 10)]
+
+
+@pytest.fixture
+def make_builder(embeddings, docs_dir, tmp_path):
+    def make_builder():
+        return IndexBuilder(embeddings, docs_dir, tmp_path / "store", chunk_size=40, chunk_overlap=0,
+                            load_workers=1, embed_workers=1, store_backend="sqlite", lexical=False)
+    return make_builder
+
+
+def live_ids(tmp_path):
+    return set(IndexManifest(tmp_path / "store").load().all_chunk_ids())
+
+
+def test_live_update_tombstones_then_compacts(make_builder, embeddings, docs_dir, tmp_path):
+    write_docx(docs_dir / "a.docx", A)
+    write_docx(docs_dir / "b.docx", B)
+    vs, stats = make_builder().build()
+    assert stats["chunks"] == 18
+
+    # 删除一个文件、修改另一个文件的一条: 只打删除标记，新片段进增量段
+    (docs_dir / "b.docx").unlink()
+    write_docx(docs_dir / "a.docx", A[:-1] + ["第9条 闸门启闭机大修后应进行荷载试验。"])
+    vs, stats = make_builder().apply_live(vs)
+    assert stats["removed"] == 1 and stats["updated"] == 1 and stats["chunks_added"] == 1
+    assert len(vs.tombstones) == tombstone_count(tmp_path / "store") == 10
+    assert len(vs.delta) == 1 and stats["chunks"] == 9
+    assert stats["needs_compaction"]
+
+    results = [i for i, _ in search_ids(vs, embeddings.embed_query("溢洪道闸墩混凝土检测"), 9)]
+    assert set(results) == live_ids(tmp_path)
+    assert chunk_id("第9条 闸门启闭机大修后应进行荷载试验。") in results
+
+    # 完整构建时压缩: 过期片段从主索引中剔除，删除标记和增量段清空
+    vs, stats = make_builder().build()
+    assert stats["chunks_removed"] == 10 and tombstone_count(tmp_path / "store") == 0
+    assert set(vs.index_to_docstore_id.values()) == live_ids(tmp_path)
+    assert len(vs.tombstones) == 0 and len(vs.delta) == 0
@@ -0,0 +1,58 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from torch import nn  # noqa: E402
+
+from app.quantization import Int4Linear, load_quantized_model  # noqa: E402
+
+
+class TinyModel(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.dense = nn.Linear(256, 64)
+        self.odd = nn.Linear(33, 64, bias=False)
+        self.output_layer = nn.Linear(64, 100)
+        self.norm = nn.LayerNorm(64)
+
+    def forward(self, x):
+        return self.output_layer(self.norm(self.dense(x) + self.odd(x[:, :33])))
+
+
+def build_empty_model():
+    with torch.device("meta"):
+        return TinyModel()
+
+
+@pytest.mark.parametrize("mode", ["int8", "int4"])
+def test_cache_round_trip(tmp_path, mode):
+    model_path = tmp_path / "tiny"
+    model_path.mkdir()
+    (model_path / "config.json").write_text("{}")
+    torch.manual_seed(0)
+    loads = []
+
+    def load_float_model():
+        loads.append(1)
+        return TinyModel().eval()
+
+    first = load_quantized_model(model_path, mode, tmp_path / "cache", load_float_model, build_empty_model)
+    second = load_quantized_model(model_path, mode, tmp_path / "cache", load_float_model, build_empty_model)
+    assert len(loads) == 1
+    assert type(second.dense) is type(first.dense) and type(second.dense) is not nn.Linear
+    if mode == "int4":
+        assert isinstance(first.dense, Int4Linear)
+        assert type(first.odd) is nn.Linear and type(first.output_layer) is nn.Linear
+    x = torch.randn(3, 256)
+    with torch.no_grad():
+        assert torch.equal(first(x), second(x))
+
+
+def test_weights_only_cache(tmp_path):
+    model_path = tmp_path / "tiny"
+    model_path.mkdir()
+    (model_path / "config.json").write_text("{}")
+    load_quantized_model(model_path, "int8", tmp_path / "cache", lambda: TinyModel().eval(), build_empty_model)
+    cache_file, = (tmp_path / "cache").glob("*.pt")
+    state_dict = torch.load(cache_file, weights_only=True)
+    assert "dense._packed_params._packed_params" in state_dict
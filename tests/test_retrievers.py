@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+
+from app.retrievers import TOMBSTONE_OVERFETCH, search_ids_batch
+
+
+class CountingIndex:
+    """记录每次查询取的条数"""
+
+    def __init__(self, index):
+        self.index = index
+        self.fetches = []
+
+    def search(self, query, k):
+        self.fetches.append(k)
+        return self.index.search(query, k)
+
+
+def make_store(vectors, dead):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return SimpleNamespace(index=CountingIndex(index), tombstones=frozenset(dead),
+                           index_to_docstore_id={i: f"c{i}" for i in range(len(vectors))})
+
+
+def brute_force(vectors, query, dead, k):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    return [f"c{i}" for i in np.argsort(distances) if f"c{i}" not in dead][:k]
+
+
+def test_tombstones_filtered_without_full_overfetch():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3000, 8)).astype(np.float32)
+    query = rng.standard_normal((3, 8)).astype(np.float32)
+    dead = {f"c{i}" for i in range(0, 3000, 3)}
+    store = make_store(vectors, dead)
+    results = search_ids_batch(store, query, 4)
+    for row, q in zip(results, query):
+        assert [chunk_id for chunk_id, _ in row] == brute_force(vectors, q, dead, 4)
+    assert store.index.fetches == [4 + TOMBSTONE_OVERFETCH]
+
+
+def test_refetches_when_nearest_are_deleted():
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((500, 8)).astype(np.float32)
+    query = vectors[:1] + 1e-3
+    # 离查询最近的50个片段全部已删除，首次多取的条数不够；另有150个远处的删除标记
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    dead = {f"c{i}" for i in np.argsort(distances)[:50]}.union(f"c{i}" for i in np.argsort(distances)[-150:])
+    store = make_store(vectors, dead)
+    row = search_ids_batch(store, query, 4)[0]
+    assert [chunk_id for chunk_id, _ in row] == brute_force(vectors, query[0], dead, 4)
+    assert len(store.index.fetches) > 1
+    assert store.index.fetches[-1] < 4 + len(dead)
@@ -0,0 +1,28 @@
+from conftest import write_docx
+
+from app.indexing import ShardedIndexBuilder
+from app.retrievers import search_ids_batch
+from app.sharded_store import merge_unique
+
+SHARED = ["第1条 坝体混凝土强度等级不应低于C20，抗渗等级应满足设计要求。"]
+
+
+def test_merge_unique_keeps_best_copy():
+    rows = [[("a", 0.1), ("b", 0.3)], [("a", 0.05), ("c", 0.2)]]
+    assert merge_unique(rows, 3) == [("a", 0.05), ("c", 0.2), ("b", 0.3)]
+    assert merge_unique(rows, 2, reverse=True) == [("b", 0.3), ("c", 0.2)]
+
+
+def test_cross_shard_duplicates_merged(embeddings, docs_dir, tmp_path):
+    # 两个子文件夹(两个分片)各有一份正文相同的片段，以及各自独有的片段
+    write_docx(docs_dir / "甲" / "a.docx", SHARED + ["第2条 溢洪道闸门应设置检修门槽。"])
+    write_docx(docs_dir / "乙" / "b.docx", SHARED + ["第3条 大坝安全监测应包括变形和渗流监测。"])
+    builder = ShardedIndexBuilder(embeddings, docs_dir, tmp_path / "store", chunk_size=40, chunk_overlap=0,
+                                  load_workers=1, embed_workers=1, lexical=False)
+    store, stats = builder.update()
+    assert stats["shards"] == 2
+
+    query = [embeddings.embed_query(SHARED[0])]
+    ids = [chunk_id for chunk_id, _ in search_ids_batch(store, query, 3)[0]]
+    assert len(ids) == 3
+    assert len(set(ids)) == 3
@@ -0,0 +1,48 @@
+import re
+
+from langchain_core.documents import Document
+
+from app.text_splitter import ChineseTextSplitter
+
+TEXT = (
+    "3.1.1 闸门启闭机应定期检修。检修周期不超过一年。检修记录应存档。\n"
+    "3.1.2 泄洪设施应在汛前全面检查，检查内容包括闸门、启闭机、电源和通信，"
+    "发现问题应及时处理并报告主管部门，处理完成后复查。\n"
+    "3.1.3 监测仪器应每季度校验一次。" + "超长句子没有任何标点" * 10 + "。"
+)
+
+
+def squeeze(text):
+    return re.sub(r"\s+", "", text)
+
+
+def test_chunks_respect_size_and_cover_text():
+    chunks = ChineseTextSplitter(chunk_size=60, chunk_overlap=0).split_text(TEXT)
+    assert all(len(c) <= 60 for c in chunks)
+    assert squeeze("".join(chunks)) == squeeze(TEXT)
+    # 条款开头另起一个片段，过长的句子先在逗号处断开，没有标点的按字数均分
+    assert chunks[0] == "3.1.1 闸门启闭机应定期检修。检修周期不超过一年。检修记录应存档。"
+    assert chunks[1].startswith("3.1.2 ") and chunks[1].endswith("，")
+
+
+def test_overlap_repeats_trailing_sentences():
+    text = "".join(f"第{i}句内容较短。" for i in range(1, 13))
+    chunks = ChineseTextSplitter(chunk_size=40, chunk_overlap=10).split_text(text)
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        tail = re.findall(r"[^。]+。", previous)[-1]
+        assert chunk.startswith(tail)
+
+
+def test_custom_token_length():
+    # 每个字按2个token计
+    splitter = ChineseTextSplitter(chunk_size=60, chunk_overlap=0, token_length=lambda ts: [2 * len(t) for t in ts])
+    chunks = splitter.split_text(TEXT)
+    assert all(2 * len(c) <= 60 for c in chunks)
+    assert squeeze("".join(chunks)) == squeeze(TEXT)
+
+
+def test_from_embeddings_without_tokenizer_counts_chars(embeddings):
+    splitter = ChineseTextSplitter.from_embeddings(embeddings, chunk_size=60, chunk_overlap=10)
+    docs = splitter.split_documents([Document(page_content=TEXT, metadata={"source": "a.pdf", "page": 3})])
+    assert all(len(d.page_content) <= 60 and d.metadata == {"source": "a.pdf", "page": 3} for d in docs)